@@ -1,4 +1,5 @@
 """Wildlife.ai dataloader functions."""
+import io
 import pathlib
 from typing import Callable
 
@@ -6,9 +7,11 @@ import ai8x  # pylint: disable=import-error
 import pandas as pd
 from PIL import Image
 from sklearn.preprocessing import LabelEncoder
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
 from torchvision import transforms
 
+from wai_data_tools.utils import shard_export, tensor_export
+
 # Set this to the path where your data files are stored.
 DATASET_DIR = "/PATH/TO/DATASET"
 
@@ -44,11 +47,73 @@ class WildlifeDataset(Dataset):
         return len(self.dataframe)
 
 
+class WildlifeShardDataset(IterableDataset):
+    """Dataset streaming wildlife.ai images from the shards written by export-dataset --export-format shards.
+
+    Each DataLoader worker reads its own share of the shards sequentially, instead of opening one image file per item.
+    """
+
+    def __init__(self, dataset_dir: pathlib.Path, train: bool, transform: Callable) -> None:
+        """Initialise object."""
+        self.dataset_dir = dataset_dir
+        self.split = "train" if train else "test"
+        self.shuffle = train
+        self.transform = transform
+        self.n_samples = len(shard_export.ShardReader(dataset_dir, split=self.split))
+
+    def __iter__(self):
+        """Iterate over the images and labels of the shards of this worker."""
+        worker_info = get_worker_info()
+        reader = shard_export.ShardReader(
+            self.dataset_dir,
+            split=self.split,
+            shuffle=self.shuffle,
+            rank=0 if worker_info is None else worker_info.id,
+            world_size=1 if worker_info is None else worker_info.num_workers,
+        )
+        for sample in reader.iter_samples():
+            with Image.open(io.BytesIO(sample["jpg"])) as image:
+                input_image = self.transform(image)
+            yield input_image, int(sample["cls"])
+
+    def __len__(self):
+        """Get size of dataset."""
+        return self.n_samples
+
+
+class WildlifeTensorDataset(Dataset):
+    """Dataset indexing wildlife.ai images in the memory mapped array written by export-dataset --export-format tensors.
+
+    Frames are already resized and decoded, so getting an item only reads a few bytes from the page cache.
+    """
+
+    def __init__(self, dataset_dir: pathlib.Path, train: bool, transform: Callable) -> None:
+        """Initialise object."""
+        self.frames, self.labels = tensor_export.load_split(dataset_dir, split="train" if train else "test")
+        self.transform = transform
+
+    def __getitem__(self, item):
+        """Get item."""
+        input_image = self.transform(Image.fromarray(self.frames[item]))
+        return input_image, int(self.labels[item])
+
+    def __len__(self):
+        """Get size of dataset."""
+        return len(self.labels)
+
+
 def get_wildlifeai_dataset(data, load_train=True, load_test=True):
     """Get dataset."""
     (data_dir, args) = data
 
     data_dir = pathlib.Path(DATASET_DIR)
+    # Read tensors or stream from shards if the data was exported with --export-format tensors or shards
+    if (data_dir / tensor_export.INDEX_FILENAME).is_file():
+        dataset_cls = WildlifeTensorDataset
+    elif (data_dir / shard_export.INDEX_FILENAME).is_file():
+        dataset_cls = WildlifeShardDataset
+    else:
+        dataset_cls = WildlifeDataset
 
     if load_train:
         train_transform = transforms.Compose(
@@ -60,7 +125,7 @@ def get_wildlifeai_dataset(data, load_train=True, load_test=True):
             ]
         )
 
-        train_dataset = WildlifeDataset(dataset_dir=data_dir, train=True, transform=train_transform)
+        train_dataset = dataset_cls(dataset_dir=data_dir, train=True, transform=train_transform)
     else:
         train_dataset = None
 
@@ -73,7 +138,7 @@ def get_wildlifeai_dataset(data, load_train=True, load_test=True):
             ]  # pylint: disable=undefined-variable
         )
 
-        test_dataset = WildlifeDataset(dataset_dir=data_dir, train=False, transform=test_transform)
+        test_dataset = dataset_cls(dataset_dir=data_dir, train=False, transform=test_transform)
 
         if args.truncate_testset:
             test_dataset.data = test_dataset.data[:1]  # pylint: disable=attribute-defined-outside-init
@@ -1,21 +1,64 @@
 """Script for constructing a image dataset by splitting the raw video files into frame images."""
+import contextlib
+import functools
 import logging
+import os
 import pathlib
-import shutil
-from typing import List, Optional
+import tempfile
+from typing import AbstractSet, Any, Dict, List, Optional, Sequence, Tuple
 
-import cv2
 import fiftyone as fo
+import numpy as np
 import pandas as pd
 import tqdm
-from fiftyone.utils.video import reencode_videos, transform_videos
 
-from wai_data_tools.utils import config_utils, data, read_excel, video_filtering
+from wai_data_tools.utils import (
+    annotation_jobs,
+    annotation_sampling,
+    camtrap_dp,
+    config_utils,
+    data,
+    export_manifest,
+    file_transfer,
+    filter_cache,
+    frame_export,
+    frame_source,
+    label_classes,
+    label_timeline,
+    media_index,
+    read_excel,
+    shard_export,
+    tensor_export,
+    transcoding,
+    video_filtering,
+)
 
 EI_EXPORT_FORMAT = "edge_impulse"
-
-
-def filter_empty_videos(src: pathlib.Path, dest: pathlib.Path, dry_run: bool, threshold: int = 50) -> None:
+SHARDS_EXPORT_FORMAT = "shards"
+TENSORS_EXPORT_FORMAT = "tensors"
+
+# Value of stratify_by in the data_split config that stratifies the split on the first label of each video
+SPLIT_BY_LABEL = "label"
+
+# Number of ingested videos added to a dataset at a time
+INGEST_BATCH_SIZE = 100
+
+# Frame level field that annotation jobs upload and load their detections in
+ANNOTATION_LABEL_FIELD = "frames.detections"
+
+
+def filter_empty_videos(
+    src: pathlib.Path,
+    dest: pathlib.Path,
+    dry_run: bool,
+    threshold: int = 50,
+    workers: int = 1,
+    settings: Optional[video_filtering.DifferenceSettings] = None,
+    report_recall: bool = False,
+    cache_path: Optional[pathlib.Path] = None,
+    prune_cache: bool = False,
+    transfer_mode: str = file_transfer.COPY,
+) -> None:
     """Copy all non-empty videos to a folder specified by the user.
 
     Args:
@@ -23,51 +66,198 @@ def filter_empty_videos(src: pathlib.Path, dest: pathlib.Path, dry_run: bool, th
         dest: Path, where to dump the files
         dry_run: boolean
         threshold: int, difference threshold for deciding if video is empty or not
+        workers: int, number of processes used to decode and classify the videos
+        settings: DifferenceSettings, how frames are sampled, prepared and compared, defaults to every frame
+        report_recall: boolean, also compare every frame and log how many non-empty videos the settings found.
+                       With move, videos are only moved once the recall is calculated.
+        cache_path: Path, optional SQLite file to cache results in so unchanged videos are not decoded again.
+                    The cache and its journal files are not processed as videos when they are in src.
+        prune_cache: boolean, remove cache entries for missing or changed files and for other detector settings
+        transfer_mode: str, how non-empty videos are put in dest, one of file_transfer.TRANSFER_MODES.
+                       Links fall back to copying when src and dest are on different filesystems.
     """
     logger = logging.getLogger(__name__)
     dest.mkdir(parents=True, exist_ok=True)
 
-    for src_file in src.iterdir():
-        logger.info("Processing file %s ...", src_file.name)
-        is_empty = video_filtering.video_process_content(src_file, threshold=threshold)
-        if not is_empty:
-            dest_file = dest / src_file.name
-            logger.info("Moving %s to %s", src_file, dest_file)
-            if not dry_run:
-                shutil.copy(src_file, dest_file)
+    excluded_files = set() if cache_path is None else {path.resolve() for path in filter_cache.cache_files(cache_path)}
+    src_files = sorted(
+        src_file for src_file in src.iterdir() if src_file.is_file() and src_file.resolve() not in excluded_files
+    )
+    with contextlib.ExitStack() as stack:
+        if cache_path is not None:
+            cache = stack.enter_context(filter_cache.FilterResultCache(cache_path))
+            if prune_cache:
+                n_pruned = cache.prune(detector_key=video_filtering.detector_key(threshold, settings))
+                logger.info("Pruned %s stale entries from cache %s", n_pruned, cache_path)
+            results = filter_cache.process_videos_motion_cached(
+                src_files, cache=cache, threshold=threshold, workers=workers, settings=settings
+            )
+        else:
+            results = video_filtering.process_videos_motion(
+                src_files, threshold=threshold, workers=workers, settings=settings
+            )
+
+        report_recall = report_recall and settings is not None
+        # Moved videos can not be checked again for the recall, so they are only moved once it is calculated
+        defer_transfers = report_recall and transfer_mode == file_transfer.MOVE and not dry_run
+        sampled_empty = []
+        deferred_files = []
+        for src_file, score in results:
+            logger.info("Processed file %s with motion score %s", src_file.name, score)
+            is_empty = None if score is None else score == 0
+            sampled_empty.append(is_empty)
+            if is_empty is None:
+                logger.warning("Skipping %s since it could not be processed", src_file)
+            elif not is_empty and defer_transfers:
+                deferred_files.append(src_file)
+            elif not is_empty:
+                _transfer_video(src_file, dest, transfer_mode=transfer_mode, dry_run=dry_run)
+
+    if report_recall:
+        recall = video_filtering.calculate_sampling_recall(
+            src_files, settings=settings, threshold=threshold, workers=workers, sampled_empty=sampled_empty
+        )
+        logger.info("Recall of non-empty videos compared to checking every frame: %.3f", recall)
+    for src_file in deferred_files:
+        _transfer_video(src_file, dest, transfer_mode=transfer_mode, dry_run=dry_run)
+
+
+def _transfer_video(src_file: pathlib.Path, dest: pathlib.Path, transfer_mode: str, dry_run: bool) -> None:
+    """Put a non-empty video in dest with a transfer mode, falling back to copying if the mode is not supported.
+
+    Args:
+        src_file: Video to transfer
+        dest: Folder to put the video in
+        transfer_mode: How the video is put in dest, one of file_transfer.TRANSFER_MODES
+        dry_run: Only log the transfer
+    """
+    logger = logging.getLogger(__name__)
+
+    dest_file = dest / src_file.name
+    logger.info("Transferring %s to %s with mode %s", src_file, dest_file, transfer_mode)
+    if not dry_run:
+        used_mode = file_transfer.transfer_file(src_file, dest_file, mode=transfer_mode)
+        if used_mode != transfer_mode:
+            logger.info("Could not %s %s, used %s instead", transfer_mode, src_file, used_mode)
 
 
 def create_dataset(
-    dataset_name: str, data_dir: pathlib.Path, label_info_path: Optional[pathlib.Path] = None
+    dataset_name: str,
+    data_dir: Optional[pathlib.Path],
+    label_info_path: Optional[pathlib.Path] = None,
+    transcode_workers: Optional[int] = None,
+    output_dir: Optional[pathlib.Path] = None,
+    media_index_path: Optional[pathlib.Path] = media_index.DEFAULT_INDEX_PATH,
+    camtrap_dp_path: Optional[pathlib.Path] = None,
+    camtrap_chunk_size: int = camtrap_dp.DEFAULT_CHUNK_SIZE,
+    label_sheets: Optional[Sequence[str]] = None,
+    label_cache: bool = True,
+    frame_labels: bool = False,
 ) -> fo.Dataset:
-    """Reads video files and label info into a fiftyone dataset."""
+    """Ingest the videos in data_dir into a new or resumed fiftyone dataset with labels from Excel or Camtrap DP."""
     logger = logging.getLogger(__name__)
 
-    logger.info("Creating a dataset with name %s from content in %s", dataset_name, data_dir)
+    if label_info_path and camtrap_dp_path:
+        raise ValueError("Labels can be read from either label_info_path or camtrap_dp_path, not both")
+    if data_dir is None:
+        if camtrap_dp_path is None:
+            raise ValueError("data_dir is required unless labels are read from a Camtrap DP data package")
+        data_dir = camtrap_dp_path if camtrap_dp_path.is_dir() else camtrap_dp_path.parent
 
-    logger.info("Renaming files to .mpeg...")
-    for mjpg_file in data_dir.glob("*.mjpg"):
-        new_name = mjpg_file.parent / f"{mjpg_file.stem}.mpeg"
-        mjpg_file.rename(new_name)
-
-    logger.info("Reencoding videos to .mp4...")
-    dataset = fo.Dataset.from_dir(dataset_dir=data_dir, dataset_type=fo.types.VideoDirectory, name=dataset_name)
-    reencode_videos(dataset, force_reencode=False)
-    dataset.compute_metadata()
-
-    logger.info("Removing .mpeg files...")
-    for mpeg_file in data_dir.glob("*.mpeg"):
-        mpeg_file.unlink()
-
-    if label_info_path:
-        logger.info("Adding classifications...")
-        content = read_excel.read_excel_to_dataframe(excel_filepath=label_info_path)
-        df_labels = read_excel.stack_rows_from_dataframe_dictionary(dataframe_dict=content)
-        dataset = _add_classifications(dataset=dataset, df_labels=df_labels)
-    dataset.persistent = True
+    logger.info("Creating a dataset with name %s from content in %s", dataset_name, data_dir)
+    if fo.dataset_exists(dataset_name):
+        dataset = fo.load_dataset(dataset_name)
+        logger.info("Resuming ingest into existing dataset with %s samples", len(dataset))
+    else:
+        dataset = fo.Dataset(dataset_name)
+        dataset.persistent = True
+    ingested_paths = set(dataset.values("filepath"))
+
+    jobs = [
+        job
+        for job in transcoding.ingest_jobs(transcoding.list_videos(data_dir), data_dir=data_dir, output_dir=output_dir)
+        if str(job.dst_path) not in ingested_paths
+    ]
+    with contextlib.ExitStack() as stack:
+        index = None if media_index_path is None else stack.enter_context(media_index.MediaIndex(media_index_path))
+        failed_videos = _ingest_videos(dataset=dataset, jobs=jobs, index=index, transcode_workers=transcode_workers)
+
+        if label_info_path:
+            logger.info("Adding classifications...")
+            df_labels = read_excel.read_label_table(label_info_path, sheet_names=label_sheets, use_cache=label_cache)
+            dataset = _add_classifications(dataset=dataset, df_labels=df_labels, index=index, frame_labels=frame_labels)
+        elif camtrap_dp_path:
+            logger.info("Adding classifications from Camtrap DP data package...")
+            dataset = _add_camtrap_dp_labels(
+                dataset=dataset,
+                package_path=camtrap_dp_path,
+                chunk_size=camtrap_chunk_size,
+                index=index,
+                frame_labels=frame_labels,
+            )
+    if failed_videos:
+        raise RuntimeError(f"Failed to ingest {len(failed_videos)} videos, run again to retry them")
     return dataset
 
 
+def _ingest_videos(
+    dataset: fo.Dataset,
+    jobs: List[transcoding.TranscodeJob],
+    index: Optional[media_index.MediaIndex],
+    transcode_workers: Optional[int] = None,
+) -> List[pathlib.Path]:
+    """Add the outputs of ingest jobs to a dataset in batches and return the sources of the videos that failed."""
+    logger = logging.getLogger(__name__)
+
+    indexed = [_indexed_output_metadata(job, index) for job in jobs]
+    pending_jobs = [job for job, metadata in zip(jobs, indexed) if metadata is None]
+    logger.info("Ingesting %s videos, %s of them need to be probed...", len(jobs), len(pending_jobs))
+    new_results = transcoding.ingest_videos(pending_jobs, workers=transcode_workers)
+
+    samples = []
+    new_entries = []
+    failed_videos = []
+    for job, metadata in tqdm.tqdm(zip(jobs, indexed), total=len(jobs)):
+        if metadata is None:
+            _, metadata = next(new_results)
+            if metadata is None:
+                failed_videos.append(job.src_path)
+                continue
+            new_entries.append((job.dst_path, metadata))
+        samples.append(fo.Sample(filepath=str(job.dst_path), metadata=fo.VideoMetadata(**metadata)))
+        if len(samples) >= INGEST_BATCH_SIZE:
+            dataset.add_samples(samples)
+            samples = []
+            if index is not None:
+                index.put_many(new_entries)
+            new_entries = []
+    if samples:
+        dataset.add_samples(samples)
+    if index is not None and new_entries:
+        index.put_many(new_entries)
+    return failed_videos
+
+
+def _indexed_output_metadata(
+    job: transcoding.TranscodeJob, index: Optional[media_index.MediaIndex]
+) -> Optional[Dict[str, Any]]:
+    """Get the indexed metadata of the output of an ingest job, if the output is ready to be added as it is.
+
+    Args:
+        job: Ingest job from transcoding.ingest_jobs
+        index: Media index, or None to not use an index
+
+    Returns:
+        Metadata of the output, or None if it has to be transcoded or probed
+    """
+    if index is None:
+        return None
+    metadata = index.get(job.dst_path)
+    if metadata is None or (job.src_path != job.dst_path and not transcoding.is_up_to_date(job, metadata)):
+        return None
+    return metadata
+
+
 def show_dataset(dataset_name: str) -> None:
     """Get dataset from database."""
     logger = logging.getLogger(__name__)
@@ -91,19 +281,44 @@ def export_dataset(
     export_location: pathlib.Path,
     export_format: str = EI_EXPORT_FORMAT,
     config_filepath: Optional[pathlib.Path] = None,
+    workers: int = 1,
+    writer_threads: int = 4,
+    jpeg_quality: int = frame_export.DEFAULT_JPEG_QUALITY,
+    incremental: bool = False,
+    samples_per_shard: int = shard_export.DEFAULT_SAMPLES_PER_SHARD,
+    decode_backend: str = frame_source.DEFAULT_BACKEND,
 ) -> None:
-    """Export a dataset."""
+    """Export a dataset, with incremental skipping the samples already exported with the same settings."""
     logger = logging.getLogger(__name__)
     logger.info("Exporting dataset %s to format %s to %s ...", dataset_name, export_format, export_location)
     dataset: fo.Dataset = fo.load_dataset(dataset_name)
+    if export_format not in (EI_EXPORT_FORMAT, SHARDS_EXPORT_FORMAT, TENSORS_EXPORT_FORMAT):
+        _export_to_fiftyone_format(dataset, export_location=export_location, incremental=incremental)
+        return
+
+    config = config_utils.load_config(config_filepath=config_filepath)
+    jobs = _frame_export_jobs(dataset, config)
+    settings = frame_export.FrameExportSettings.from_config(config, jpeg_quality=jpeg_quality, backend=decode_backend)
+    export_location.mkdir(parents=True, exist_ok=True)
     if export_format == EI_EXPORT_FORMAT:
-        _export_to_edge_impulse_format(dataset, export_location=export_location, config_filepath=config_filepath)
+        _export_to_edge_impulse_format(
+            jobs,
+            export_location=export_location,
+            settings=settings,
+            workers=workers,
+            writer_threads=writer_threads,
+            incremental=incremental,
+        )
     else:
-        dataset.export(
-            export_dir=str(export_location),
-            dataset_type=fo.types.FiftyOneVideoLabelsDataset,
-            export_media=True,
-            label_field="frames.ground_truth",
+        _export_to_training_format(
+            jobs,
+            export_location=export_location,
+            export_format=export_format,
+            settings=settings,
+            workers=workers,
+            writer_threads=writer_threads,
+            incremental=incremental,
+            samples_per_shard=samples_per_shard,
         )
 
 
@@ -114,107 +329,640 @@ def delete_dataset(dataset_name: str) -> None:
 
 
 def create_annotation_job(
-    dataset_name: str, anno_key: str, subset: Optional[int] = None, classes: Optional[List[str]] = None
+    dataset_name: str,
+    anno_key: str,
+    subset: Optional[int] = None,
+    classes: Optional[List[str]] = None,
+    refresh_classes: bool = False,
+    chunk_size: Optional[int] = None,
+    workers: int = 1,
+    sampling: str = annotation_sampling.RANDOM_SAMPLING,
 ):
-    """Create annotation job in CVAT."""
+    """Create annotation job in CVAT, optionally on a smart sampled subset split into resumable chunks."""
     logger = logging.getLogger(__name__)
     logger.info("Creating annotation job for dataset %s with annotation key %s", dataset_name, anno_key)
     dataset: fo.Dataset = fo.load_dataset(dataset_name)
-    if subset:
+    chunks = annotation_jobs.load_chunks(dataset.info, anno_key)
+    view = dataset
+    if chunks is not None:
+        logger.info("Resuming chunked annotation job %s", anno_key)
+    elif subset and sampling == annotation_sampling.SMART_SAMPLING:
+        logger.info("Selecting subset of %s samples from dataset...", subset)
+        view = _select_annotation_subset(dataset, subset, workers=workers)
+    elif subset:
         logger.info("Taking subset of %s samples from dataset...", subset)
-        dataset = dataset.take(subset)
+        view = dataset.take(subset)
     if classes is None:
-        class_set = set()
-        for sample in dataset:
-            for frame_ind in sample.frames:
-                ground_truth = sample.frames[frame_ind].ground_truth
-                if ground_truth is not None:
-                    class_set.add(ground_truth.label)
-        classes = list(class_set)
+        classes = label_classes.discover_classes(
+            view,
+            label_field=label_timeline.label_field(dataset),
+            use_cache=view is dataset,
+            refresh=refresh_classes,
+        )
     logger.info("found classes %s", classes)
+    annotate_kwargs = {"label_field": ANNOTATION_LABEL_FIELD, "label_type": "detections", "classes": classes}
+
+    if chunks is None and not chunk_size:
+        view.annotate(anno_key=anno_key, **annotate_kwargs)
+        return
+
+    if chunks is None:
+        chunks = annotation_jobs.plan_chunks(anno_key, view.values("id"), chunk_size)
+        annotation_jobs.store_chunks(dataset.info, anno_key, chunks)
+        dataset.save()
+
+    existing_runs = set(dataset.list_annotation_runs())
+    pending_chunks = [chunk for chunk in chunks if not chunk.uploaded]
+    for chunk in pending_chunks:
+        if chunk.key in existing_runs:
+            logger.warning("Removing incomplete annotation run %s before uploading it again", chunk.key)
+            dataset.delete_annotation_run(chunk.key)
+    logger.info("Uploading %s of %s annotation chunks...", len(pending_chunks), len(chunks))
+
+    task = functools.partial(_annotate_chunk, dataset_name, annotate_kwargs)
+    failed_chunks = [
+        chunk.key
+        for chunk, error in tqdm.tqdm(
+            annotation_jobs.run_chunks(pending_chunks, task, workers=workers), total=len(pending_chunks)
+        )
+        if error is not None
+    ]
+    dataset.reload()
+    uploaded_runs = set(dataset.list_annotation_runs())
+    for chunk in pending_chunks:
+        chunk.uploaded = chunk.key not in failed_chunks and chunk.key in uploaded_runs
+    annotation_jobs.store_chunks(dataset.info, anno_key, chunks)
+    dataset.save()
+
+    n_missing = sum(not chunk.uploaded for chunk in chunks)
+    if n_missing:
+        logger.error("%s annotation chunks were not uploaded, run the job again to resume it", n_missing)
+
+
+def _select_annotation_subset(dataset: fo.Dataset, subset: int, workers: int = 1) -> fo.DatasetView:
+    """Select a subset of samples to annotate with smart sampling, measuring the samples that have no features yet."""
+    logger = logging.getLogger(__name__)
+    for field_name, field_type in (
+        (annotation_sampling.MOTION_SCORE_FIELD, fo.IntField),
+        (annotation_sampling.KEYFRAME_HASH_FIELD, fo.StringField),
+    ):
+        if not dataset.has_sample_field(field_name):
+            dataset.add_sample_field(field_name, field_type)
+
+    unmeasured = dataset.exists(annotation_sampling.MOTION_SCORE_FIELD, False)
+    sample_ids, filepaths = unmeasured.values(["id", "filepath"])
+    if sample_ids:
+        logger.info("Measuring motion and keyframes of %s samples...", len(sample_ids))
+        motion_scores, keyframe_hashes = {}, {}
+        features = annotation_sampling.process_videos_features(
+            [pathlib.Path(filepath) for filepath in filepaths], workers=workers
+        )
+        for sample_id, (_, motion_score, keyframe_hash) in zip(sample_ids, tqdm.tqdm(features, total=len(sample_ids))):
+            motion_scores[sample_id] = motion_score
+            keyframe_hashes[sample_id] = keyframe_hash
+        dataset.set_values(annotation_sampling.MOTION_SCORE_FIELD, motion_scores, key_field="id")
+        dataset.set_values(annotation_sampling.KEYFRAME_HASH_FIELD, keyframe_hashes, key_field="id")
+
+    sample_ids, motion_scores, keyframe_hashes = dataset.values(
+        ["id", annotation_sampling.MOTION_SCORE_FIELD, annotation_sampling.KEYFRAME_HASH_FIELD]
+    )
+    labels = label_timeline.first_labels(dataset)
+    selected_inds = annotation_sampling.select_samples(labels, motion_scores, keyframe_hashes, n_samples=subset)
+    return dataset.select([sample_ids[ind] for ind in selected_inds], ordered=True)
 
-    dataset.annotate(anno_key=anno_key, label_field="frames.detections", label_type="detections", classes=classes)
 
+def _annotate_chunk(dataset_name: str, annotate_kwargs: dict, chunk: annotation_jobs.AnnotationChunk) -> None:
+    """Upload the samples of an annotation chunk as its own annotation run."""
+    dataset = fo.load_dataset(dataset_name)
+    dataset.select(chunk.sample_ids, ordered=True).annotate(anno_key=chunk.key, **annotate_kwargs)
 
-def read_annotations(dataset_name: str, anno_key: str, cleanup: Optional[bool] = False):
-    """Read annotations from CVAT."""
+
+def read_annotations(dataset_name: str, anno_key: str, cleanup: Optional[bool] = False, workers: int = 1):
+    """Read annotations from CVAT, loading only the chunks of a chunked job that were not loaded yet."""
     logger = logging.getLogger(__name__)
     logger.info("Reading annotations from CVAT for dataset %s with annotaiton key %s", dataset_name, anno_key)
     dataset: fo.Dataset = fo.load_dataset(dataset_name)
-    dataset.load_annotations(anno_key, cleanup=cleanup)
+    chunks = annotation_jobs.load_chunks(dataset.info, anno_key)
+    if chunks is None:
+        dataset.load_annotations(anno_key, cleanup=cleanup)
+        _bump_annotated_field_versions(dataset)
+        return
+
+    pending_chunks = [chunk for chunk in chunks if chunk.uploaded and not chunk.loaded]
+    logger.info("Loading %s of %s annotation chunks...", len(pending_chunks), len(chunks))
+    task = functools.partial(_load_chunk_annotations, dataset_name, bool(cleanup))
+    for chunk, error in tqdm.tqdm(
+        annotation_jobs.run_chunks(pending_chunks, task, workers=workers), total=len(pending_chunks)
+    ):
+        chunk.loaded = error is None
+    dataset.reload()
+    annotation_jobs.store_chunks(dataset.info, anno_key, chunks)
+    dataset.save()
+    _bump_annotated_field_versions(dataset)
+
+    n_missing = sum(not chunk.loaded for chunk in chunks)
+    if n_missing:
+        logger.error("%s annotation chunks were not loaded, read the annotations again to resume", n_missing)
+
+
+def _bump_annotated_field_versions(dataset: fo.Dataset) -> None:
+    """Mark the label fields annotations are loaded into as changed, so their classes are discovered again."""
+    for label_field in dict.fromkeys([label_timeline.label_field(dataset), ANNOTATION_LABEL_FIELD]):
+        label_classes.bump_label_field_version(dataset, label_field)
+
+
+def _load_chunk_annotations(dataset_name: str, cleanup: bool, chunk: annotation_jobs.AnnotationChunk) -> None:
+    """Load the annotations of an annotation chunk into the dataset."""
+    dataset = fo.load_dataset(dataset_name)
+    dataset.load_annotations(chunk.key, cleanup=cleanup)
 
 
-def preprocess_dataset(dataset_name: str, config_filepath: pathlib.Path) -> None:
-    """Preprocess dataset to specified fps and size."""
+def preprocess_dataset(
+    dataset_name: str,
+    config_filepath: pathlib.Path,
+    transcode_workers: Optional[int] = None,
+    media_index_path: Optional[pathlib.Path] = media_index.DEFAULT_INDEX_PATH,
+) -> None:
+    """Preprocess dataset to specified fps and size, skipping videos that already have the target."""
     logger = logging.getLogger(__name__)
     logger.info("Preprocessing dataset %s ...", dataset_name)
     config = config_utils.load_config(config_filepath=config_filepath)
     dataset = fo.load_dataset(dataset_name)
     processing_config = config["transformations"]
-    transform_videos(dataset, fps=processing_config["fps"], size=processing_config["size"])
+    size = processing_config.get("size")
+    sample_ids, filepaths = dataset.values(["id", "filepath"])
+    jobs = [
+        transcoding.TranscodeJob(
+            src_path=pathlib.Path(filepath),
+            dst_path=pathlib.Path(filepath),
+            fps=processing_config.get("fps"),
+            size=None if size is None else (int(size[0]), int(size[1])),
+        )
+        for filepath in filepaths
+    ]
+    with contextlib.ExitStack() as stack:
+        index = None if media_index_path is None else stack.enter_context(media_index.MediaIndex(media_index_path))
+        pending = [
+            (sample_id, job) for sample_id, job in zip(sample_ids, jobs) if not _is_indexed_up_to_date(job, index)
+        ]
+        transcoded_ids = []
+        probed = []
+        n_failed = 0
+        pending_jobs = [job for _, job in pending]
+        for (sample_id, _), (job, status) in zip(
+            pending,
+            tqdm.tqdm(transcoding.transcode_videos(pending_jobs, workers=transcode_workers), total=len(pending)),
+        ):
+            if status == transcoding.TRANSCODED:
+                transcoded_ids.append(sample_id)
+            if status is not None:
+                probed.append((sample_id, job.dst_path))
+            n_failed += status is None
+        n_skipped = len(jobs) - len(transcoded_ids) - n_failed
+        logger.info("Transcoded %s videos, %s were already preprocessed", len(transcoded_ids), n_skipped)
+
+        # Reading the metadata of skipped videos as well fills the index, so the next run does not probe them
+        transcoded = set(transcoded_ids)
+        new_metadata = {
+            sample_id: fo.VideoMetadata(**metadata)
+            for (sample_id, _), (_, metadata) in zip(
+                probed, media_index.probe_videos([filepath for _, filepath in probed], index=index)
+            )
+            if sample_id in transcoded and metadata is not None
+        }
+    if new_metadata:
+        dataset.set_values("metadata", new_metadata, key_field="id")
+    if n_failed:
+        logger.error("Failed to preprocess %s videos, run again to retry them", n_failed)
+
+
+def _is_indexed_up_to_date(job: transcoding.TranscodeJob, index: Optional[media_index.MediaIndex]) -> bool:
+    """Check if a transcoding job does not need to run from the indexed metadata of its output, without probing it.
+
+    Args:
+        job: Transcoding job
+        index: Media index, or None to not use an index
+
+    Returns:
+        True if the output is indexed and up to date, False if it has to be probed or transcoded
+    """
+    if index is None:
+        return False
+    metadata = index.get(job.dst_path)
+    return metadata is not None and transcoding.is_up_to_date(job, metadata)
 
 
-def _add_classifications(dataset: fo.Dataset, df_labels: pd.DataFrame) -> fo.Dataset:
-    """Adds classification labels to dataset."""
+def _add_classifications(
+    dataset: fo.Dataset,
+    df_labels: pd.DataFrame,
+    index: Optional[media_index.MediaIndex] = None,
+    frame_labels: bool = False,
+) -> fo.Dataset:
+    """Adds classification labels to dataset, matching samples to label rows on the video name."""
     logger = logging.getLogger(__name__)
-    df_labels["video_name"] = df_labels.apply(lambda row: row.filename.split(".")[0], axis=1)
-    for sample in dataset:
-        logger.info("Adding classifications for video %s", sample.filepath)
-        frame_rate = sample.metadata.frame_rate
-        video_name = sample.filepath.split("/")[-1].split(".")[0]
 
-        sample_row = df_labels[df_labels["video_name"] == video_name].iloc[0]
+    df_labels = df_labels.assign(video_name=df_labels["filename"].astype(str).str.split(".").str[0])
+    df_labels = df_labels.drop_duplicates(subset="video_name", keep="first")
 
-        label = sample_row.label
-        if label == "nothing":
-            continue
-        label_frame_numbers = data.calculate_frames_in_timespan(
-            t_start=sample_row.start, t_end=sample_row.end, fps=frame_rate
+    sample_ids, filepaths, frame_rates = dataset.values(["id", "filepath", "metadata.frame_rate"])
+    df_samples = pd.DataFrame({"sample_id": sample_ids, "filepath": filepaths, "frame_rate": frame_rates})
+    df_samples["video_name"] = df_samples["filepath"].str.split("/").str[-1].str.split(".").str[0]
+
+    df_samples = df_samples.merge(df_labels[["video_name", "label", "start", "end"]], on="video_name", how="left")
+    for filepath in df_samples.loc[df_samples["label"].isna(), "filepath"]:
+        logger.warning("No label found for video %s", filepath)
+    df_samples = df_samples[df_samples["label"].notna() & (df_samples["label"] != "nothing")]
+    df_samples = _fill_missing_frame_rates(dataset=dataset, df_samples=df_samples, index=index)
+    for filepath in df_samples.loc[df_samples["frame_rate"].isna(), "filepath"]:
+        logger.warning("No frame rate found for video %s, compute metadata to label it", filepath)
+    df_samples = df_samples[df_samples["frame_rate"].notna()].reset_index(drop=True)
+
+    frame_start, frame_end = data.calculate_frame_ranges(
+        t_start=df_samples["start"].to_numpy(), t_end=df_samples["end"].to_numpy(), fps=df_samples["frame_rate"]
+    )
+    n_frames = _write_labels(
+        dataset=dataset,
+        span_sample_ids=df_samples["sample_id"].to_numpy(),
+        frame_start=frame_start,
+        frame_end=frame_end,
+        labels=df_samples["label"].to_numpy(),
+        frame_labels=frame_labels,
+    )
+    logger.info("Added classifications to %s frames in %s videos", n_frames, len(df_samples))
+    return dataset
+
+
+def _write_labels(
+    dataset: fo.Dataset,
+    span_sample_ids: np.ndarray,
+    frame_start: np.ndarray,
+    frame_end: np.ndarray,
+    labels: np.ndarray,
+    earlier_ids: AbstractSet[str] = frozenset(),
+    frame_labels: bool = False,
+) -> int:
+    """Write labelled frame ranges as spans of each sample, and with frame_labels also as a label on each frame.
+
+    Args:
+        dataset: Dataset with the samples
+        span_sample_ids: Sample ID of each range
+        frame_start: Frame index each range starts at, as returned by data.calculate_frame_ranges
+        frame_end: Frame index each range ends before, empty ranges are skipped
+        labels: Label of each range
+        earlier_ids: IDs of samples whose stored labels are kept, so a sample can be labelled in several batches
+        frame_labels: Also store a classification for each label of each frame
+
+    Returns:
+        Number of labelled frames
+    """
+    keep = frame_end > frame_start
+    span_sample_ids, labels = span_sample_ids[keep], labels[keep]
+    frame_start, frame_end = frame_start[keep], frame_end[keep]
+
+    spans: Dict[str, Dict[tuple, None]] = {}
+    for sample_id, first, last, label in zip(span_sample_ids, (frame_start + 1).tolist(), frame_end.tolist(), labels):
+        spans.setdefault(sample_id, {})[(first, last, label)] = None
+    earlier_span_ids = [sample_id for sample_id in spans if sample_id in earlier_ids]
+    if earlier_span_ids:
+        for sample_id, supports, span_labels in zip(
+            *dataset.select(earlier_span_ids).values(
+                [
+                    "id",
+                    f"{label_timeline.SPANS_FIELD}.detections.support",
+                    f"{label_timeline.SPANS_FIELD}.detections.label",
+                ]
+            )
+        ):
+            earlier_spans = [(first, last, label) for (first, last), label in zip(supports or [], span_labels or [])]
+            spans[sample_id] = dict.fromkeys([*earlier_spans, *spans[sample_id]])
+    if spans:
+        dataset.set_values(
+            label_timeline.SPANS_FIELD,
+            {
+                sample_id: label_timeline.to_temporal_detections(list(sample_spans))
+                for sample_id, sample_spans in spans.items()
+            },
+            key_field="id",
         )
-        label_frame_numbers += 1
-        for frame_number in label_frame_numbers:
-            sample[int(frame_number)]["ground_truth"] = fo.Classifications(
-                classifications=[fo.Classification(label=label)]
+        label_classes.bump_label_field_version(dataset, label_timeline.SPANS_FIELD)
+
+    row_inds, frame_inds = data.expand_frame_ranges(frame_start=frame_start, frame_end=frame_end)
+    if not frame_labels or frame_inds.size == 0:
+        return len(frame_inds)
+
+    labels_per_frame: Dict[str, Dict[int, Dict[str, None]]] = {}
+    for sample_id, label, frame_number in zip(span_sample_ids[row_inds], labels[row_inds], (frame_inds + 1).tolist()):
+        labels_per_frame.setdefault(sample_id, {}).setdefault(frame_number, {})[label] = None
+    earlier_frame_ids = [sample_id for sample_id in labels_per_frame if sample_id in earlier_ids]
+    if earlier_frame_ids:
+        for sample_id, frame_numbers, earlier_labels in zip(
+            *dataset.select(earlier_frame_ids).values(
+                ["id", "frames.frame_number", f"{label_timeline.FRAMES_FIELD}.classifications.label"]
             )
-        sample.save()
+        ):
+            for frame_number, frame_earlier_labels in zip(frame_numbers, earlier_labels):
+                if frame_earlier_labels and frame_number in labels_per_frame[sample_id]:
+                    labels_per_frame[sample_id][frame_number] = dict.fromkeys(
+                        [*frame_earlier_labels, *labels_per_frame[sample_id][frame_number]]
+                    )
+    dataset.set_values(
+        label_timeline.FRAMES_FIELD,
+        {
+            sample_id: {
+                frame_number: fo.Classifications(classifications=[fo.Classification(label=label) for label in labels])
+                for frame_number, labels in sample_frames.items()
+            }
+            for sample_id, sample_frames in labels_per_frame.items()
+        },
+        key_field="id",
+    )
+    label_classes.bump_label_field_version(dataset, label_timeline.FRAMES_FIELD)
+    return len(frame_inds)
+
+
+def _fill_missing_frame_rates(
+    dataset: fo.Dataset, df_samples: pd.DataFrame, index: Optional[media_index.MediaIndex]
+) -> pd.DataFrame:
+    """Fill in the frame rate of samples without metadata from the media index or by probing them."""
+    missing = df_samples["frame_rate"].isna()
+    if index is None or not missing.any():
+        return df_samples
+    df_missing = df_samples[missing]
+    new_metadata = {
+        sample_id: fo.VideoMetadata(**metadata)
+        for sample_id, (_, metadata) in zip(
+            df_missing["sample_id"],
+            media_index.probe_videos([pathlib.Path(filepath) for filepath in df_missing["filepath"]], index=index),
+        )
+        if metadata is not None
+    }
+    if not new_metadata:
+        return df_samples
+    dataset.set_values("metadata", new_metadata, key_field="id")
+    df_samples = df_samples.copy()
+    df_samples.loc[missing, "frame_rate"] = [
+        new_metadata[sample_id].frame_rate if sample_id in new_metadata else None
+        for sample_id in df_missing["sample_id"]
+    ]
+    return df_samples
+
+
+def _add_camtrap_dp_labels(
+    dataset: fo.Dataset,
+    package_path: pathlib.Path,
+    chunk_size: int = camtrap_dp.DEFAULT_CHUNK_SIZE,
+    index: Optional[media_index.MediaIndex] = None,
+    frame_labels: bool = False,
+) -> fo.Dataset:
+    """Adds the media level observations of a Camtrap DP data package as labelled spans."""
+    logger = logging.getLogger(__name__)
+
+    sample_ids, filepaths, frame_rates, frame_counts = dataset.values(
+        ["id", "filepath", "metadata.frame_rate", "metadata.total_frame_count"]
+    )
+    df_samples = pd.DataFrame(
+        {"sample_id": sample_ids, "filepath": filepaths, "frame_rate": frame_rates, "total_frame_count": frame_counts}
+    )
+    df_samples["video_name"] = df_samples["filepath"].str.split("/").str[-1].str.split(".").str[0]
+
+    df_media = camtrap_dp.read_media(package_path).drop_duplicates(subset="video_name", keep="first")
+    n_media = len(df_media)
+    df_media = df_media.merge(df_samples, on="video_name", how="inner")
+    logger.info("Matched %s of %s media in the data package to samples", len(df_media), n_media)
+    if df_media.empty:
+        return dataset
+
+    media_ids = df_media["sample_id"].tolist()
+    for field, column in (("camtrap_media_id", "mediaID"), ("camtrap_deployment_id", "deploymentID")):
+        values = df_media[column].astype(object).where(df_media[column].notna(), None)
+        dataset.set_values(field, dict(zip(media_ids, values)), key_field="id")
+    has_location = df_media["latitude"].notna() & df_media["longitude"].notna()
+    dataset.set_values(
+        "location",
+        {
+            sample_id: fo.GeoLocation(point=[longitude, latitude])
+            for sample_id, longitude, latitude in zip(
+                df_media.loc[has_location, "sample_id"],
+                df_media.loc[has_location, "longitude"],
+                df_media.loc[has_location, "latitude"],
+            )
+        },
+        key_field="id",
+    )
+
+    df_media = _fill_missing_frame_rates(dataset=dataset, df_samples=df_media, index=index)
+    for filepath in df_media.loc[df_media["frame_rate"].isna(), "filepath"]:
+        logger.warning("No frame rate found for video %s, compute metadata to label it", filepath)
+    df_media = df_media[df_media["frame_rate"].notna()]
+
+    labelled_ids = set()
+    n_frames = 0
+    for df_observations in camtrap_dp.read_observations(
+        package_path,
+        df_media[["mediaID", "timestamp", "sample_id", "frame_rate", "total_frame_count"]],
+        chunk_size=chunk_size,
+    ):
+        frame_start, frame_end = data.calculate_frame_ranges(
+            t_start=df_observations["start"].to_numpy(),
+            t_end=df_observations["end"].to_numpy(),
+            fps=df_observations["frame_rate"].to_numpy(),
+        )
+        frame_end = pd.Series(frame_end).clip(upper=df_observations["total_frame_count"].to_numpy(dtype=float))
+        n_frames += _write_labels(
+            dataset=dataset,
+            span_sample_ids=df_observations["sample_id"].to_numpy(),
+            frame_start=frame_start,
+            frame_end=frame_end.to_numpy(dtype=np.int64),
+            labels=df_observations["label"].to_numpy(dtype=object),
+            earlier_ids=labelled_ids,
+            frame_labels=frame_labels,
+        )
+        labelled_ids.update(df_observations.loc[frame_end.to_numpy() > frame_start, "sample_id"])
+
+    logger.info("Added classifications to %s frames in %s videos", n_frames, len(labelled_ids))
     return dataset
 
 
+def _collect_frame_labels(dataset: fo.Dataset) -> Tuple[List[str], List[Dict[int, str]]]:
+    """Get the label of each labelled frame of each sample, expanding spans only here where frames are exported."""
+    field = label_timeline.label_field(dataset)
+    if field == label_timeline.SPANS_FIELD:
+        sample_ids, filepaths = dataset.values(["id", "filepath"])
+        timeline = label_timeline.LabelTimeline.from_collection(dataset, field=field)
+        return filepaths, [timeline.expand(sample_id) for sample_id in sample_ids]
+    filepaths, frame_numbers, ground_truths = dataset.values(["filepath", "frames.frame_number", field])
+    return filepaths, [
+        {
+            frame_number: frame_export.label_to_name(ground_truth)
+            for frame_number, ground_truth in zip(sample_frame_numbers or [], sample_ground_truths or [])
+        }
+        for sample_frame_numbers, sample_ground_truths in zip(frame_numbers, ground_truths)
+    ]
+
+
+def _frame_export_jobs(dataset: fo.Dataset, config: Dict[str, Any]) -> List[frame_export.VideoExportJob]:
+    """Split the videos of a dataset into train and test and collect what is needed to export their frames."""
+    logger = logging.getLogger(__name__)
+
+    logger.info("splitting dataset...")
+    split_config = config["data_split"]
+    # Sample fields to split by, such as camtrap_deployment_id to keep each camera deployment in one split
+    split_fields = {key: split_config.get(key) for key in ("group_by", "stratify_by")}
+    split_values = {
+        key: label_timeline.first_labels(dataset) if field == SPLIT_BY_LABEL else dataset.values(field)
+        for key, field in split_fields.items()
+        if field
+    }
+    is_test = data.calc_test_split_mask(
+        n_files=len(dataset),
+        test_split_size=split_config["test_size"],
+        seed=split_config.get("seed", 0),
+        groups=split_values.get("group_by"),
+        strata=split_values.get("stratify_by"),
+    )
+
+    logger.info("collecting frame labels...")
+    filepaths, frame_labels = _collect_frame_labels(dataset)
+    return [
+        frame_export.VideoExportJob(
+            filepath=filepath,
+            video_name=pathlib.Path(filepath).name.split(".")[0],
+            split="test" if is_test[video_ind] else "train",
+            frame_labels=sample_frame_labels,
+        )
+        for video_ind, (filepath, sample_frame_labels) in enumerate(zip(filepaths, frame_labels))
+    ]
+
+
 def _export_to_edge_impulse_format(
-    dataset: fo.Dataset, export_location: pathlib.Path, config_filepath: pathlib.Path
+    jobs: List[frame_export.VideoExportJob],
+    export_location: pathlib.Path,
+    settings: frame_export.FrameExportSettings,
+    workers: int = 1,
+    writer_threads: int = 4,
+    incremental: bool = False,
 ) -> None:
-    """Export dataset to edge impulse upload format."""
+    """Export the frames of videos to edge impulse upload format."""
     logger = logging.getLogger(__name__)
 
-    export_location.mkdir(parents=True, exist_ok=True)
-    config = config_utils.load_config(config_filepath=config_filepath)
-    logger.info("splitting dataset...")
-    test_file_inds = data.calc_test_split_indices(
-        n_files=len(dataset), test_split_size=config["data_split"]["test_size"]
+    manifest = export_manifest.ExportManifest(export_location, reset=not incremental)
+    logger.info("exporting frames at %s fps and size %s...", settings.fps or "original", settings.size or "original")
+    fingerprint_settings = dict(settings.fingerprint(), format=EI_EXPORT_FORMAT)
+    fingerprints = {job.filepath: frame_export.job_fingerprint(job, fingerprint_settings) for job in jobs}
+    pending_jobs = []
+    for job in jobs:
+        if manifest.is_up_to_date(job.filepath, fingerprints[job.filepath]):
+            continue
+        previous_record = manifest.get(job.filepath)
+        if previous_record is not None:
+            frame_export.remove_exported_frames(export_location, **previous_record["outputs"])
+        pending_jobs.append(job)
+    logger.info("Exporting %s videos, %s are already up to date", len(pending_jobs), len(jobs) - len(pending_jobs))
+
+    results = frame_export.export_videos(
+        pending_jobs,
+        export_location=export_location,
+        workers=workers,
+        writer_threads=writer_threads,
+        settings=settings,
     )
+    for job, n_frames in tqdm.tqdm(results, total=len(pending_jobs)):
+        logger.debug("Exported frames up to frame %s from %s", n_frames, job.filepath)
+        if n_frames is not None:
+            manifest.record(job.filepath, fingerprints[job.filepath], outputs=frame_export.job_outputs(job, n_frames))
 
-    for video_ind, video_sample in tqdm.tqdm(enumerate(dataset)):
-        split_dir = "test" if video_ind in test_file_inds else "train"
 
-        video = cv2.VideoCapture(video_sample.filepath)  # pylint: disable=no-member
+def _export_to_training_format(
+    jobs: List[frame_export.VideoExportJob],
+    export_location: pathlib.Path,
+    export_format: str,
+    settings: frame_export.FrameExportSettings,
+    workers: int = 1,
+    writer_threads: int = 4,
+    incremental: bool = False,
+    samples_per_shard: int = shard_export.DEFAULT_SAMPLES_PER_SHARD,
+) -> None:
+    """Export the frames of videos to tar shards or memory mappable arrays, to be read fast in training."""
+    logger = logging.getLogger(__name__)
 
-        success = True
-        frame_ind = 0
-        while success:
-            success, frame = video.read()
-            if success:
-                frame_ind += 1
-            else:
-                break
+    if export_format == SHARDS_EXPORT_FORMAT:
+        fingerprint_settings = dict(settings.fingerprint(), samples_per_shard=samples_per_shard)
+        read_index = shard_export.read_index
+    else:
+        fingerprint_settings = {key: value for key, value in settings.fingerprint().items() if key != "jpeg_quality"}
+        read_index = tensor_export.read_index
+    fingerprint_settings["format"] = export_format
+    fingerprint = export_manifest.labels_fingerprint(
+        [frame_export.job_fingerprint(job, fingerprint_settings) for job in jobs]
+    )
+    previous_index = read_index(export_location)
+    if incremental and previous_index is not None and previous_index.get("fingerprint") == fingerprint:
+        logger.info("Export in %s is up to date", export_location)
+        return
+
+    logger.info("exporting frames at %s fps and size %s...", settings.fps or "original", settings.size or "original")
+    if export_format == SHARDS_EXPORT_FORMAT:
+        shard_export.export_shards(
+            jobs,
+            export_location=export_location,
+            workers=workers,
+            writer_threads=writer_threads,
+            settings=settings,
+            samples_per_shard=samples_per_shard,
+            fingerprint=fingerprint,
+        )
+    else:
+        tensor_export.export_tensors(
+            jobs, export_location=export_location, settings=settings, workers=workers, fingerprint=fingerprint
+        )
 
-            dst_dir = export_location / split_dir
-            dst_dir.mkdir(exist_ok=True)
 
-            if video_sample[frame_ind].ground_truth:
-                target_name = video_sample[frame_ind].ground_truth.label
-            else:
-                target_name = "nothing"
+def _export_to_fiftyone_format(
+    dataset: fo.Dataset, export_location: pathlib.Path, incremental: bool = False, chunk_size: int = 100
+) -> None:
+    """Export dataset with media to FiftyOne video labels format, in chunks that are recorded in a manifest."""
+    logger = logging.getLogger(__name__)
 
-            frame_filename = f"{target_name}.{video_sample.filename.split('.')[0]}___{frame_ind}.jpg"
-            dst_path = dst_dir / frame_filename
-            cv2.imwrite(str(dst_path), frame)  # pylint: disable=no-member
+    export_location.mkdir(parents=True, exist_ok=True)
+    manifest = export_manifest.ExportManifest(export_location, reset=not incremental)
+    if not incremental:
+        (export_location / export_manifest.FIFTYONE_MANIFEST_FILENAME).unlink(missing_ok=True)
+    field = label_timeline.label_field(dataset)
+    sample_ids, filepaths, ground_truths = dataset.values(["id", "filepath", field])
+    if field == label_timeline.SPANS_FIELD:
+        ground_truths = [[label] for label in ground_truths]
+    fingerprints = {
+        sample_id: {
+            "source": export_manifest.source_fingerprint(pathlib.Path(filepath)),
+            "labels": export_manifest.labels_fingerprint(
+                [None if label is None else label.to_dict() for label in sample_ground_truths or []]
+            ),
+        }
+        for sample_id, filepath, sample_ground_truths in zip(sample_ids, filepaths, ground_truths)
+    }
+    pending_ids = [
+        sample_id for sample_id in sample_ids if not manifest.is_up_to_date(sample_id, fingerprints[sample_id])
+    ]
+    logger.info("Exporting %s samples, %s are already up to date", len(pending_ids), len(sample_ids) - len(pending_ids))
+    # Media are exported to their path relative to the folder of all samples, so clips with the same name in
+    # different folders do not overwrite each other when chunks are merged
+    rel_dir = os.path.commonpath([os.path.dirname(filepath) for filepath in filepaths]) if filepaths else None
+
+    for chunk_start in tqdm.tqdm(range(0, len(pending_ids), chunk_size)):
+        chunk_ids = pending_ids[chunk_start : chunk_start + chunk_size]
+        with tempfile.TemporaryDirectory(dir=export_location, prefix=".staging_") as tmp_dir:
+            staging_dir = pathlib.Path(tmp_dir) / "export"
+            dataset.select(chunk_ids, ordered=True).export(
+                export_dir=str(staging_dir),
+                dataset_type=fo.types.FiftyOneVideoLabelsDataset,
+                export_media=True,
+                rel_dir=rel_dir,
+                label_field=field,
+            )
+            previous_records = [manifest.get(sample_id) for sample_id in chunk_ids]
+            replaced_records = [
+                record["outputs"] for record in previous_records if record is not None and "data" in record["outputs"]
+            ]
+            records = export_manifest.merge_fiftyone_export(staging_dir, export_location, replaced_records)
+        for sample_id, record in zip(chunk_ids, records):
+            manifest.record(sample_id, fingerprints[sample_id], outputs=record)
@@ -0,0 +1,556 @@
+"""This module measures the throughput and peak memory of filtering, labelling and exporting on synthetic clips.
+
+Results are written as JSON, so runs on different commits can be compared with compare_results.
+"""
+import concurrent.futures
+import contextlib
+import dataclasses
+import datetime
+import functools
+import importlib.util
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import platform
+import shutil
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from wai_data_tools.defaults import default_config
+from wai_data_tools.utils import (
+    data,
+    frame_export,
+    frame_source,
+    read_excel,
+    video_filtering,
+)
+
+RESULTS_VERSION = 1
+CLIP_FPS = 15
+CONTAINERS = {"avi": "MJPG", "mp4": "mp4v"}
+DEFAULT_RESOLUTIONS = ((320, 240), (1280, 720))
+DEFAULT_N_FRAMES = (150,)
+DEFAULT_CONTAINERS = tuple(CONTAINERS)
+DEFAULT_N_SHEETS = 50
+DEFAULT_ROWS_PER_SHEET = 2000
+DEFAULT_N_SAMPLES = 500
+
+
+@dataclasses.dataclass(frozen=True)
+class BenchmarkCase:
+    """One benchmark run with fixed parameters.
+
+    Attributes:
+        benchmark: Name of the benchmark in BENCHMARKS
+        params: Parameters of the benchmark, stored with the results to match cases across runs
+    """
+
+    benchmark: str
+    params: Dict[str, Any]
+
+    @property
+    def name(self) -> str:
+        """Name of the case with its parameters, e.g. stack_rows[n_sheets=50,rows_per_sheet=2000].
+
+        Returns:
+            Name of case
+        """
+        params = ",".join(f"{key}={value}" for key, value in self.params.items())
+        return f"{self.benchmark}[{params}]"
+
+
+def clip_path(clips_dir: pathlib.Path, width: int, height: int, n_frames: int, container: str, motion: bool) -> str:
+    """Get the path of a synthetic clip.
+
+    Args:
+        clips_dir: Folder with the synthetic clips
+        width: Width of the clip
+        height: Height of the clip
+        n_frames: Number of frames in the clip
+        container: File extension of the clip, one of CONTAINERS
+        motion: If blobs move through the clip
+
+    Returns:
+        Path to the clip
+    """
+    kind = "motion" if motion else "static"
+    return str(clips_dir / f"{kind}_{width}x{height}_{n_frames}.{container}")
+
+
+def generate_clip(
+    dst_path: pathlib.Path,
+    width: int,
+    height: int,
+    n_frames: int,
+    motion: bool = True,
+    fps: float = CLIP_FPS,
+    seed: int = 0,
+) -> pathlib.Path:
+    """Write a synthetic camera trap clip of a static textured scene, with blobs moving through its second half.
+
+    The codec is picked from the file extension in CONTAINERS. The scene is the same for the same size and seed.
+
+    Args:
+        dst_path: Path to write the clip to
+        width: Width of the clip
+        height: Height of the clip
+        n_frames: Number of frames in the clip
+        motion: If False the scene stays static, so the clip is empty
+        fps: Frame rate of the clip
+        seed: Seed of the random scene
+
+    Returns:
+        Path to the clip
+
+    Raises:
+        RuntimeError: If the clip could not be written
+    """
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(noise, (0, 0), sigmaX=3)  # pylint: disable=no-member
+    fourcc = cv2.VideoWriter_fourcc(*CONTAINERS[dst_path.suffix[1:]])  # pylint: disable=no-member
+    writer = cv2.VideoWriter(str(dst_path), fourcc, fps, (width, height))  # pylint: disable=no-member
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not write clip {dst_path}")
+    radius = max(min(width, height) // 12, 2)
+    motion_start = n_frames // 2
+    try:
+        for frame_ind in range(n_frames):
+            frame = background.copy()
+            if motion and frame_ind >= motion_start:
+                progress = (frame_ind - motion_start) / max(n_frames - motion_start, 1)
+                for blob_ind in range(2):
+                    center = (int(progress * width), height * (blob_ind + 1) // 3)
+                    cv2.circle(frame, center, radius, (30, 30, 30), thickness=-1)  # pylint: disable=no-member
+            writer.write(frame)
+    finally:
+        writer.release()
+    return dst_path
+
+
+@contextlib.contextmanager
+def _video_process_content_case(
+    _workdir: pathlib.Path, clips_dir: pathlib.Path, params: Dict[str, Any]
+) -> Iterator[Tuple[Callable[[], Any], int]]:
+    """Check a clip for motion, decoding frames until the first motion is found.
+
+    Args:
+        _workdir: Temporary folder of the case, unused
+        clips_dir: Folder with the synthetic clips
+        params: Clip parameters and decode backend
+
+    Yields:
+        Function running the benchmark once and the number of frames it decodes
+    """
+    src_file = pathlib.Path(
+        clip_path(
+            clips_dir, params["width"], params["height"], params["n_frames"], params["container"], params["motion"]
+        )
+    )
+    settings = video_filtering.DifferenceSettings(backend=params["backend"])
+    # Motion starts halfway, and is found when comparing its first frame with the frame before
+    n_frames = params["n_frames"] // 2 + 1 if params["motion"] else params["n_frames"]
+    yield functools.partial(video_filtering.video_process_content, src_file, threshold=50, settings=settings), n_frames
+
+
+@contextlib.contextmanager
+def _stack_rows_case(
+    _workdir: pathlib.Path, _clips_dir: pathlib.Path, params: Dict[str, Any]
+) -> Iterator[Tuple[Callable[[], Any], int]]:
+    """Stack the rows of many label sheets into one dataframe.
+
+    Args:
+        _workdir: Temporary folder of the case, unused
+        _clips_dir: Folder with the synthetic clips, unused
+        params: Number of sheets and rows in each sheet
+
+    Yields:
+        Function running the benchmark once and the number of rows it stacks
+    """
+    rng = np.random.default_rng(0)
+    n_rows = params["rows_per_sheet"]
+    sheets = {
+        f"sheet{sheet_ind:03d}": pd.DataFrame(
+            {
+                "filename": [f"MOV{sheet_ind:03d}{row_ind:05d}.AVI" for row_ind in range(n_rows)],
+                "label": rng.choice(["rat", "weta", "millipede", "nothing"], size=n_rows),
+                "start": rng.uniform(0, 5, size=n_rows),
+                "end": rng.uniform(5, 10, size=n_rows),
+            }
+        )
+        for sheet_ind in range(params["n_sheets"])
+    }
+    yield functools.partial(read_excel.stack_rows_from_dataframe_dictionary, sheets), params["n_sheets"] * n_rows
+
+
+@contextlib.contextmanager
+def _add_classifications_case(
+    _workdir: pathlib.Path, _clips_dir: pathlib.Path, params: Dict[str, Any]
+) -> Iterator[Tuple[Callable[[], Any], int]]:
+    """Label the frames of a temporary FiftyOne dataset from a label sheet.
+
+    Args:
+        _workdir: Temporary folder of the case, unused
+        _clips_dir: Folder with the synthetic clips, unused
+        params: Number of samples in the dataset
+
+    Yields:
+        Function running the benchmark once and the number of frames it labels
+    """
+    # Imported here so processes running the other benchmarks do not load FiftyOne
+    import fiftyone as fo  # pylint: disable=import-outside-toplevel
+
+    from wai_data_tools import actions  # pylint: disable=import-outside-toplevel
+
+    rng = np.random.default_rng(0)
+    n_samples = params["n_samples"]
+    video_names = [f"MOV{sample_ind:05d}" for sample_ind in range(n_samples)]
+    df_labels = pd.DataFrame(
+        {
+            "filename": [f"{video_name}.AVI" for video_name in video_names],
+            "label": rng.choice(["rat", "weta", "millipede"], size=n_samples),
+            "start": rng.uniform(0, 5, size=n_samples),
+            "end": rng.uniform(5, 10, size=n_samples),
+        }
+    )
+    frame_start, frame_end = data.calculate_frame_ranges(
+        df_labels["start"].to_numpy(), df_labels["end"].to_numpy(), np.full(n_samples, CLIP_FPS)
+    )
+    dataset = fo.Dataset()
+    try:
+        dataset.add_samples(
+            [
+                fo.Sample(
+                    filepath=f"/benchmark/{video_name}.mp4",
+                    metadata=fo.VideoMetadata(frame_rate=CLIP_FPS, total_frame_count=10 * CLIP_FPS),
+                )
+                for video_name in video_names
+            ]
+        )
+        run = functools.partial(actions._add_classifications, dataset, df_labels)  # pylint: disable=protected-access
+        yield run, int((frame_end - frame_start).sum())
+    finally:
+        dataset.delete()
+
+
+@contextlib.contextmanager
+def _edge_impulse_export_case(
+    workdir: pathlib.Path, clips_dir: pathlib.Path, params: Dict[str, Any]
+) -> Iterator[Tuple[Callable[[], Any], int]]:
+    """Export a static and a moving clip to the Edge Impulse format with the transformations of the default config.
+
+    Args:
+        workdir: Temporary folder of the case to export to
+        clips_dir: Folder with the synthetic clips
+        params: Clip parameters and decode backend
+
+    Yields:
+        Function running the benchmark once and the number of source frames it exports
+    """
+    from wai_data_tools import actions  # pylint: disable=import-outside-toplevel
+
+    n_frames = params["n_frames"]
+    jobs = [
+        frame_export.VideoExportJob(
+            filepath=clip_path(clips_dir, params["width"], params["height"], n_frames, params["container"], motion),
+            video_name="motion" if motion else "static",
+            split="train",
+            frame_labels=dict.fromkeys(range(n_frames // 2 + 1, n_frames + 1), "rat") if motion else {},
+        )
+        for motion in (False, True)
+    ]
+    settings = frame_export.FrameExportSettings.from_config(default_config.config, backend=params["backend"])
+    export_location = workdir / "export"
+    export_location.mkdir()
+    run = functools.partial(
+        actions._export_to_edge_impulse_format, jobs, export_location, settings  # pylint: disable=protected-access
+    )
+    yield run, len(jobs) * n_frames
+
+
+# Benchmarks by name, with the unit of the items they count. Each benchmark is a context manager preparing the
+# data of a case and yielding a function that runs the case once together with the number of items it handles.
+BENCHMARKS: Dict[str, Tuple[Callable, str]] = {
+    "video_process_content": (_video_process_content_case, "frames"),
+    "stack_rows_from_dataframe_dictionary": (_stack_rows_case, "rows"),
+    "add_classifications": (_add_classifications_case, "frames"),
+    "edge_impulse_export": (_edge_impulse_export_case, "frames"),
+}
+
+
+def build_cases(
+    benchmarks: Optional[Sequence[str]] = None,
+    resolutions: Sequence[Tuple[int, int]] = DEFAULT_RESOLUTIONS,
+    n_frames: Sequence[int] = DEFAULT_N_FRAMES,
+    containers: Sequence[str] = DEFAULT_CONTAINERS,
+    backends: Optional[Sequence[str]] = None,
+) -> List[BenchmarkCase]:
+    """Build the cases of the benchmarks for every combination of clip and decode backend.
+
+    Args:
+        benchmarks: Names of the benchmarks to run, defaults to all of BENCHMARKS
+        resolutions: Sizes of the synthetic clips as (width, height)
+        n_frames: Lengths of the synthetic clips in frames
+        containers: File extensions of the synthetic clips, each with its own codec in CONTAINERS
+        backends: Decode backends to compare, defaults to the ones available on this machine
+
+    Returns:
+        Benchmark cases
+    """
+    if benchmarks is None:
+        benchmarks = list(BENCHMARKS)
+    if backends is None:
+        backends = frame_source.available_backends()
+    clips = [
+        {"width": width, "height": height, "n_frames": length, "container": container}
+        for (width, height), length, container in itertools.product(resolutions, n_frames, containers)
+    ]
+    cases = []
+    for benchmark in benchmarks:
+        if benchmark == "video_process_content":
+            cases.extend(
+                BenchmarkCase(benchmark, dict(clip, motion=motion, backend=backend))
+                for clip, motion, backend in itertools.product(clips, (False, True), backends)
+            )
+        elif benchmark == "edge_impulse_export":
+            cases.extend(
+                BenchmarkCase(benchmark, dict(clip, backend=backend))
+                for clip, backend in itertools.product(clips, backends)
+            )
+        elif benchmark == "stack_rows_from_dataframe_dictionary":
+            cases.append(
+                BenchmarkCase(benchmark, {"n_sheets": DEFAULT_N_SHEETS, "rows_per_sheet": DEFAULT_ROWS_PER_SHEET})
+            )
+        else:
+            cases.append(BenchmarkCase(benchmark, {"n_samples": DEFAULT_N_SAMPLES}))
+    return cases
+
+
+def generate_clips(cases: List[BenchmarkCase], clips_dir: pathlib.Path) -> None:
+    """Write the synthetic clips the cases need, skipping clips that already exist.
+
+    Args:
+        cases: Benchmark cases
+        clips_dir: Folder to write the clips to
+    """
+    clips_dir.mkdir(parents=True, exist_ok=True)
+    for case in cases:
+        if "container" not in case.params:
+            continue
+        for motion in (False, True):
+            params = {key: case.params[key] for key in ("width", "height", "n_frames", "container")}
+            dst_path = pathlib.Path(clip_path(clips_dir, motion=motion, **params))
+            if not dst_path.exists():
+                generate_clip(dst_path, params["width"], params["height"], params["n_frames"], motion=motion)
+
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """Get the peak resident memory of the current process or of its largest child process.
+
+    Args:
+        children: Get the peak of the largest finished child process instead, e.g. an ffmpeg decoder
+
+    Returns:
+        Peak resident memory in MiB, or None on platforms without the resource module such as Windows
+    """
+    if importlib.util.find_spec("resource") is None:
+        return None
+    import resource  # pylint: disable=import-outside-toplevel
+
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return max_rss / 1024**2 if sys.platform == "darwin" else max_rss / 1024
+
+
+def measure_case(case: BenchmarkCase, clips_dir: pathlib.Path, repeats: int = 3) -> Dict[str, Any]:
+    """Run a benchmark case several times and measure its throughput and peak memory.
+
+    Args:
+        case: Benchmark case
+        clips_dir: Folder with the synthetic clips
+        repeats: Number of times to run the case, the fastest run is used for the throughput
+
+    Returns:
+        Measurements of the case
+    """
+    setup, unit = BENCHMARKS[case.benchmark]
+    with contextlib.ExitStack() as stack:
+        workdir = pathlib.Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        run, n_items = stack.enter_context(setup(workdir, clips_dir, case.params))
+        setup_rss = peak_rss_mb()
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    seconds = min(times)
+    return {
+        "unit": unit,
+        "items": n_items,
+        "seconds": seconds,
+        "times": times,
+        "items_per_second": n_items / seconds if seconds > 0 else None,
+        "setup_peak_rss_mb": setup_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "children_peak_rss_mb": peak_rss_mb(children=True),
+    }
+
+
+def _safe_measure_case(
+    case: BenchmarkCase, clips_dir: pathlib.Path, repeats: int
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Run measure_case and return any error as a message instead of raising it.
+
+    Args:
+        case: Benchmark case
+        clips_dir: Folder with the synthetic clips
+        repeats: Number of times to run the case
+
+    Returns:
+        Tuple with the result of measure_case, or None if it failed, and the error message if any
+    """
+    try:
+        return measure_case(case, clips_dir, repeats), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def run_benchmarks(
+    cases: List[BenchmarkCase], clips_dir: pathlib.Path, repeats: int = 3, isolate: bool = True
+) -> Iterator[Dict[str, Any]]:
+    """Run benchmark cases one after the other.
+
+    With isolate, each case runs in a fresh process, so its peak memory is not raised by earlier cases. The
+    peak memory after preparing a case, including the modules the process imported, is kept as setup_peak_rss_mb.
+    A case that fails is logged and yielded with its error instead of stopping the run.
+
+    Args:
+        cases: Benchmark cases, their clips must already be generated in clips_dir
+        clips_dir: Folder with the synthetic clips
+        repeats: Number of times to run each case
+        isolate: Run each case in its own process
+
+    Yields:
+        Result of each case with its name, parameters and measurements
+    """
+    logger = logging.getLogger(__name__)
+
+    for case in cases:
+        if isolate:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                try:
+                    measurements, error = executor.submit(_safe_measure_case, case, clips_dir, repeats).result()
+                except concurrent.futures.process.BrokenProcessPool as err:
+                    measurements, error = None, f"{type(err).__name__}: {err}"
+        else:
+            measurements, error = _safe_measure_case(case, clips_dir, repeats)
+        if error is not None:
+            logger.error("Benchmark %s failed: %s", case.name, error)
+        yield {
+            "name": case.name,
+            "benchmark": case.benchmark,
+            "params": case.params,
+            **(measurements or {}),
+            "error": error,
+        }
+
+
+def _git_commit() -> Optional[str]:
+    """Get the commit of the checked out source, if it is in a git repository.
+
+    Returns:
+        Hash of the commit, or None if it can not be found
+    """
+    git = shutil.which("git")
+    if git is None:
+        return None
+    try:
+        # Fixed argument list with the resolved git executable, run without a shell
+        process = subprocess.run(  # nosec B603
+            [git, "rev-parse", "HEAD"], cwd=pathlib.Path(__file__).parent, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return process.stdout.strip()
+
+
+def write_results(results: List[Dict[str, Any]], dst_path: pathlib.Path) -> Dict[str, Any]:
+    """Write benchmark results as JSON together with a description of the machine and commit they were run on.
+
+    Args:
+        results: Results of run_benchmarks
+        dst_path: JSON file to write to
+
+    Returns:
+        Written content
+    """
+    content = {
+        "version": RESULTS_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,  # pylint: disable=no-member
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "results": results,
+    }
+    tmp_path = dst_path.with_name(f"{dst_path.name}.tmp")
+    tmp_path.write_text(json.dumps(content, indent=4), encoding="utf-8")
+    os.replace(tmp_path, dst_path)
+    return content
+
+
+def read_results(src_path: pathlib.Path) -> Dict[str, Any]:
+    """Read benchmark results written by write_results.
+
+    Args:
+        src_path: JSON file with results
+
+    Returns:
+        Content of the file
+    """
+    return json.loads(src_path.read_text(encoding="utf-8"))
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Compare the throughput of the cases that succeeded in both of two runs.
+
+    Args:
+        baseline: Content of an earlier results file
+        current: Content of a later results file
+
+    Returns:
+        For each case, its name, throughput in both runs and their ratio, below 1 if the case got slower
+    """
+    baseline_results = {result["name"]: result for result in baseline["results"] if result.get("items_per_second")}
+    comparison = []
+    for result in current["results"]:
+        earlier = baseline_results.get(result["name"])
+        if earlier is None or not result.get("items_per_second"):
+            continue
+        comparison.append(
+            {
+                "name": result["name"],
+                "baseline": earlier["items_per_second"],
+                "current": result["items_per_second"],
+                "ratio": result["items_per_second"] / earlier["items_per_second"],
+            }
+        )
+    return comparison
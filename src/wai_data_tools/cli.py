@@ -1,13 +1,24 @@
 """CLI Group implementation."""
 import pathlib
-from typing import Optional
+import tempfile
+from typing import Optional, Tuple
 
 import click
 import yaml
 
-from wai_data_tools import actions
+from wai_data_tools import actions, benchmarks
 from wai_data_tools.defaults import default_config
-from wai_data_tools.utils import setup_logging
+from wai_data_tools.utils import (
+    annotation_sampling,
+    camtrap_dp,
+    file_transfer,
+    frame_export,
+    frame_source,
+    media_index,
+    setup_logging,
+    shard_export,
+    video_filtering,
+)
 
 
 @click.group()
@@ -22,27 +33,184 @@ def cli(logging_dir: Optional[pathlib.Path], logging_config: Optional[pathlib.Pa
 @click.option("--src", default=".", type=click.Path(exists=True, path_type=pathlib.Path))
 @click.option("--dest", default="empty_videos", type=click.Path(path_type=pathlib.Path))
 @click.option("--dry-run", is_flag=True)
-def filter_empty(src: pathlib.Path, dest: pathlib.Path, dry_run: bool) -> None:
+@click.option("--workers", default=1, type=click.IntRange(min=1), show_default=True)
+@click.option("--threshold", default=50, type=int, show_default=True)
+@click.option("--grayscale", is_flag=True)
+@click.option("--downscale", default=1, type=click.IntRange(min=1), show_default=True)
+@click.option("--roi", nargs=4, type=int, default=None, help="Region of interest as X Y WIDTH HEIGHT in pixels.")
+@click.option("--batch-size", default=1, type=click.IntRange(min=1), show_default=True)
+@click.option("--frame-stride", default=1, type=click.IntRange(min=1), show_default=True)
+@click.option("--sample-fps", default=None, type=click.FloatRange(min=0, min_open=True))
+@click.option(
+    "--decode-backend",
+    type=click.Choice(list(frame_source.BACKENDS)),
+    default=frame_source.DEFAULT_BACKEND,
+    show_default=True,
+    help="Library decoding the videos. pyav needs PyAV installed and ffmpeg an ffmpeg executable on the PATH.",
+)
+@click.option("--report-recall", is_flag=True, help="Compare the result to checking every frame.")
+@click.option(
+    "--cache-path",
+    type=click.Path(path_type=pathlib.Path, dir_okay=False),
+    default=None,
+    help="SQLite file to cache results in, so unchanged videos are skipped on reruns.",
+)
+@click.option("--prune-cache", is_flag=True, help="Remove stale entries from the cache before filtering.")
+@click.option(
+    "--transfer-mode",
+    type=click.Choice(file_transfer.TRANSFER_MODES),
+    default=file_transfer.COPY,
+    show_default=True,
+    help="How non-empty videos are put in dest. Links fall back to copying across filesystems.",
+)
+def filter_empty(
+    src: pathlib.Path,
+    dest: pathlib.Path,
+    dry_run: bool,
+    workers: int,
+    threshold: int,
+    grayscale: bool,
+    downscale: int,
+    roi: Optional[Tuple[int, int, int, int]],
+    batch_size: int,
+    frame_stride: int,
+    sample_fps: Optional[float],
+    decode_backend: str,
+    report_recall: bool,
+    cache_path: Optional[pathlib.Path],
+    prune_cache: bool,
+    transfer_mode: str,
+) -> None:
     """Copy all non-empty videos to a folder specified by the user.
 
     Args:
         src: Path that must already exist with the videos to process
         dest: Path, where to dump the files
         dry_run: boolean
+        workers: Number of processes used to decode and classify the videos
+        threshold: Difference threshold for deciding if video is empty or not
+        grayscale: Compare frames in grayscale
+        downscale: Factor to shrink frames by before comparing them
+        roi: Region of interest to compare, everything outside it is ignored
+        batch_size: Number of frames scored together
+        frame_stride: Only every frame_stride-th frame is decoded and compared
+        sample_fps: Frame rate to sample videos at, overrides frame_stride
+        decode_backend: Library decoding the videos
+        report_recall: Log how many of the non-empty videos found when checking every frame were found
+        cache_path: SQLite file to cache results in
+        prune_cache: Remove stale entries from the cache before filtering
+        transfer_mode: How non-empty videos are put in dest
     """
     click.echo("Filtering empty videos...")
-    actions.filter_empty_videos(src=src, dest=dest, dry_run=dry_run)
+    settings = video_filtering.DifferenceSettings(
+        grayscale=grayscale,
+        downscale=downscale,
+        roi=roi or None,
+        batch_size=batch_size,
+        frame_stride=frame_stride,
+        sample_fps=sample_fps,
+        backend=decode_backend,
+    )
+    actions.filter_empty_videos(
+        src=src,
+        dest=dest,
+        dry_run=dry_run,
+        threshold=threshold,
+        workers=workers,
+        settings=settings,
+        report_recall=report_recall,
+        cache_path=cache_path,
+        prune_cache=prune_cache,
+        transfer_mode=transfer_mode,
+    )
     click.echo("Empty videos removed!")
 
 
 @cli.command()
 @click.option("--dataset-name", type=str)
-@click.option("--data-dir", type=click.Path(path_type=pathlib.Path))
+@click.option(
+    "--data-dir",
+    type=click.Path(path_type=pathlib.Path),
+    default=None,
+    help="Folder with the videos. Defaults to the folder of the Camtrap DP data package if one is given.",
+)
 @click.option("--label-info-path", type=click.Path(path_type=pathlib.Path), default=None)
-def create_dataset(dataset_name: str, data_dir: pathlib.Path, label_info_path: Optional[pathlib.Path]) -> None:
+@click.option(
+    "--label-sheet",
+    "label_sheets",
+    multiple=True,
+    help="Sheet of the label workbook to read, can be given several times. Defaults to all sheets.",
+)
+@click.option("--no-label-cache", is_flag=True, help="Parse the label workbook without using its cached table.")
+@click.option(
+    "--frame-labels",
+    is_flag=True,
+    help="Also store a label on every labelled frame, besides the labelled spans of each video.",
+)
+@click.option(
+    "--camtrap-dp",
+    "camtrap_dp_path",
+    type=click.Path(path_type=pathlib.Path, exists=True),
+    default=None,
+    help="Camtrap DP data package folder or datapackage.json to read labels from instead of --label-info-path.",
+)
+@click.option(
+    "--camtrap-chunk-size",
+    default=camtrap_dp.DEFAULT_CHUNK_SIZE,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of observation rows read from the data package at a time.",
+)
+@click.option(
+    "--transcode-workers",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Number of videos reencoded at the same time. Defaults to the number of CPU cores.",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(path_type=pathlib.Path),
+    default=None,
+    help="Folder to write reencoded videos to. Defaults to next to the original videos, which are never modified.",
+)
+@click.option(
+    "--media-index",
+    "media_index_path",
+    type=click.Path(path_type=pathlib.Path, dir_okay=False),
+    default=media_index.DEFAULT_INDEX_PATH,
+    show_default=True,
+    help="SQLite file with the metadata of videos probed before, shared between datasets.",
+)
+@click.option("--no-media-index", is_flag=True, help="Probe all videos without reading or filling the media index.")
+def create_dataset(
+    dataset_name: str,
+    data_dir: Optional[pathlib.Path],
+    label_info_path: Optional[pathlib.Path],
+    label_sheets: Tuple[str, ...],
+    no_label_cache: bool,
+    frame_labels: bool,
+    camtrap_dp_path: Optional[pathlib.Path],
+    camtrap_chunk_size: int,
+    transcode_workers: Optional[int],
+    output_dir: Optional[pathlib.Path],
+    media_index_path: pathlib.Path,
+    no_media_index: bool,
+) -> None:
     """Create and store dataset."""
     click.echo(f"Creating dataset with name {dataset_name}")
-    actions.create_dataset(dataset_name, data_dir, label_info_path)
+    actions.create_dataset(
+        dataset_name,
+        data_dir,
+        label_info_path,
+        transcode_workers=transcode_workers,
+        output_dir=output_dir,
+        media_index_path=None if no_media_index else media_index_path,
+        camtrap_dp_path=camtrap_dp_path,
+        camtrap_chunk_size=camtrap_chunk_size,
+        label_sheets=label_sheets or None,
+        label_cache=not no_label_cache,
+        frame_labels=frame_labels,
+    )
     click.echo("Dataset created!")
 
 
@@ -58,14 +226,69 @@ def show_dataset(dataset_name: str) -> None:
 @cli.command()
 @click.option("--dataset-name", type=str)
 @click.option("--dst", type=click.Path(path_type=pathlib.Path))
-@click.option("--export-format", type=str, default=actions.EI_EXPORT_FORMAT, show_default=True)
+@click.option(
+    "--export-format",
+    type=str,
+    default=actions.EI_EXPORT_FORMAT,
+    show_default=True,
+    help=(
+        f"{actions.EI_EXPORT_FORMAT}, {actions.SHARDS_EXPORT_FORMAT}, {actions.TENSORS_EXPORT_FORMAT} "
+        "or a FiftyOne video labels export."
+    ),
+)
 @click.option("--config-filepath", type=click.Path(path_type=pathlib.Path), default=None)
+@click.option("--workers", default=1, type=click.IntRange(min=1), show_default=True)
+@click.option("--writer-threads", default=4, type=click.IntRange(min=1), show_default=True)
+@click.option(
+    "--jpeg-quality", default=frame_export.DEFAULT_JPEG_QUALITY, type=click.IntRange(0, 100), show_default=True
+)
+@click.option(
+    "--incremental",
+    "--resume",
+    "incremental",
+    is_flag=True,
+    help="Skip samples already exported with the same media, labels and settings.",
+)
+@click.option(
+    "--samples-per-shard",
+    default=shard_export.DEFAULT_SAMPLES_PER_SHARD,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of frames in each shard of the shards export format.",
+)
+@click.option(
+    "--decode-backend",
+    type=click.Choice(list(frame_source.BACKENDS)),
+    default=frame_source.DEFAULT_BACKEND,
+    show_default=True,
+    help="Library decoding the videos. pyav needs PyAV installed and ffmpeg an ffmpeg executable on the PATH.",
+)
 def export_dataset(
-    dataset_name: str, dst: pathlib.Path, export_format: str, config_filepath: Optional[pathlib.Path]
+    dataset_name: str,
+    dst: pathlib.Path,
+    export_format: str,
+    config_filepath: Optional[pathlib.Path],
+    workers: int,
+    writer_threads: int,
+    jpeg_quality: int,
+    incremental: bool,
+    samples_per_shard: int,
+    decode_backend: str,
 ) -> None:
     """Package and export dataset to destination."""
     click.echo(f"Exporting dataset {dataset_name}...")
-    actions.export_dataset(dataset_name, dst, export_format=export_format, config_filepath=config_filepath)
+    actions.export_dataset(
+        dataset_name,
+        dst,
+        export_format=export_format,
+        config_filepath=config_filepath,
+        workers=workers,
+        writer_threads=writer_threads,
+        jpeg_quality=jpeg_quality,
+        incremental=incremental,
+        samples_per_shard=samples_per_shard,
+        decode_backend=decode_backend,
+    )
     click.echo("Dataset exported!")
 
 
@@ -82,11 +305,53 @@ def delete_dataset(dataset_name: str) -> None:
 @click.option("--dataset-name", type=str)
 @click.option("--anno-key", type=str)
 @click.option("--take", default=-1, type=int)
-def create_annotation_job(dataset_name: str, anno_key: str, take: int) -> None:
+@click.option(
+    "--refresh-classes",
+    is_flag=True,
+    default=False,
+    help="Find the classes in the dataset again instead of using the cached classes.",
+)
+@click.option(
+    "--chunk-size",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Upload the samples in chunks of this size as separate runs, so a failed upload can be resumed.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of chunks uploaded at the same time, and of processes measuring clips for smart sampling.",
+)
+@click.option(
+    "--sampling",
+    default=annotation_sampling.RANDOM_SAMPLING,
+    type=click.Choice(annotation_sampling.SAMPLING_METHODS),
+    show_default=True,
+    help="How the --take subset is drawn. smart prefers distinct clips with motion from every label.",
+)
+def create_annotation_job(
+    dataset_name: str,
+    anno_key: str,
+    take: int,
+    refresh_classes: bool,
+    chunk_size: Optional[int],
+    workers: int,
+    sampling: str,
+) -> None:
     """Create annotation job in CVAT."""
     click.echo(f"Creating annotation job for dataset {dataset_name}...")
     subset = take if take > 0 else None
-    actions.create_annotation_job(dataset_name, anno_key, subset)
+    actions.create_annotation_job(
+        dataset_name,
+        anno_key,
+        subset,
+        refresh_classes=refresh_classes,
+        chunk_size=chunk_size,
+        workers=workers,
+        sampling=sampling,
+    )
     click.echo("Annotation job created!")
 
 
@@ -94,10 +359,17 @@ def create_annotation_job(dataset_name: str, anno_key: str, take: int) -> None:
 @click.option("--dataset-name", type=str)
 @click.option("--anno-key", type=str)
 @click.option("--cleanup", default=False, type=str)
-def read_annotations(dataset_name: str, anno_key: str, cleanup: bool) -> None:
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of chunks of a chunked annotation job loaded at the same time.",
+)
+def read_annotations(dataset_name: str, anno_key: str, cleanup: bool, workers: int) -> None:
     """Read annotations from CVAT."""
     click.echo(f"Creating annotation job for dataset {dataset_name}...")
-    actions.read_annotations(dataset_name, anno_key, cleanup)
+    actions.read_annotations(dataset_name, anno_key, cleanup, workers=workers)
     click.echo("Annotation job created!")
 
 
@@ -118,11 +390,157 @@ def list_datasets() -> None:
 
 
 @cli.command()
-@click.option("--dataset", type=str)
+@click.option("--dataset", "dataset_name", type=str)
 @click.option("--config-filepath", type=click.Path(path_type=pathlib.Path, exists=True))
-def preprocess_dataset(dataset_name: str, config_filepath: pathlib.Path) -> None:
+@click.option(
+    "--transcode-workers",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Number of ffmpeg processes transcoding videos at the same time. Defaults to the number of CPU cores.",
+)
+@click.option(
+    "--media-index",
+    "media_index_path",
+    type=click.Path(path_type=pathlib.Path, dir_okay=False),
+    default=media_index.DEFAULT_INDEX_PATH,
+    show_default=True,
+    help="SQLite file with the metadata of videos probed before, shared between datasets.",
+)
+@click.option("--no-media-index", is_flag=True, help="Probe all videos without reading or filling the media index.")
+def preprocess_dataset(
+    dataset_name: str,
+    config_filepath: pathlib.Path,
+    transcode_workers: Optional[int],
+    media_index_path: pathlib.Path,
+    no_media_index: bool,
+) -> None:
     """Preprocess videos according to config."""
-    actions.preprocess_dataset(dataset_name=dataset_name, config_filepath=config_filepath)
+    actions.preprocess_dataset(
+        dataset_name=dataset_name,
+        config_filepath=config_filepath,
+        transcode_workers=transcode_workers,
+        media_index_path=None if no_media_index else media_index_path,
+    )
+
+
+@cli.command()
+@click.option(
+    "--output",
+    type=click.Path(path_type=pathlib.Path, dir_okay=False),
+    default="benchmark.json",
+    show_default=True,
+    help="JSON file to write the results to.",
+)
+@click.option(
+    "--compare",
+    "baseline_path",
+    type=click.Path(path_type=pathlib.Path, exists=True, dir_okay=False),
+    default=None,
+    help="Results of an earlier run, e.g. on another commit, to compare the throughput with.",
+)
+@click.option(
+    "--benchmark",
+    "benchmark_names",
+    multiple=True,
+    type=click.Choice(list(benchmarks.BENCHMARKS)),
+    help="Benchmark to run, can be given several times. Defaults to all.",
+)
+@click.option(
+    "--resolution",
+    "resolutions",
+    multiple=True,
+    nargs=2,
+    type=click.IntRange(min=16),
+    help="Size of the synthetic clips as WIDTH HEIGHT, can be given several times.",
+)
+@click.option("--n-frames", multiple=True, type=click.IntRange(min=2), help="Length of the synthetic clips in frames.")
+@click.option("--container", "containers", multiple=True, type=click.Choice(list(benchmarks.CONTAINERS)))
+@click.option(
+    "--decode-backend",
+    "decode_backends",
+    multiple=True,
+    type=click.Choice(list(frame_source.BACKENDS)),
+    help="Decode backend to compare, can be given several times. Defaults to all available.",
+)
+@click.option("--repeats", default=3, type=click.IntRange(min=1), show_default=True)
+@click.option(
+    "--clips-dir",
+    type=click.Path(path_type=pathlib.Path, file_okay=False),
+    default=None,
+    help="Folder to keep the synthetic clips in between runs. Defaults to a temporary folder.",
+)
+@click.option(
+    "--in-process",
+    is_flag=True,
+    help="Run every case in this process instead of a fresh one each, which is faster but mixes their peak memory.",
+)
+@click.option(
+    "--tolerance",
+    default=0.1,
+    type=click.FloatRange(0, 1),
+    show_default=True,
+    help="Fraction of throughput lost compared to --compare that fails the run.",
+)
+def benchmark(
+    output: pathlib.Path,
+    baseline_path: Optional[pathlib.Path],
+    benchmark_names: Tuple[str, ...],
+    resolutions: Tuple[Tuple[int, int], ...],
+    n_frames: Tuple[int, ...],
+    containers: Tuple[str, ...],
+    decode_backends: Tuple[str, ...],
+    repeats: int,
+    clips_dir: Optional[pathlib.Path],
+    in_process: bool,
+    tolerance: float,
+) -> None:
+    """Measure the throughput and peak memory of filtering, labelling and exporting on synthetic clips.
+
+    Args:
+        output: JSON file to write the results to
+        baseline_path: Results of an earlier run to compare with
+        benchmark_names: Benchmarks to run
+        resolutions: Sizes of the synthetic clips
+        n_frames: Lengths of the synthetic clips in frames
+        containers: File extensions of the synthetic clips
+        decode_backends: Decode backends to compare
+        repeats: Number of times to run each case
+        clips_dir: Folder to keep the synthetic clips in
+        in_process: Run every case in this process
+        tolerance: Fraction of throughput lost that fails the run
+
+    Raises:
+        ClickException: If a case got slower than the tolerance allows compared to the baseline
+    """
+    cases = benchmarks.build_cases(
+        benchmarks=benchmark_names or None,
+        resolutions=resolutions or benchmarks.DEFAULT_RESOLUTIONS,
+        n_frames=n_frames or benchmarks.DEFAULT_N_FRAMES,
+        containers=containers or benchmarks.DEFAULT_CONTAINERS,
+        backends=decode_backends or None,
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        clips_dir = clips_dir or pathlib.Path(tmp_dir)
+        click.echo(f"Generating synthetic clips in {clips_dir}...")
+        benchmarks.generate_clips(cases, clips_dir)
+        results = []
+        for result in benchmarks.run_benchmarks(cases, clips_dir, repeats=repeats, isolate=not in_process):
+            if result["error"] is None:
+                peak_rss = "" if result["peak_rss_mb"] is None else f", peak RSS {result['peak_rss_mb']:.0f} MiB"
+                click.echo(f"{result['name']}: {result['items_per_second']:.1f} {result['unit']}/s{peak_rss}")
+            results.append(result)
+    content = benchmarks.write_results(results, output)
+    click.echo(f"Results written to {output}")
+    if baseline_path is None:
+        return
+    comparison = benchmarks.compare_results(benchmarks.read_results(baseline_path), content)
+    slower = [case for case in comparison if case["ratio"] < 1 - tolerance]
+    for case in comparison:
+        click.echo(f"{case['name']}: {case['ratio']:.2f}x the throughput of {baseline_path}")
+    if slower:
+        raise click.ClickException(
+            f"{len(slower)} benchmarks are more than {tolerance:.0%} slower than {baseline_path}"
+        )
 
 
 if __name__ == "__main__":
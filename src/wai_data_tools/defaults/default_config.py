@@ -12,6 +12,6 @@ config = {
             48,
         ],
     },
-    "data_split": {"test_size": 0.25},
+    "data_split": {"test_size": 0.25, "seed": 0, "group_by": None, "stratify_by": None},
     "logging": {"logging_dir": "default", "logging_config_file": "default"},
 }
@@ -0,0 +1,141 @@
+"""This module splits annotation jobs into chunks of samples that are uploaded and loaded concurrently and resumably."""
+import dataclasses
+import logging
+import multiprocessing
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from wai_data_tools.utils import process_pool
+
+# Key in dataset.info where the chunks of chunked annotation jobs are stored
+JOBS_INFO_KEY = "wai_annotation_jobs"
+
+
+@dataclasses.dataclass
+class AnnotationChunk:
+    """A part of an annotation job that is uploaded as its own annotation run.
+
+    Attributes:
+        key: Annotation key of the run for this chunk
+        sample_ids: IDs of the samples in the chunk
+        uploaded: Whether the chunk has been uploaded completely
+        loaded: Whether the annotations of the chunk have been loaded back into the dataset
+    """
+
+    key: str
+    sample_ids: List[str]
+    uploaded: bool = False
+    loaded: bool = False
+
+
+def chunk_key(anno_key: str, index: int) -> str:
+    """Get the annotation key of a chunk, which like all annotation keys is a valid variable name.
+
+    Args:
+        anno_key: Annotation key of the whole job
+        index: Index of the chunk
+
+    Returns:
+        Annotation key of the chunk
+    """
+    return f"{anno_key}_chunk{index:04d}"
+
+
+def plan_chunks(anno_key: str, sample_ids: List[str], chunk_size: int) -> List[AnnotationChunk]:
+    """Split the samples of an annotation job into chunks of at most chunk_size samples.
+
+    Args:
+        anno_key: Annotation key of the whole job
+        sample_ids: IDs of the samples to annotate
+        chunk_size: Max number of samples in each chunk
+
+    Returns:
+        Chunks in the order of sample_ids
+
+    Raises:
+        ValueError: If chunk_size is not positive
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    return [
+        AnnotationChunk(key=chunk_key(anno_key, index), sample_ids=list(sample_ids[start : start + chunk_size]))
+        for index, start in enumerate(range(0, len(sample_ids), chunk_size))
+    ]
+
+
+def load_chunks(info: Dict[str, Any], anno_key: str) -> Optional[List[AnnotationChunk]]:
+    """Get the chunks of an annotation job stored in dataset info.
+
+    Args:
+        info: Info dictionary of a dataset
+        anno_key: Annotation key of the whole job
+
+    Returns:
+        The chunks, or None if the job is not a chunked job
+    """
+    records = info.get(JOBS_INFO_KEY, {}).get(anno_key)
+    if records is None:
+        return None
+    return [AnnotationChunk(**record) for record in records]
+
+
+def store_chunks(info: Dict[str, Any], anno_key: str, chunks: Optional[List[AnnotationChunk]]) -> None:
+    """Store the chunks of an annotation job in dataset info. The dataset still has to be saved.
+
+    Args:
+        info: Info dictionary of a dataset
+        anno_key: Annotation key of the whole job
+        chunks: Chunks of the job, or None to remove the job
+    """
+    jobs = dict(info.get(JOBS_INFO_KEY, {}))
+    if chunks is None:
+        jobs.pop(anno_key, None)
+    else:
+        jobs[anno_key] = [dataclasses.asdict(chunk) for chunk in chunks]
+    info[JOBS_INFO_KEY] = jobs
+
+
+def _safe_run_chunk(task: Callable[[AnnotationChunk], Any], chunk: AnnotationChunk) -> Tuple[Any, Optional[str]]:
+    """Run a task on a chunk and return any error as a message instead of raising it.
+
+    Args:
+        task: Function uploading or loading a chunk
+        chunk: Chunk to run the task on
+
+    Returns:
+        Tuple with the result of the task, or None if it failed, and the error message if any
+    """
+    try:
+        return task(chunk), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def run_chunks(
+    chunks: List[AnnotationChunk], task: Callable[[AnnotationChunk], Any], workers: int = 1
+) -> Iterator[Tuple[AnnotationChunk, Optional[str]]]:
+    """Run a task on several chunks, optionally in a pool of processes.
+
+    Results are yielded in the same order as chunks, and a chunk that fails is logged and yielded with its
+    error instead of stopping the other chunks. Worker processes are spawned rather than forked, so they
+    open their own database connections, and the task has to be picklable when workers is more than 1.
+
+    Args:
+        chunks: Chunks to run the task on
+        task: Function uploading or loading a chunk
+        workers: Number of processes running the task. With 1 the chunks are run in the current process.
+
+    Yields:
+        Tuple with the chunk and the error message, or None if the task succeeded
+    """
+    logger = logging.getLogger(__name__)
+
+    results = process_pool.run_tasks(
+        _safe_run_chunk,
+        [(task, chunk) for chunk in chunks],
+        workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    for chunk, (_, error) in zip(chunks, results):
+        if error is not None:
+            logger.error("Failed to process annotation chunk %s: %s", chunk.key, error)
+        yield chunk, error
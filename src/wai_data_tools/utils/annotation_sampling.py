@@ -0,0 +1,254 @@
+"""This module selects the samples to annotate, preferring distinct clips with motion from every label."""
+import logging
+import pathlib
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from wai_data_tools.utils import process_pool, video_filtering
+
+RANDOM_SAMPLING = "random"
+SMART_SAMPLING = "smart"
+SAMPLING_METHODS = (RANDOM_SAMPLING, SMART_SAMPLING)
+
+MOTION_SCORE_FIELD = "motion_score"
+KEYFRAME_HASH_FIELD = "keyframe_hash"
+
+# Keyframes whose hashes differ in at most this many of the 64 bits are considered near duplicates
+DEFAULT_MAX_HASH_DISTANCE = 4
+
+
+def difference_hash(frame: np.ndarray, hash_size: int = 8) -> int:
+    """Calculate the difference hash of a frame, which changes little when the frame changes little.
+
+    The frame is shrunk to hash_size + 1 by hash_size grayscale pixels, and each bit of the hash tells
+    whether a pixel is brighter than its right neighbour.
+
+    Args:
+        frame: BGR or grayscale frame
+        hash_size: Number of bits per row and number of rows of the hash
+
+    Returns:
+        Hash with hash_size * hash_size bits
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # pylint: disable=no-member
+    small = cv2.resize(  # pylint: disable=no-member
+        frame, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA  # pylint: disable=no-member
+    )
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), byteorder="big")
+
+
+def video_keyframe_hash(src_file: pathlib.Path) -> Optional[int]:
+    """Calculate the difference hash of the middle frame of a video.
+
+    Args:
+        src_file: Path to video file
+
+    Returns:
+        Hash of the keyframe, or None if no frame could be read
+    """
+    cap = cv2.VideoCapture(str(src_file))  # pylint: disable=no-member
+    try:
+        n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))  # pylint: disable=no-member
+        if n_frames > 1:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, n_frames // 2)  # pylint: disable=no-member
+        success, frame = cap.read()
+        if not success and n_frames > 1:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # pylint: disable=no-member
+            success, frame = cap.read()
+    finally:
+        cap.release()
+    return difference_hash(frame) if success else None
+
+
+def hashes_to_array(hashes: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert hashes stored as hex strings to an array.
+
+    Args:
+        hashes: Hex strings of 64 bit hashes, or None for samples without a hash
+
+    Returns:
+        Array of hashes and a mask of which samples have a hash
+    """
+    has_hash = np.array([value is not None for value in hashes], dtype=bool)
+    values = np.array([int(value, 16) if value is not None else 0 for value in hashes], dtype=np.uint64)
+    return values, has_hash
+
+
+def hamming_distances(value: np.uint64, values: np.ndarray) -> np.ndarray:
+    """Count the bits that differ between a hash and each of an array of hashes.
+
+    Args:
+        value: 64 bit hash
+        values: Array of 64 bit hashes
+
+    Returns:
+        Number of differing bits for each hash in values
+    """
+    differing = np.bitwise_xor(values.astype(np.uint64), np.uint64(value))
+    return np.unpackbits(differing.view(np.uint8)).reshape(len(values), 64).sum(axis=1)
+
+
+def stratified_quotas(counts: np.ndarray, n_samples: int) -> np.ndarray:
+    """Divide a number of samples as evenly as possible between strata, without exceeding their sizes.
+
+    Strata too small for an equal share give all their samples, and the rest is shared by the others.
+
+    Args:
+        counts: Number of samples in each stratum
+        n_samples: Number of samples to divide
+
+    Returns:
+        Number of samples to take from each stratum
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    quotas = np.zeros_like(counts)
+    remaining = min(int(n_samples), int(counts.sum()))
+    while remaining > 0:
+        open_strata = np.flatnonzero(quotas < counts)
+        share = max(remaining // len(open_strata), 1)
+        for ind in open_strata[np.argsort(counts[open_strata] - quotas[open_strata])]:
+            extra = min(share, counts[ind] - quotas[ind], remaining)
+            quotas[ind] += extra
+            remaining -= extra
+            if remaining == 0:
+                break
+    return quotas
+
+
+def select_samples(
+    labels: Sequence[str],
+    motion_scores: Sequence[Optional[float]],
+    hashes: Sequence[Optional[str]],
+    n_samples: int,
+    max_hash_distance: int = DEFAULT_MAX_HASH_DISTANCE,
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    """Select samples to annotate, stratified by label, weighted by motion and without near duplicate keyframes.
+
+    Each label gets an equal share of the samples as far as it has enough of them. Within a label samples
+    are drawn without replacement with probabilities growing with the logarithm of their motion score, so
+    empty clips are still drawn but less often. A sample whose keyframe is within max_hash_distance bits
+    of an already selected keyframe is skipped. Shares that cannot be filled are filled with the best
+    remaining samples of any label.
+
+    Args:
+        labels: Label of each sample
+        motion_scores: Motion score of each sample, None if unknown, which counts as no motion
+        hashes: Keyframe hash of each sample as hex string, None if unknown, which is never a duplicate
+        n_samples: Number of samples to select
+        max_hash_distance: Max number of differing bits for keyframes to be near duplicates, -1 to keep all
+        seed: Seed for the random draw
+
+    Returns:
+        Indices of the selected samples in selection order
+    """
+    labels = np.asarray(labels, dtype=object)
+    scores = np.array([score or 0 for score in motion_scores], dtype=float)
+    hash_values, has_hash = hashes_to_array(hashes)
+
+    # Weighted sampling without replacement: sorting on exponential keys divided by the weights
+    # draws samples in the same order as repeated weighted draws would.
+    weights = 1.0 + np.log1p(np.maximum(scores, 0.0))
+    keys = np.random.default_rng(seed).exponential(size=len(labels)) / weights
+
+    strata, stratum_inds = np.unique(labels.astype(str), return_inverse=True)
+    quotas = stratified_quotas(np.bincount(stratum_inds, minlength=len(strata)), n_samples)
+    taken = np.zeros(len(strata), dtype=np.int64)
+
+    n_selectable = min(int(n_samples), len(labels))
+    selected = np.zeros(len(labels), dtype=bool)
+    selection: List[int] = []
+    selected_hashes = np.zeros(n_selectable, dtype=np.uint64)
+    n_hashes = 0
+
+    # The first pass fills the share of each label, the second pass fills what is left with any label
+    for candidates, use_quotas in ((np.lexsort((keys, stratum_inds)), True), (np.argsort(keys), False)):
+        for ind in candidates:
+            if len(selection) == n_selectable:
+                break
+            stratum = stratum_inds[ind]
+            if selected[ind] or (use_quotas and taken[stratum] >= quotas[stratum]):
+                continue
+            if has_hash[ind] and max_hash_distance >= 0 and n_hashes > 0:
+                if hamming_distances(hash_values[ind], selected_hashes[:n_hashes]).min() <= max_hash_distance:
+                    continue
+            selection.append(int(ind))
+            selected[ind] = True
+            taken[stratum] += 1
+            if has_hash[ind]:
+                selected_hashes[n_hashes] = hash_values[ind]
+                n_hashes += 1
+    return np.array(selection, dtype=np.int64)
+
+
+def _safe_video_features(
+    src_file: pathlib.Path, threshold: int, settings: Optional[video_filtering.DifferenceSettings]
+) -> Tuple[Optional[Tuple[int, Optional[int]]], Optional[str]]:
+    """Measure the motion score and keyframe hash of a video and return any error as a message instead of raising it.
+
+    Args:
+        src_file: Path to video file
+        threshold: Threshold for activity to use when measuring motion
+        settings: Settings for sampling, preparing and comparing the frames
+
+    Returns:
+        Tuple with the motion score and keyframe hash, or None if it failed, and the error message if any
+    """
+    try:
+        score = video_filtering.video_motion_score(src_file, threshold=threshold, settings=settings)
+        return (score, video_keyframe_hash(src_file)), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def process_videos_features(
+    src_files: List[pathlib.Path],
+    threshold: int = 50,
+    workers: int = 1,
+    settings: Optional[video_filtering.DifferenceSettings] = None,
+) -> Iterator[Tuple[pathlib.Path, Optional[int], Optional[str]]]:
+    """Measure the motion score and keyframe hash of several videos, optionally in a pool of processes.
+
+    Results are yielded in the same order as src_files, and a video that fails to be processed is logged
+    and yielded with None values instead of stopping the run.
+
+    Args:
+        src_files: List of video files to process
+        threshold: Threshold for activity to use when measuring motion
+        workers: Number of processes to use. With 1 the videos are processed in the current process.
+        settings: Settings for sampling, preparing and comparing the frames
+
+    Yields:
+        Tuple with the video file, its motion score and its keyframe hash as a hex string
+    """
+    logger = logging.getLogger(__name__)
+
+    results = process_pool.run_tasks(
+        _safe_video_features,
+        [(src_file, threshold, settings) for src_file in src_files],
+        workers=workers,
+        initializer=video_filtering.init_worker,
+    )
+    for src_file, (features, error) in zip(src_files, results):
+        if error is not None:
+            logger.error("Failed to process file %s: %s", src_file.name, error)
+        yield (src_file, *_format_features(features))
+
+
+def _format_features(features: Optional[Tuple[int, Optional[int]]]) -> Tuple[Optional[int], Optional[str]]:
+    """Format the features of a video for storing them in a dataset.
+
+    Args:
+        features: Motion score and keyframe hash, or None if the video could not be processed
+
+    Returns:
+        Motion score and keyframe hash as a hex string, None for values that are missing
+    """
+    if features is None:
+        return None, None
+    score, keyframe_hash = features
+    return score, None if keyframe_hash is None else f"{keyframe_hash:016x}"
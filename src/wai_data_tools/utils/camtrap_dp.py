@@ -0,0 +1,146 @@
+"""This module reads camera trap data packages in the Camtrap DP format, see https://camtrap-dp.tdwg.org."""
+import json
+import logging
+import pathlib
+from typing import Dict, Iterator
+
+import pandas as pd
+
+DATAPACKAGE_FILENAME = "datapackage.json"
+
+# Columns read from each table with their dtypes, other columns are not loaded
+DEPLOYMENT_COLUMNS = {
+    "deploymentID": "string",
+    "locationID": "string",
+    "locationName": "string",
+    "latitude": "float64",
+    "longitude": "float64",
+}
+MEDIA_COLUMNS = {
+    "mediaID": "string",
+    "deploymentID": "string",
+    "timestamp": "string",
+    "filePath": "string",
+    "fileName": "string",
+}
+OBSERVATION_COLUMNS = {
+    "observationID": "string",
+    "mediaID": "string",
+    "eventStart": "string",
+    "eventEnd": "string",
+    "observationLevel": "string",
+    "observationType": "string",
+    "scientificName": "string",
+}
+
+# Observation level of observations of a single media file, other observations cover a whole event
+MEDIA_OBSERVATION_LEVEL = "media"
+
+# Observation type of media without anything in them, which are left unlabelled like "nothing" in label sheets
+BLANK_OBSERVATION_TYPE = "blank"
+
+# Number of observation rows read at a time
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def resource_paths(package_path: pathlib.Path) -> Dict[str, pathlib.Path]:
+    """Find the tables of a data package from its descriptor.
+
+    Args:
+        package_path: Folder of the data package, or its datapackage.json
+
+    Returns:
+        Path of each resource of the package by resource name
+
+    Raises:
+        ValueError: If the deployments, media or observations table is missing
+    """
+    descriptor_path = package_path if package_path.is_file() else package_path / DATAPACKAGE_FILENAME
+    with descriptor_path.open(encoding="utf-8") as file_stream:
+        descriptor = json.load(file_stream)
+    paths = {
+        resource["name"]: descriptor_path.parent / resource["path"]
+        for resource in descriptor.get("resources", [])
+        if isinstance(resource.get("path"), str)
+    }
+    missing = {"deployments", "media", "observations"} - set(paths)
+    if missing:
+        raise ValueError(f"Data package {descriptor_path} has no {', '.join(sorted(missing))} table")
+    return paths
+
+
+def _parse_timestamps(values: pd.Series) -> pd.Series:
+    """Parse ISO 8601 timestamps with time zones to UTC.
+
+    Args:
+        values: Timestamps as strings
+
+    Returns:
+        Timestamps in UTC, NaT where missing
+    """
+    return pd.to_datetime(values, utc=True, format="ISO8601")
+
+
+def read_media(package_path: pathlib.Path) -> pd.DataFrame:
+    """Read the media of a data package joined with their deployments.
+
+    Args:
+        package_path: Folder of the data package, or its datapackage.json
+
+    Returns:
+        One row per media file with the media and deployment columns, a parsed timestamp and the video
+        name, which is the file name without extensions as used to match videos to labels
+    """
+    paths = resource_paths(package_path)
+    df_deployments = pd.read_csv(
+        paths["deployments"], usecols=list(DEPLOYMENT_COLUMNS), dtype=DEPLOYMENT_COLUMNS, encoding="utf-8-sig"
+    )
+    df_media = pd.read_csv(paths["media"], usecols=list(MEDIA_COLUMNS), dtype=MEDIA_COLUMNS, encoding="utf-8-sig")
+    df_media = df_media.merge(df_deployments, on="deploymentID", how="left")
+    df_media["timestamp"] = _parse_timestamps(df_media["timestamp"])
+    df_media["video_name"] = df_media["fileName"].str.split(".").str[0]
+    return df_media
+
+
+def read_observations(
+    package_path: pathlib.Path, df_media: pd.DataFrame, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """Read the media level observations of a data package in chunks, each joined with its media.
+
+    Only chunk_size observation rows are held in memory at a time, so packages with millions of
+    observations can be read. Event level observations, which have no media of their own, and blank
+    observations are skipped, also when an event level observation lists a media.
+
+    Args:
+        package_path: Folder of the data package, or its datapackage.json
+        df_media: Media to join, as returned by read_media and optionally with extra columns
+        chunk_size: Number of observation rows read at a time
+
+    Yields:
+        Observations joined with df_media, with a label and the start and end of each observation in
+        seconds from the start of its media
+    """
+    logger = logging.getLogger(__name__)
+
+    paths = resource_paths(package_path)
+    n_skipped = 0
+    for df_chunk in pd.read_csv(
+        paths["observations"],
+        usecols=list(OBSERVATION_COLUMNS),
+        dtype=OBSERVATION_COLUMNS,
+        encoding="utf-8-sig",
+        chunksize=chunk_size,
+    ):
+        keep = (
+            df_chunk["mediaID"].notna()
+            & df_chunk["observationLevel"].eq(MEDIA_OBSERVATION_LEVEL).fillna(False)
+            & df_chunk["observationType"].ne(BLANK_OBSERVATION_TYPE).fillna(True)
+        ).astype(bool)
+        n_skipped += int((~keep).sum())
+        df_chunk = df_chunk[keep].merge(df_media, on="mediaID", how="inner")
+        df_chunk["label"] = df_chunk["scientificName"].fillna(df_chunk["observationType"])
+        df_chunk["start"] = (_parse_timestamps(df_chunk["eventStart"]) - df_chunk["timestamp"]).dt.total_seconds()
+        df_chunk["end"] = (_parse_timestamps(df_chunk["eventEnd"]) - df_chunk["timestamp"]).dt.total_seconds()
+        df_chunk["start"] = df_chunk["start"].clip(lower=0)
+        yield df_chunk[df_chunk["label"].notna() & (df_chunk["end"] >= df_chunk["start"])].reset_index(drop=True)
+    logger.info("Skipped %s blank or event level observations", n_skipped)
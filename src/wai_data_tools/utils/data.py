@@ -1,28 +1,77 @@
 """Data transformation functionality."""
 import logging
 import math
+from typing import Dict, Hashable, Optional, Sequence, Tuple
 
 import numpy as np
 
 
-def calc_test_split_indices(n_files: int, test_split_size: float, seed=0) -> np.ndarray:
-    """Calculates a split for training and testing files and returning their indices.
+def calc_test_split_mask(
+    n_files: int,
+    test_split_size: float,
+    seed: int = 0,
+    groups: Optional[Sequence[Hashable]] = None,
+    strata: Optional[Sequence[Hashable]] = None,
+) -> np.ndarray:
+    """Calculates a split for training and testing files as a mask of the test files.
+
+    Files with the same group, e.g. the same camera deployment, always end up in the same split. With strata,
+    e.g. the label of each file, every stratum is split on its own so it gets its share of test files. A group
+    belongs to the stratum of its first file. Within each stratum the groups are shuffled and the first groups
+    whose number of files comes closest to test_split_size of the files in the stratum go to the test split.
+    A local random generator is used, so the split only depends on the arguments and not on global random state.
 
     Args:
         n_files: Number of files to split
         test_split_size: Ratio of n_files should be in test split
         seed: Random seed number to use for sampling
+        groups: Optional group of each file, None puts a file in a group of its own
+        strata: Optional stratum of each file
 
     Returns:
-        Test data indices
+        Boolean mask that is True for the test files
     """
-    np.random.seed(seed)
+    rng = np.random.default_rng(seed)
+
+    if groups is None:
+        group_inds = np.arange(n_files)
+    else:
+        group_keys = [("file", ind) if group is None else ("group", group) for ind, group in enumerate(groups)]
+        group_codes: Dict[Tuple[str, Hashable], int] = {}
+        group_inds = np.asarray([group_codes.setdefault(key, len(group_codes)) for key in group_keys], dtype=np.int64)
+    # Groups are numbered in order of their first file
+    group_first_files = np.unique(group_inds, return_index=True)[1]
+    group_sizes = np.bincount(group_inds, minlength=len(group_first_files))
+    n_groups = len(group_first_files)
+
+    if strata is None:
+        group_strata = np.zeros(n_groups, dtype=np.int64)
+    else:
+        file_strata = np.unique(np.asarray([str(stratum) for stratum in strata]), return_inverse=True)[1].reshape(-1)
+        group_strata = file_strata[group_first_files]
+
+    is_test_group = np.zeros(n_groups, dtype=bool)
+    for stratum in np.unique(group_strata):
+        stratum_groups = rng.permutation(np.flatnonzero(group_strata == stratum))
+        n_test_files = math.floor(group_sizes[stratum_groups].sum() * test_split_size)
+        cumulative_sizes = np.concatenate([[0], np.cumsum(group_sizes[stratum_groups])])
+        n_test_groups = int(np.argmin(np.abs(cumulative_sizes - n_test_files)))
+        is_test_group[stratum_groups[:n_test_groups]] = True
+    return is_test_group[group_inds]
 
-    n_test_files = math.floor(n_files * test_split_size)
 
-    test_file_inds = np.random.choice(n_files, size=n_test_files, replace=False)
+def calc_test_split_indices(n_files: int, test_split_size: float, seed=0) -> np.ndarray:
+    """Calculates a split for training and testing files and returning their indices.
 
-    return test_file_inds
+    Args:
+        n_files: Number of files to split
+        test_split_size: Ratio of n_files should be in test split
+        seed: Random seed number to use for sampling
+
+    Returns:
+        Sorted test data indices
+    """
+    return np.flatnonzero(calc_test_split_mask(n_files=n_files, test_split_size=test_split_size, seed=seed))
 
 
 def calculate_frames_in_timespan(t_start: float, t_end: float, fps: float) -> np.ndarray:
@@ -57,3 +106,38 @@ def calculate_frames_in_timespan(t_start: float, t_end: float, fps: float) -> np
     logger.debug("Frames with label start at frame %s and ends at %s", frame_start, frame_end)
 
     return np.arange(frame_start, frame_end)
+
+
+def calculate_frame_ranges(t_start: np.ndarray, t_end: np.ndarray, fps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Calculate the frames in many timespans at once, rounding like calculate_frames_in_timespan.
+
+    Args:
+        t_start: starts of time intervals in seconds
+        t_end: ends of time intervals in seconds
+        fps: frames per second for each interval
+
+    Returns:
+        arrays with the first frame index and one past the last frame index of each interval
+    """
+    t_frame = 1 / np.asarray(fps, dtype=float)
+    frame_start = np.floor(np.asarray(t_start, dtype=float) / t_frame).astype(np.int64)
+    frame_end = np.ceil(np.asarray(t_end, dtype=float) / t_frame).astype(np.int64)
+    return frame_start, np.maximum(frame_end, frame_start)
+
+
+def expand_frame_ranges(frame_start: np.ndarray, frame_end: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Expand frame ranges to the frame indices they contain, without looping over the ranges.
+
+    Args:
+        frame_start: first frame index of each range
+        frame_end: one past the last frame index of each range
+
+    Returns:
+        arrays with the index of the range each frame belongs to and the frame index
+    """
+    frame_start = np.asarray(frame_start, dtype=np.int64)
+    lengths = np.maximum(np.asarray(frame_end, dtype=np.int64) - frame_start, 0)
+    range_inds = np.repeat(np.arange(len(lengths)), lengths)
+    range_offsets = np.cumsum(lengths) - lengths
+    frame_inds = np.arange(lengths.sum()) - range_offsets[range_inds] + frame_start[range_inds]
+    return range_inds, frame_inds
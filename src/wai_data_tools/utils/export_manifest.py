@@ -0,0 +1,156 @@
+"""This module keeps track of which samples an export has completed, so an export can be resumed or updated."""
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from typing import Any, Dict, List, Optional, Sequence
+
+from wai_data_tools.utils import filter_cache
+
+MANIFEST_FILENAME = ".wai_export_manifest.jsonl"
+FIFTYONE_MANIFEST_FILENAME = "manifest.json"
+
+
+def source_fingerprint(filepath: pathlib.Path) -> str:
+    """Fingerprint the content of a media file from its size, modification time and partial content hash.
+
+    Args:
+        filepath: Path to media file
+
+    Returns:
+        Fingerprint of the file
+    """
+    stat = filepath.stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}-{filter_cache.partial_file_hash(filepath)}"
+
+
+def labels_fingerprint(labels: Any) -> str:
+    """Fingerprint labels that can be serialized to JSON.
+
+    Args:
+        labels: Labels of a sample
+
+    Returns:
+        Fingerprint of the labels
+    """
+    serialized = json.dumps(labels, sort_keys=True, default=str)
+    return hashlib.blake2b(serialized.encode(), digest_size=16).hexdigest()
+
+
+class ExportManifest:
+    """Append-only manifest of the samples an export has completed.
+
+    Each line of the manifest is a JSON record with the sample key, the fingerprint of the sample when
+    it was exported and details about its outputs. If a sample has been exported several times the
+    last record is the valid one.
+    """
+
+    def __init__(self, export_location: pathlib.Path, reset: bool = False) -> None:
+        """Load the manifest of an export.
+
+        Args:
+            export_location: Folder the export is written to
+            reset: Start a new manifest instead of loading the existing one
+        """
+        self.path = export_location / MANIFEST_FILENAME
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if reset:
+            self.path.unlink(missing_ok=True)
+        elif self.path.is_file():
+            self._load()
+
+    def _load(self) -> None:
+        """Read the records in the manifest file, ignoring a truncated last line from an interrupted export."""
+        logger = logging.getLogger(__name__)
+        with self.path.open(mode="r") as manifest_file:
+            for line in manifest_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Ignoring corrupt line in export manifest %s", self.path)
+                    continue
+                self.entries[record["key"]] = record
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get the last record of a sample.
+
+        Args:
+            key: Key of sample
+
+        Returns:
+            The record, or None if the sample has not been exported
+        """
+        return self.entries.get(key)
+
+    def is_up_to_date(self, key: str, fingerprint: Dict[str, Any]) -> bool:
+        """Check if a sample has been exported with the same fingerprint.
+
+        Args:
+            key: Key of sample
+            fingerprint: Current fingerprint of the sample
+
+        Returns:
+            True if the sample does not need to be exported again
+        """
+        record = self.entries.get(key)
+        return record is not None and record["fingerprint"] == fingerprint
+
+    def record(self, key: str, fingerprint: Dict[str, Any], outputs: Optional[Dict[str, Any]] = None) -> None:
+        """Record that a sample has been completely exported.
+
+        Args:
+            key: Key of sample
+            fingerprint: Fingerprint of the sample that was exported
+            outputs: Details about what was written for the sample, needed to remove it if it is exported again
+        """
+        record = {"key": key, "fingerprint": fingerprint, "outputs": outputs or {}}
+        with self.path.open(mode="a") as manifest_file:
+            manifest_file.write(json.dumps(record, sort_keys=True) + "\n")
+        self.entries[key] = record
+
+
+def merge_fiftyone_export(
+    staging_dir: pathlib.Path, export_location: pathlib.Path, replaced_records: Sequence[Dict[str, str]] = ()
+) -> List[Dict[str, str]]:
+    """Move the samples of a FiftyOne video labels export into another export of the same format.
+
+    Both exports must be written with the same rel_dir, so the media path in the index is derived from the full
+    filepath of each sample and samples are matched on it. Media and label files replace the files of the same
+    sample, and the index in manifest.json is updated so it lists the samples of both exports.
+
+    Args:
+        staging_dir: Folder with an export of some samples
+        export_location: Folder with the export to merge the samples into
+        replaced_records: Index records of earlier exports of the merged samples, removed with their files
+
+    Returns:
+        Index records of the merged samples in the order they were exported, with paths to media and labels
+    """
+    staging_index = json.loads((staging_dir / FIFTYONE_MANIFEST_FILENAME).read_text())
+    target_manifest_path = export_location / FIFTYONE_MANIFEST_FILENAME
+    if target_manifest_path.is_file():
+        target_index = json.loads(target_manifest_path.read_text())
+    else:
+        target_index = dict(staging_index, index=[])
+
+    records = staging_index["index"]
+    stale_records = {record["data"]: record for record in replaced_records}
+    for record in records:
+        stale_records.pop(record["data"], None)
+    for record in stale_records.values():
+        for relative_path in (record["data"], record["labels"]):
+            (export_location / relative_path).unlink(missing_ok=True)
+    for record in records:
+        for relative_path in (record["data"], record["labels"]):
+            target_path = export_location / relative_path
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staging_dir / relative_path, target_path)
+
+    merged_records = {record["data"]: record for record in target_index["index"] if record["data"] not in stale_records}
+    merged_records.update({record["data"]: record for record in records})
+    target_index["index"] = list(merged_records.values())
+    tmp_manifest_path = target_manifest_path.with_suffix(".json.tmp")
+    tmp_manifest_path.write_text(json.dumps(target_index, indent=4))
+    os.replace(tmp_manifest_path, target_manifest_path)
+    return records
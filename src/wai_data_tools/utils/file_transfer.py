@@ -0,0 +1,128 @@
+"""This module transfers files between folders without copying data when the filesystem allows it."""
+import errno
+import logging
+import os
+import pathlib
+import shutil
+
+COPY = "copy"
+HARDLINK = "hardlink"
+SYMLINK = "symlink"
+REFLINK = "reflink"
+MOVE = "move"
+TRANSFER_MODES = (COPY, HARDLINK, SYMLINK, REFLINK, MOVE)
+
+# ioctl request for cloning a file on Linux filesystems with copy-on-write support, e.g. btrfs and XFS
+FICLONE = 0x40049409
+
+# Errors meaning the requested kind of link is not possible between src and dest, so a copy should be done instead
+FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EMLINK}
+
+
+def copy_file(src: pathlib.Path, dest: pathlib.Path) -> None:
+    """Copy a file and its permission bits, letting the kernel move the data when possible.
+
+    Uses os.copy_file_range where available, which can share blocks on copy-on-write filesystems and
+    avoids copying data through user space. Otherwise falls back to shutil.copyfile, which uses os.sendfile on Linux.
+
+    Args:
+        src: File to copy
+        dest: Path to copy the file to
+
+    Raises:
+        OSError: If the file could not be copied
+    """
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is None:
+        shutil.copyfile(src, dest)
+    else:
+        try:
+            with src.open(mode="rb") as src_stream, dest.open(mode="wb") as dest_stream:
+                remaining = os.fstat(src_stream.fileno()).st_size
+                while remaining > 0:
+                    n_copied = copy_file_range(src_stream.fileno(), dest_stream.fileno(), remaining)
+                    if n_copied == 0:
+                        break
+                    remaining -= n_copied
+        except OSError as err:
+            if err.errno not in FALLBACK_ERRNOS:
+                raise
+            shutil.copyfile(src, dest)
+    shutil.copymode(src, dest)
+
+
+def reflink_file(src: pathlib.Path, dest: pathlib.Path) -> None:
+    """Clone a file so that src and dest share data blocks until one of them is modified.
+
+    Args:
+        src: File to clone
+        dest: Path to clone the file to
+
+    Raises:
+        OSError: If the platform or filesystem does not support cloning files
+    """
+    try:
+        import fcntl  # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform") from err
+
+    with src.open(mode="rb") as src_stream, dest.open(mode="wb") as dest_stream:
+        try:
+            fcntl.ioctl(dest_stream.fileno(), FICLONE, src_stream.fileno())
+        except OSError:
+            dest_stream.close()
+            dest.unlink()
+            raise
+    shutil.copymode(src, dest)
+
+
+def transfer_file(src: pathlib.Path, dest: pathlib.Path, mode: str = COPY) -> str:
+    """Transfer a file to dest using the given mode, falling back to a copy if the mode is not possible.
+
+    An existing file at dest is replaced.
+
+    Args:
+        src: File to transfer
+        dest: Path to transfer the file to
+        mode: One of TRANSFER_MODES
+
+    Returns:
+        The mode that was actually used. A move is still reported as a move when it had to copy and delete.
+
+    Raises:
+        ValueError: If mode is not one of TRANSFER_MODES
+        OSError: If the file could not be transferred, also not by copying it
+    """
+    logger = logging.getLogger(__name__)
+
+    if mode not in TRANSFER_MODES:
+        raise ValueError(f"Unknown transfer mode {mode}, expected one of {TRANSFER_MODES}")
+
+    if dest.exists() and dest.samefile(src):
+        logger.debug("%s and %s are already the same file", src, dest)
+        return mode
+    if dest.is_symlink() or (mode != COPY and dest.exists()):
+        dest.unlink()
+
+    try:
+        if mode == HARDLINK:
+            os.link(src, dest)
+        elif mode == SYMLINK:
+            os.symlink(src.resolve(), dest)
+        elif mode == REFLINK:
+            reflink_file(src, dest)
+        elif mode == MOVE:
+            os.replace(src, dest)
+        else:
+            copy_file(src, dest)
+        return mode
+    except OSError as err:
+        if mode == COPY or err.errno not in FALLBACK_ERRNOS:
+            raise
+        logger.debug("Could not %s %s to %s (%s), copying instead", mode, src, dest, err)
+
+    copy_file(src, dest)
+    if mode == MOVE:
+        src.unlink()
+        return MOVE
+    return COPY
@@ -0,0 +1,213 @@
+"""This module keeps results from filtering empty videos on disk so unchanged videos are not decoded again."""
+import hashlib
+import logging
+import pathlib
+import sqlite3
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from wai_data_tools.utils import video_filtering
+
+# Number of bytes read from the start and the end of a file when hashing it
+PARTIAL_HASH_CHUNK_SIZE = 64 * 1024
+
+# Suffixes of the files SQLite keeps next to a database while writing to it
+SQLITE_SIDECAR_SUFFIXES = ("-journal", "-wal", "-shm")
+
+
+def partial_file_hash(filepath: pathlib.Path, chunk_size: int = PARTIAL_HASH_CHUNK_SIZE) -> str:
+    """Hash the size, the start and the end of a file.
+
+    Much faster than hashing the whole file for large videos, while still catching re-encoded or replaced files.
+
+    Args:
+        filepath: Path to file to hash
+        chunk_size: Number of bytes to read from the start and the end of the file
+
+    Returns:
+        Hex digest of the hash
+    """
+    size = filepath.stat().st_size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with filepath.open(mode="rb") as file_stream:
+        digest.update(file_stream.read(chunk_size))
+        if size > 2 * chunk_size:
+            file_stream.seek(-chunk_size, 2)
+        digest.update(file_stream.read(chunk_size))
+    return digest.hexdigest()
+
+
+def cache_files(db_path: pathlib.Path) -> List[pathlib.Path]:
+    """Get the files of a cache database, so they can be left out when the cache is stored among the videos.
+
+    Args:
+        db_path: Path to SQLite file of the cache
+
+    Returns:
+        Paths to the database file and its journal files, whether they exist or not
+    """
+    return [db_path, *(db_path.with_name(f"{db_path.name}{suffix}") for suffix in SQLITE_SIDECAR_SUFFIXES)]
+
+
+class FilterResultCache:
+    """SQLite backed cache of empty video filtering results.
+
+    Results are keyed on the resolved file path and the detector key, and are only returned if the size,
+    modification time and partial content hash of the file still match the cached entry.
+    """
+
+    def __init__(self, db_path: pathlib.Path) -> None:
+        """Open or create the cache database.
+
+        Args:
+            db_path: Path to SQLite file to store results in
+        """
+        self.db_path = db_path
+        self.connection = sqlite3.connect(str(db_path))
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                path TEXT NOT NULL,
+                detector_key TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                is_empty INTEGER NOT NULL,
+                motion_score INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (path, detector_key)
+            )
+            """
+        )
+        self.connection.commit()
+
+    def __enter__(self) -> "FilterResultCache":
+        """Enter context.
+
+        Returns:
+            The cache itself
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the cache when leaving context.
+
+        Args:
+            *exc_info: Exception information, ignored
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        self.connection.close()
+
+    @staticmethod
+    def _file_key(src_file: pathlib.Path) -> Tuple[str, int, int, str]:
+        """Get the values identifying the current content of a file.
+
+        Args:
+            src_file: Path to file
+
+        Returns:
+            Tuple with resolved path, size, modification time in nanoseconds and partial content hash
+        """
+        stat = src_file.stat()
+        return str(src_file.resolve()), stat.st_size, stat.st_mtime_ns, partial_file_hash(src_file)
+
+    def get(self, src_file: pathlib.Path, detector_key: str) -> Optional[int]:
+        """Get the cached motion score of a file if it has not changed since it was stored.
+
+        Args:
+            src_file: Path to video file
+            detector_key: Key describing the detector, see video_filtering.detector_key
+
+        Returns:
+            Cached motion score, or None if there is no valid entry
+        """
+        path, size, mtime_ns, content_hash = self._file_key(src_file)
+        row = self.connection.execute(
+            "SELECT motion_score FROM results "
+            "WHERE path = ? AND detector_key = ? AND size = ? AND mtime_ns = ? AND content_hash = ?",
+            (path, detector_key, size, mtime_ns, content_hash),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, src_file: pathlib.Path, detector_key: str, motion_score: int) -> None:
+        """Store the motion score of a file.
+
+        Args:
+            src_file: Path to video file
+            detector_key: Key describing the detector, see video_filtering.detector_key
+            motion_score: Motion score of the video, 0 if it is empty
+        """
+        path, size, mtime_ns, content_hash = self._file_key(src_file)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, detector_key, size, mtime_ns, content_hash, motion_score == 0, motion_score, time.time()),
+        )
+        self.connection.commit()
+
+    def prune(self, detector_key: Optional[str] = None) -> int:
+        """Remove entries for files that no longer exist or have changed size or modification time.
+
+        Args:
+            detector_key: If given, entries stored with any other detector key are removed as well
+
+        Returns:
+            Number of removed entries
+        """
+        stale_rows = []
+        for path, row_detector_key, size, mtime_ns in self.connection.execute(
+            "SELECT path, detector_key, size, mtime_ns FROM results"
+        ).fetchall():
+            filepath = pathlib.Path(path)
+            if detector_key is not None and row_detector_key != detector_key:
+                stale_rows.append((path, row_detector_key))
+            elif not filepath.is_file():
+                stale_rows.append((path, row_detector_key))
+            else:
+                stat = filepath.stat()
+                if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                    stale_rows.append((path, row_detector_key))
+        self.connection.executemany("DELETE FROM results WHERE path = ? AND detector_key = ?", stale_rows)
+        self.connection.commit()
+        return len(stale_rows)
+
+
+def process_videos_motion_cached(
+    src_files: List[pathlib.Path],
+    cache: FilterResultCache,
+    threshold: int = 50,
+    workers: int = 1,
+    settings: Optional[video_filtering.DifferenceSettings] = None,
+) -> Iterator[Tuple[pathlib.Path, Optional[int]]]:
+    """Measure the motion in several videos, reusing cached results for videos that have not changed.
+
+    Only videos without a valid cache entry are decoded. Results are yielded in the same order as src_files.
+
+    Args:
+        src_files: List of video files to process
+        cache: Cache to read results from and store new results in
+        threshold: Threshold for activity to use when filtering
+        workers: Number of processes used for the videos that are not cached
+        settings: Settings for sampling, preparing and comparing the frames
+
+    Yields:
+        Tuple with the video file and its motion score, or None if it could not be processed
+    """
+    logger = logging.getLogger(__name__)
+
+    key = video_filtering.detector_key(threshold=threshold, settings=settings)
+    cached_scores = [cache.get(src_file, key) for src_file in src_files]
+    uncached_files = [src_file for src_file, score in zip(src_files, cached_scores) if score is None]
+    logger.info("Found cached results for %s of %s files", len(src_files) - len(uncached_files), len(src_files))
+
+    new_results = video_filtering.process_videos_motion(
+        uncached_files, threshold=threshold, workers=workers, settings=settings
+    )
+    for src_file, score in zip(src_files, cached_scores):
+        if score is None:
+            _, score = next(new_results, (src_file, None))
+            if score is not None:
+                cache.put(src_file, key, score)
+        yield src_file, score
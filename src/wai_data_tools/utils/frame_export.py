@@ -0,0 +1,375 @@
+"""This module exports the frames of videos as labelled image files."""
+import concurrent.futures
+import dataclasses
+import logging
+import pathlib
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from wai_data_tools.utils import export_manifest, frame_source, process_pool
+
+DEFAULT_LABEL = "nothing"
+DEFAULT_JPEG_QUALITY = 95
+
+
+@dataclasses.dataclass(frozen=True)
+class FrameExportSettings:
+    """Settings for how frames are sampled and encoded when they are exported.
+
+    Attributes:
+        jpeg_quality: JPEG quality from 0 to 100
+        fps: Optional frame rate to sample the videos at. Frames are dropped, never duplicated.
+        size: Optional (width, height) to resize frames to before encoding. One of them can be -1 to keep
+              the aspect ratio.
+        backend: Name of the backend decoding the videos, see frame_source.BACKENDS
+    """
+
+    jpeg_quality: int = DEFAULT_JPEG_QUALITY
+    fps: Optional[float] = None
+    size: Optional[Tuple[int, int]] = None
+    backend: str = frame_source.DEFAULT_BACKEND
+
+    @classmethod
+    def from_config(
+        cls,
+        config: Dict[str, Any],
+        jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+        backend: str = frame_source.DEFAULT_BACKEND,
+    ) -> "FrameExportSettings":
+        """Create settings from the transformations in a config file.
+
+        Args:
+            config: Content of config file
+            jpeg_quality: JPEG quality from 0 to 100
+            backend: Name of the backend decoding the videos
+
+        Returns:
+            Export settings
+        """
+        transformations = config.get("transformations") or {}
+        size = transformations.get("size")
+        return cls(
+            jpeg_quality=jpeg_quality,
+            fps=transformations.get("fps"),
+            size=None if size is None else (int(size[0]), int(size[1])),
+            backend=backend,
+        )
+
+    def frame_source_settings(self, pixel_format: str = "bgr24") -> frame_source.FrameSourceSettings:
+        """Get the settings to decode videos with, so frames are sampled and resized while they are decoded.
+
+        Args:
+            pixel_format: Pixel format to decode frames to, see frame_source.PIXEL_FORMATS
+
+        Returns:
+            Decoding settings
+        """
+        return frame_source.FrameSourceSettings(
+            backend=self.backend, size=self.size, pixel_format=pixel_format, sample_fps=self.fps
+        )
+
+    def fingerprint(self) -> Dict[str, Any]:
+        """Describe the settings for the fingerprint of an export.
+
+        The default backend is left out, so exports made before backends were selectable are not exported again.
+
+        Returns:
+            Settings as a dictionary
+        """
+        description = dataclasses.asdict(self)
+        if self.backend == frame_source.DEFAULT_BACKEND:
+            del description["backend"]
+        return description
+
+
+@dataclasses.dataclass(frozen=True)
+class VideoExportJob:
+    """Everything needed to export the frames of one video, without having to access the dataset.
+
+    Attributes:
+        filepath: Path to the video file
+        video_name: Name of the video used in the exported filenames
+        split: Name of the split folder to export the frames to
+        frame_labels: Label for each frame number, frames are numbered from 1. Missing frames get DEFAULT_LABEL.
+    """
+
+    filepath: str
+    video_name: str
+    split: str
+    frame_labels: Dict[int, str]
+
+
+def label_to_name(label: Any, default: str = DEFAULT_LABEL) -> str:
+    """Get the name of a classification label.
+
+    Handles both a single classification and a list of classifications, in which case the first one is used.
+
+    Args:
+        label: Classification or Classifications label, or None
+        default: Name to use if there is no label
+
+    Returns:
+        Name of label
+    """
+    if label is None:
+        return default
+    classifications = getattr(label, "classifications", None)
+    if classifications is not None:
+        return classifications[0].label if classifications else default
+    return getattr(label, "label", None) or default
+
+
+def resize_frame(frame: np.ndarray, size: Optional[Tuple[int, int]]) -> np.ndarray:
+    """Resize a frame to (width, height), where one of them can be -1 to keep the aspect ratio.
+
+    Args:
+        frame: Frame to resize
+        size: Optional (width, height) to resize to, if None the frame is returned unchanged
+
+    Returns:
+        Resized frame
+    """
+    if size is None:
+        return frame
+    height, width = frame.shape[:2]
+    target = frame_source.target_size(width, height, size)
+    if target == (width, height):
+        return frame
+    return cv2.resize(frame, target, interpolation=cv2.INTER_AREA)  # pylint: disable=no-member
+
+
+def frame_filename(label: str, video_name: str, frame_number: int) -> str:
+    """Get the filename of an exported frame in the Edge Impulse upload format.
+
+    Args:
+        label: Name of the label of the frame
+        video_name: Name of the video the frame is from
+        frame_number: Number of the frame in the video, starting from 1
+
+    Returns:
+        Filename of the frame
+    """
+    return f"{label}.{video_name}___{frame_number}.jpg"
+
+
+def job_fingerprint(job: VideoExportJob, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Fingerprint everything that affects the exported frames of a video.
+
+    Args:
+        job: Video to export
+        settings: Export settings that affect the exported frames, e.g. the export format and FrameExportSettings
+
+    Returns:
+        Fingerprint to compare with the export manifest
+    """
+    return {
+        "source": export_manifest.source_fingerprint(pathlib.Path(job.filepath)),
+        "labels": export_manifest.labels_fingerprint(job.frame_labels),
+        "split": job.split,
+        "settings": settings,
+    }
+
+
+def job_outputs(job: VideoExportJob, n_frames: int) -> Dict[str, Any]:
+    """Describe the files written for a video, so they can be found and removed again by remove_exported_frames.
+
+    Args:
+        job: Exported video
+        n_frames: Number of the last exported frame
+
+    Returns:
+        Description of the exported frames
+    """
+    labels = sorted(set(job.frame_labels.values()) | {DEFAULT_LABEL})
+    return {"split": job.split, "video_name": job.video_name, "labels": labels, "n_frames": n_frames}
+
+
+def remove_exported_frames(
+    export_location: pathlib.Path, split: str, video_name: str, labels: List[str], n_frames: int
+) -> None:
+    """Remove the frames previously exported for a video.
+
+    Args:
+        export_location: Folder the frames were exported to
+        split: Name of the split folder the frames were exported to
+        video_name: Name of the video used in the exported filenames
+        labels: Labels that may appear in the exported filenames
+        n_frames: Number of the last exported frame
+    """
+    dst_dir = export_location / split
+    for label in labels:
+        for frame_number in range(1, n_frames + 1):
+            (dst_dir / frame_filename(label, video_name, frame_number)).unlink(missing_ok=True)
+
+
+class BoundedWriter:
+    """Writes images to disk from a pool of threads, blocking new writes while too many are waiting.
+
+    Bounding the number of pending writes keeps the decoded frames in memory limited when writing
+    is slower than decoding.
+    """
+
+    def __init__(self, threads: int = 4, max_pending: Optional[int] = None) -> None:
+        """Start the writer threads.
+
+        Args:
+            threads: Number of threads encoding and writing images
+            max_pending: Max number of images waiting to be written, defaults to twice the number of threads
+        """
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.slots = threading.BoundedSemaphore(max_pending or 2 * threads)
+        self.futures: List[concurrent.futures.Future] = []
+
+    def __enter__(self) -> "BoundedWriter":
+        """Enter context.
+
+        Returns:
+            The writer itself
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Wait for all writes to finish when leaving context.
+
+        Args:
+            *exc_info: Exception information, ignored
+        """
+        self.close()
+
+    def _release(self, _future: concurrent.futures.Future) -> None:
+        """Free a slot once a write is done.
+
+        Args:
+            _future: The finished write
+        """
+        self.slots.release()
+
+    def write(self, dst_path: pathlib.Path, image: np.ndarray, params: Optional[List[int]] = None) -> None:
+        """Queue an image to be written, waiting if too many writes are pending.
+
+        Args:
+            dst_path: Path to write the image to
+            image: Image to write
+            params: Parameters passed on to cv2.imwrite
+        """
+        self.slots.acquire()  # pylint: disable=consider-using-with
+        future = self.executor.submit(_write_image, dst_path, image, params or [])
+        future.add_done_callback(self._release)
+        self.futures.append(future)
+
+    def close(self) -> None:
+        """Wait for all writes to finish and raise the first error that occurred, if any."""
+        self.executor.shutdown(wait=True)
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+
+def _write_image(dst_path: pathlib.Path, image: np.ndarray, params: List[int]) -> None:
+    """Encode and write an image.
+
+    Args:
+        dst_path: Path to write the image to
+        image: Image to write
+        params: Parameters passed on to cv2.imwrite
+
+    Raises:
+        OSError: If the image could not be written
+    """
+    if not cv2.imwrite(str(dst_path), image, params):  # pylint: disable=no-member
+        raise OSError(f"Could not write image {dst_path}")
+
+
+def export_video_frames(
+    job: VideoExportJob,
+    export_location: pathlib.Path,
+    settings: Optional[FrameExportSettings] = None,
+    writer_threads: int = 4,
+) -> int:
+    """Decode a video and write its frames as JPEGs named after their labels.
+
+    Frames are dropped to reach the frame rate in settings and resized by the decode backend before they are
+    encoded.
+    The exported frames keep their frame numbers from the original video.
+
+    Args:
+        job: Video to export
+        export_location: Folder to export to, frames are written to a subfolder named after the split
+        settings: Settings for sampling and encoding frames, defaults to every frame at full size
+        writer_threads: Number of threads encoding and writing images
+
+    Returns:
+        Number of the last exported frame, 0 if no frames were exported
+    """
+    if settings is None:
+        settings = FrameExportSettings()
+    dst_dir = export_location / job.split
+    params = [cv2.IMWRITE_JPEG_QUALITY, settings.jpeg_quality]  # pylint: disable=no-member
+    last_frame_number = 0
+    frames = frame_source.iter_frames(pathlib.Path(job.filepath), settings.frame_source_settings())
+    with BoundedWriter(threads=writer_threads) as writer:
+        for frame_number, frame in frames:
+            label = job.frame_labels.get(frame_number, DEFAULT_LABEL)
+            dst_path = dst_dir / frame_filename(label, job.video_name, frame_number)
+            writer.write(dst_path, resize_frame(frame, settings.size), params)
+            last_frame_number = frame_number
+    return last_frame_number
+
+
+def _safe_export_video_frames(
+    job: VideoExportJob, export_location: pathlib.Path, settings: Optional[FrameExportSettings], writer_threads: int
+) -> Tuple[Optional[int], Optional[str]]:
+    """Run export_video_frames and return any error as a message instead of raising it.
+
+    Args:
+        job: Video to export
+        export_location: Folder to export to
+        settings: Settings for sampling and encoding frames
+        writer_threads: Number of threads encoding and writing images
+
+    Returns:
+        Tuple with the result of export_video_frames, or None if it failed, and the error message if any
+    """
+    try:
+        return export_video_frames(job, export_location, settings, writer_threads), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def export_videos(
+    jobs: List[VideoExportJob],
+    export_location: pathlib.Path,
+    workers: int = 1,
+    writer_threads: int = 4,
+    settings: Optional[FrameExportSettings] = None,
+) -> Iterator[Tuple[VideoExportJob, Optional[int]]]:
+    """Export the frames of several videos, optionally decoding them in a pool of processes.
+
+    Split folders are created once up front. Results are yielded in the same order as jobs, and a video
+    that fails to export is logged and yielded with None instead of stopping the export.
+
+    Args:
+        jobs: Videos to export
+        export_location: Folder to export to
+        workers: Number of processes decoding videos. With 1 the videos are decoded in the current process.
+        writer_threads: Number of threads encoding and writing images in each process
+        settings: Settings for sampling and encoding frames
+
+    Yields:
+        Tuple with the job and the number of its last exported frame, or None if it failed
+    """
+    logger = logging.getLogger(__name__)
+
+    for split in sorted({job.split for job in jobs}):
+        (export_location / split).mkdir(parents=True, exist_ok=True)
+
+    results = process_pool.run_tasks(
+        _safe_export_video_frames, [(job, export_location, settings, writer_threads) for job in jobs], workers=workers
+    )
+    for job, (n_frames, error) in zip(jobs, results):
+        if error is not None:
+            logger.error("Failed to export video %s: %s", job.filepath, error)
+        yield job, n_frames
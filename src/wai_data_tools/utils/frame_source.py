@@ -0,0 +1,343 @@
+"""This module decodes the frames of videos with a selectable backend, sampling and scaling them while decoding."""
+import dataclasses
+import functools
+import importlib.util
+import pathlib
+import re
+import shutil
+import subprocess  # nosec B404
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+OPENCV_BACKEND = "opencv"
+PYAV_BACKEND = "pyav"
+FFMPEG_BACKEND = "ffmpeg"
+DEFAULT_BACKEND = OPENCV_BACKEND
+
+# First ffmpeg version with the -fps_mode option, which replaces the deprecated -vsync option
+FFMPEG_FPS_MODE_VERSION = (5, 1)
+
+# Pixel formats frames can be decoded to, named like the ffmpeg pixel formats, with their number of channels
+PIXEL_FORMATS = {"bgr24": 3, "rgb24": 3, "gray": 1}
+
+
+@dataclasses.dataclass(frozen=True)
+class FrameSourceSettings:
+    """Settings for how the frames of a video are decoded.
+
+    Attributes:
+        backend: Name of the backend decoding the video, one of BACKENDS
+        size: Optional (width, height) to scale frames to. One of them can be -1 to keep the aspect ratio.
+        downscale: Integer factor to shrink frames by, only used if size is not given
+        pixel_format: Pixel format of the frames, one of PIXEL_FORMATS. gray frames have no channel dimension.
+        frame_stride: Only every frame_stride-th frame is returned
+        sample_fps: Optional frame rate to sample the video at, overrides frame_stride when given
+        threads: Number of threads decoding a video, 0 lets the backend decide
+        hw_accel: Decode with hardware acceleration if the backend and the machine support it
+        ffmpeg: ffmpeg executable used by the ffmpeg backend
+    """
+
+    backend: str = DEFAULT_BACKEND
+    size: Optional[Tuple[int, int]] = None
+    downscale: int = 1
+    pixel_format: str = "bgr24"
+    frame_stride: int = 1
+    sample_fps: Optional[float] = None
+    threads: int = 0
+    hw_accel: bool = False
+    ffmpeg: str = "ffmpeg"
+
+
+def calculate_frame_stride(video_fps: float, frame_stride: int = 1, sample_fps: Optional[float] = None) -> int:
+    """Calculate how many frames to step between each sampled frame.
+
+    Args:
+        video_fps: Frame rate of the video
+        frame_stride: Stride to use if no sample frame rate is given
+        sample_fps: Optional frame rate to sample the video at
+
+    Returns:
+        Number of frames to step, at least 1
+    """
+    if sample_fps is None or sample_fps <= 0 or video_fps <= 0:
+        return max(frame_stride, 1)
+    return max(int(round(video_fps / sample_fps)), 1)
+
+
+def target_size(width: int, height: int, size: Optional[Tuple[int, int]] = None, downscale: int = 1) -> Tuple[int, int]:
+    """Get the size frames of a video are scaled to.
+
+    Args:
+        width: Width of the video
+        height: Height of the video
+        size: Optional (width, height) to scale to, where one of them can be -1 to keep the aspect ratio
+        downscale: Integer factor to shrink frames by, only used if size is not given
+
+    Returns:
+        Tuple with the width and height of the scaled frames
+    """
+    if size is None:
+        if downscale > 1:
+            return max(width // downscale, 1), max(height // downscale, 1)
+        return width, height
+    target_width, target_height = size
+    if target_width <= 0 and target_height <= 0:
+        return width, height
+    if target_width <= 0:
+        target_width = max(int(round(width * target_height / height)), 1)
+    elif target_height <= 0:
+        target_height = max(int(round(height * target_width / width)), 1)
+    return target_width, target_height
+
+
+def convert_frame(frame: np.ndarray, settings: FrameSourceSettings) -> np.ndarray:
+    """Convert a BGR frame to the pixel format and size in settings, for backends that decode to full size BGR.
+
+    The pixel format is converted before the frame is scaled, like prepare_frame in video_filtering does.
+
+    Args:
+        frame: Frame in BGR order
+        settings: Settings with the pixel format and size to convert to
+
+    Returns:
+        Converted frame
+    """
+    if settings.size is None and settings.downscale <= 1 and settings.pixel_format == "bgr24":
+        return frame
+    if settings.pixel_format == "rgb24":
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # pylint: disable=no-member
+    elif settings.pixel_format == "gray":
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # pylint: disable=no-member
+    height, width = frame.shape[:2]
+    size = target_size(width, height, settings.size, settings.downscale)
+    if size == (width, height):
+        return frame
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)  # pylint: disable=no-member
+
+
+def _iter_opencv_frames(src_file: pathlib.Path, settings: FrameSourceSettings) -> Iterator[Tuple[int, np.ndarray]]:
+    """Decode a video with OpenCV, only grabbing the frames that are skipped.
+
+    Args:
+        src_file: Path to video file
+        settings: Decoding settings
+
+    Yields:
+        Tuple with the number of the frame in the video, starting from 1, and the frame
+    """
+    params = []
+    if settings.threads > 0:
+        params += [cv2.CAP_PROP_N_THREADS, settings.threads]  # pylint: disable=no-member
+    if settings.hw_accel:
+        params += [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]  # pylint: disable=no-member
+    reader = cv2.VideoCapture(str(src_file), cv2.CAP_ANY, params)  # pylint: disable=no-member
+    try:
+        frame_stride = calculate_frame_stride(
+            reader.get(cv2.CAP_PROP_FPS) if settings.sample_fps is not None else 0,  # pylint: disable=no-member
+            frame_stride=settings.frame_stride,
+            sample_fps=settings.sample_fps,
+        )
+        frame_number = 1
+        while True:
+            success, frame = reader.read()
+            if not success:
+                break
+            yield frame_number, convert_frame(frame, settings)
+            for _ in range(frame_stride - 1):
+                if not reader.grab():
+                    return
+            frame_number += frame_stride
+    finally:
+        reader.release()
+
+
+def _iter_pyav_frames(src_file: pathlib.Path, settings: FrameSourceSettings) -> Iterator[Tuple[int, np.ndarray]]:
+    """Decode a video with PyAV using threaded decoding, scaling and converting frames with swscale.
+
+    Args:
+        src_file: Path to video file
+        settings: Decoding settings
+
+    Yields:
+        Tuple with the number of the frame in the video, starting from 1, and the frame
+
+    Raises:
+        ImportError: If PyAV is not installed
+    """
+    try:
+        import av  # pylint: disable=import-outside-toplevel,import-error
+    except ImportError as err:
+        raise ImportError("The pyav decode backend needs PyAV, install it with pip install av") from err
+
+    options = {"hwaccel": "auto"} if settings.hw_accel else {}
+    with av.open(str(src_file), options=options) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        if settings.threads > 0:
+            stream.thread_count = settings.threads
+        video_fps = float(stream.average_rate or 0) if settings.sample_fps is not None else 0
+        frame_stride = calculate_frame_stride(
+            video_fps, frame_stride=settings.frame_stride, sample_fps=settings.sample_fps
+        )
+        width, height = target_size(
+            stream.codec_context.width, stream.codec_context.height, settings.size, settings.downscale
+        )
+        for frame_ind, frame in enumerate(container.decode(stream)):
+            if frame_ind % frame_stride == 0:
+                yield frame_ind + 1, frame.to_ndarray(
+                    format=settings.pixel_format, width=width, height=height, interpolation="AREA"
+                )
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_has_fps_mode(ffmpeg: str = "ffmpeg") -> bool:
+    """Check once per executable if ffmpeg has the -fps_mode option from its version.
+
+    Development builds, whose version is not a release number, are assumed to have it.
+
+    Args:
+        ffmpeg: ffmpeg executable
+
+    Returns:
+        True if ffmpeg has -fps_mode, False if it only has -vsync or its version can not be read
+    """
+    try:
+        # Only asks the configured ffmpeg executable for its version, without a shell
+        result = subprocess.run([ffmpeg, "-version"], capture_output=True, check=True)  # nosec B603
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    match = re.match(r"ffmpeg version n?(\d+)\.(\d+)", result.stdout.decode(errors="replace"))
+    return match is None or (int(match[1]), int(match[2])) >= FFMPEG_FPS_MODE_VERSION
+
+
+def ffmpeg_frames_command(
+    src_file: pathlib.Path, settings: FrameSourceSettings, frame_stride: int, size: Tuple[int, int]
+) -> List[str]:
+    """Build the ffmpeg command writing the sampled and scaled frames of a video as raw video to stdout.
+
+    Args:
+        src_file: Path to video file
+        settings: Decoding settings
+        frame_stride: Number of frames to step between each sampled frame
+        size: Width and height to scale frames to
+
+    Returns:
+        ffmpeg command
+    """
+    command = [settings.ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin"]
+    if settings.threads > 0:
+        command += ["-threads", str(settings.threads)]
+    if settings.hw_accel:
+        command += ["-hwaccel", "auto"]
+    command += ["-i", str(src_file), "-an", "-sn"]
+    filters = []
+    if frame_stride > 1:
+        filters.append(f"select=not(mod(n\\,{frame_stride}))")
+    filters.append(f"scale={size[0]}:{size[1]}:flags=area")
+    sync_option = "-fps_mode" if ffmpeg_has_fps_mode(settings.ffmpeg) else "-vsync"
+    command += ["-vf", ",".join(filters), sync_option, "passthrough"]
+    command += ["-f", "rawvideo", "-pix_fmt", settings.pixel_format, "-"]
+    return command
+
+
+def _iter_ffmpeg_frames(src_file: pathlib.Path, settings: FrameSourceSettings) -> Iterator[Tuple[int, np.ndarray]]:
+    """Decode a video in an ffmpeg process that scales and converts the frames before piping them as raw video.
+
+    The video header is read with OpenCV to know the size and frame rate of the video.
+
+    Args:
+        src_file: Path to video file
+        settings: Decoding settings
+
+    Yields:
+        Tuple with the number of the frame in the video, starting from 1, and the frame
+
+    Raises:
+        RuntimeError: If ffmpeg fails
+    """
+    cap = cv2.VideoCapture(str(src_file))  # pylint: disable=no-member
+    try:
+        video_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))  # pylint: disable=no-member
+        video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))  # pylint: disable=no-member
+        video_fps = cap.get(cv2.CAP_PROP_FPS)  # pylint: disable=no-member
+    finally:
+        cap.release()
+    if video_width <= 0 or video_height <= 0:
+        raise RuntimeError(f"Could not read the frame size of video {src_file}")
+    frame_stride = calculate_frame_stride(video_fps, frame_stride=settings.frame_stride, sample_fps=settings.sample_fps)
+    width, height = target_size(video_width, video_height, settings.size, settings.downscale)
+    channels = PIXEL_FORMATS[settings.pixel_format]
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    frame_bytes = width * height * channels
+
+    # The argument list is built by ffmpeg_frames_command and run without a shell
+    with subprocess.Popen(  # nosec B603
+        ffmpeg_frames_command(src_file, settings, frame_stride, (width, height)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    ) as process:
+        try:
+            frame_number = 1
+            while True:
+                data = process.stdout.read(frame_bytes)
+                if len(data) < frame_bytes:
+                    break
+                yield frame_number, np.frombuffer(data, dtype=np.uint8).reshape(shape)
+                frame_number += frame_stride
+            message = process.stderr.read().decode(errors="replace").strip()
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {message}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+
+# Functions decoding a video by backend name, other backends can be added with the same signature
+BACKENDS: Dict[str, Callable[[pathlib.Path, FrameSourceSettings], Iterator[Tuple[int, np.ndarray]]]] = {
+    OPENCV_BACKEND: _iter_opencv_frames,
+    PYAV_BACKEND: _iter_pyav_frames,
+    FFMPEG_BACKEND: _iter_ffmpeg_frames,
+}
+
+
+def available_backends(ffmpeg: str = "ffmpeg") -> List[str]:
+    """Find the backends that can be used on this machine.
+
+    Args:
+        ffmpeg: ffmpeg executable used by the ffmpeg backend
+
+    Returns:
+        Names of the usable backends
+    """
+    available = {
+        OPENCV_BACKEND: True,
+        PYAV_BACKEND: importlib.util.find_spec("av") is not None,
+        FFMPEG_BACKEND: shutil.which(ffmpeg) is not None,
+    }
+    return [backend for backend in BACKENDS if available.get(backend, True)]
+
+
+def iter_frames(
+    src_file: pathlib.Path, settings: Optional[FrameSourceSettings] = None
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Lazily decode the sampled frames of a video one at a time together with their frame numbers.
+
+    Args:
+        src_file: Path to video file
+        settings: Decoding settings, defaults to every frame at full size in BGR order with OpenCV
+
+    Returns:
+        Iterator of tuples with the number of the frame in the video, starting from 1, and the frame
+
+    Raises:
+        ValueError: If the backend or pixel format is unknown
+    """
+    if settings is None:
+        settings = FrameSourceSettings()
+    if settings.backend not in BACKENDS:
+        raise ValueError(f"Unknown decode backend {settings.backend}, choose from {', '.join(BACKENDS)}")
+    if settings.pixel_format not in PIXEL_FORMATS:
+        raise ValueError(f"Unknown pixel format {settings.pixel_format}, choose from {', '.join(PIXEL_FORMATS)}")
+    return BACKENDS[settings.backend](src_file, settings)
@@ -0,0 +1,141 @@
+"""This module finds the classes used in a label field of a dataset with database side aggregations."""
+import logging
+from typing import Any, Dict, List, Optional
+
+from fiftyone import ViewField as F
+
+# Key in dataset.info where discovered classes and label field versions are stored
+CLASSES_INFO_KEY = "wai_label_classes"
+VERSIONS_INFO_KEY = "wai_label_versions"
+
+# Label types holding a list of labels, mapped to the attribute with the list
+LABEL_LIST_ATTRIBUTES = {
+    "Classifications": "classifications",
+    "Detections": "detections",
+    "Keypoints": "keypoints",
+    "Polylines": "polylines",
+    "TemporalDetections": "detections",
+}
+
+
+def label_path(collection: Any, label_field: str) -> Optional[str]:
+    """Get the path to the label names of a label field, e.g. frames.ground_truth.classifications.label.
+
+    Args:
+        collection: FiftyOne dataset or view
+        label_field: Label field, prefixed with frames. for frame level fields
+
+    Returns:
+        Path to the label names, or None if the field does not exist
+    """
+    field = collection.get_field(label_field)
+    if field is None:
+        return None
+    document_type = getattr(field, "document_type", None)
+    list_attribute = LABEL_LIST_ATTRIBUTES.get(getattr(document_type, "__name__", ""))
+    if list_attribute is not None:
+        return f"{label_field}.{list_attribute}.label"
+    return f"{label_field}.label"
+
+
+def label_field_version(dataset: Any, label_field: str) -> Dict[str, Any]:
+    """Get the version of a label field, which changes when labels are written or samples are added.
+
+    The version counts the writes of this package, see bump_label_field_version, and the samples. When FiftyOne
+    tracks the last_modified_at of samples and frames, as from version 0.23, it also holds the latest
+    modification of the samples, or of the frames for frame level fields, so labels written by other tools
+    such as the App change it too. With older versions of FiftyOne those writes are not seen, and cached
+    classes must be refreshed after them.
+
+    Args:
+        dataset: FiftyOne dataset
+        label_field: Label field, prefixed with frames. for frame level fields
+
+    Returns:
+        Version of the label field
+    """
+    versions = dataset.info.get(VERSIONS_INFO_KEY, {})
+    version: Dict[str, Any] = {"labels": int(versions.get(label_field, 0)), "samples": dataset.count()}
+    modified_path = "frames.last_modified_at" if label_field.startswith("frames.") else "last_modified_at"
+    if dataset.get_field(modified_path) is not None:
+        last_modified = dataset.max(modified_path)
+        version["modified"] = None if last_modified is None else last_modified.isoformat()
+    return version
+
+
+def bump_label_field_version(dataset: Any, label_field: str) -> None:
+    """Mark that the labels in a label field have changed, so cached classes of the field are not used.
+
+    Args:
+        dataset: FiftyOne dataset
+        label_field: Label field, prefixed with frames. for frame level fields
+    """
+    versions = dict(dataset.info.get(VERSIONS_INFO_KEY, {}))
+    versions[label_field] = int(versions.get(label_field, 0)) + 1
+    dataset.info[VERSIONS_INFO_KEY] = versions
+    dataset.save()
+
+
+def discover_classes(
+    collection: Any, label_field: str = "frames.ground_truth", use_cache: bool = True, refresh: bool = False
+) -> List[str]:
+    """Find the classes used in a label field with a single distinct aggregation in the database.
+
+    With use_cache the classes are cached in dataset.info together with the label field version, and reused
+    as long as the version is unchanged. Only use the cache for datasets, since the samples of a view such as
+    a random subset may differ per call.
+
+    Args:
+        collection: FiftyOne dataset or view
+        label_field: Label field, prefixed with frames. for frame level fields
+        use_cache: Read and store classes in the cache, collection must be a dataset
+        refresh: Aggregate the classes even if there is a valid cached entry
+
+    Returns:
+        Sorted list of class names
+    """
+    logger = logging.getLogger(__name__)
+
+    path = label_path(collection, label_field)
+    if path is None:
+        logger.warning("Label field %s does not exist, no classes found", label_field)
+        return []
+
+    if use_cache:
+        version = label_field_version(collection, label_field)
+        cached = collection.info.get(CLASSES_INFO_KEY, {}).get(label_field)
+        if not refresh and cached is not None and cached["version"] == version:
+            logger.debug("Using cached classes for label field %s", label_field)
+            return list(cached["classes"])
+
+    classes = sorted(label for label in collection.distinct(path) if label is not None)
+
+    if use_cache:
+        cache = dict(collection.info.get(CLASSES_INFO_KEY, {}))
+        cache[label_field] = {"version": version, "classes": classes}
+        collection.info[CLASSES_INFO_KEY] = cache
+        collection.save()
+    return classes
+
+
+def first_frame_labels(
+    collection: Any, label_field: str = "frames.ground_truth", default: str = "nothing"
+) -> List[str]:
+    """Get the first label in a frame level label field of each sample with a single database side projection.
+
+    Args:
+        collection: FiftyOne dataset or view
+        label_field: Frame level label field, prefixed with frames.
+        default: Label of samples without any labelled frames
+
+    Returns:
+        Label of each sample in the order of the collection
+    """
+    path = label_path(collection, label_field)
+    if path is None:
+        return [default] * collection.count()
+    frame_path = path[len("frames.") :]
+    first_label = F("frames").map(F(frame_path)).filter(F() != None)[0]  # pylint: disable=singleton-comparison
+    if frame_path != f"{label_field[len('frames.'):]}.label":
+        first_label = first_label[0]
+    return [default if label is None else label for label in collection.values(first_label)]
@@ -0,0 +1,241 @@
+"""This module stores labels as frame spans per sample and answers frame queries without per-frame documents."""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import fiftyone as fo
+import numpy as np
+
+from wai_data_tools.utils import data, label_classes
+
+# Sample level field with the labelled spans of each video as TemporalDetections
+SPANS_FIELD = "ground_truth_spans"
+
+# Frame level field with one Classifications per labelled frame, as written before spans were stored
+FRAMES_FIELD = "frames.ground_truth"
+
+
+def label_field(collection: Any) -> str:
+    """Get the field with the labels of a dataset, preferring spans over frame labels.
+
+    Args:
+        collection: FiftyOne dataset or view
+
+    Returns:
+        SPANS_FIELD if the dataset has it, else FRAMES_FIELD
+    """
+    return SPANS_FIELD if collection.get_field(SPANS_FIELD) is not None else FRAMES_FIELD
+
+
+def first_labels(collection: Any, default: str = "nothing") -> List[str]:
+    """Get the label of the first labelled frame of each sample, from spans or from frame labels.
+
+    Args:
+        collection: FiftyOne dataset or view
+        default: Label of samples without any labels
+
+    Returns:
+        Label of each sample in the order of the collection
+    """
+    if label_field(collection) == FRAMES_FIELD:
+        return label_classes.first_frame_labels(collection, label_field=FRAMES_FIELD, default=default)
+    # Spans are stored sorted on their first frame
+    return [labels[0] if labels else default for labels in collection.values(f"{SPANS_FIELD}.detections.label")]
+
+
+def to_temporal_detections(spans: Sequence[Tuple[int, int, str]]) -> fo.TemporalDetections:
+    """Convert spans of a sample to a label for SPANS_FIELD.
+
+    Args:
+        spans: First frame number, last frame number and label of each span, frames are numbered from 1
+
+    Returns:
+        Temporal detections sorted on their first frame
+    """
+    return fo.TemporalDetections(
+        detections=[
+            fo.TemporalDetection(label=label, support=[int(first), int(last)]) for first, last, label in sorted(spans)
+        ]
+    )
+
+
+class LabelTimeline:
+    """Interval index over the labelled spans of many samples.
+
+    Spans are kept in flat arrays sorted on sample and first frame, with the spans of each sample in a
+    contiguous slice, so queries are vectorized over spans and frames. Frames are numbered from 1 and
+    the last frame of a span is included. Overlapping spans are allowed, in which case the span that
+    starts first gives the label of a frame.
+    """
+
+    def __init__(
+        self,
+        sample_ids: Sequence[str],
+        first_frames: Sequence[int],
+        last_frames: Sequence[int],
+        labels: Sequence[str],
+    ) -> None:
+        """Build the index from one entry per span.
+
+        Args:
+            sample_ids: Sample of each span
+            first_frames: First frame number of each span
+            last_frames: Last frame number of each span
+            labels: Label of each span
+        """
+        span_samples = np.asarray(sample_ids, dtype=object).astype(str)
+        self.sample_ids, sample_inds = np.unique(span_samples, return_inverse=True)
+        self.classes, label_codes = np.unique(np.asarray(labels, dtype=object).astype(str), return_inverse=True)
+        first_frames = np.asarray(first_frames, dtype=np.int64)
+        order = np.lexsort((first_frames, sample_inds))
+        self.first_frames = first_frames[order]
+        self.last_frames = np.asarray(last_frames, dtype=np.int64)[order]
+        self.label_codes = label_codes.reshape(-1)[order]
+        self.span_samples = sample_inds.reshape(-1)[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(self.span_samples, minlength=len(self.sample_ids)))])
+        self._sample_inds = {sample_id: ind for ind, sample_id in enumerate(self.sample_ids.tolist())}
+
+    @classmethod
+    def from_collection(cls, collection: Any, field: str = SPANS_FIELD) -> "LabelTimeline":
+        """Build the index from the spans stored in a dataset with a single projection.
+
+        Args:
+            collection: FiftyOne dataset or view
+            field: Sample level TemporalDetections field
+
+        Returns:
+            Index over the spans of all samples in the collection
+        """
+        sample_ids, supports, labels = collection.values(
+            ["id", f"{field}.detections.support", f"{field}.detections.label"]
+        )
+        span_samples, first_frames, last_frames, span_labels = [], [], [], []
+        for sample_id, sample_supports, sample_labels in zip(sample_ids, supports, labels):
+            for (first, last), label in zip(sample_supports or [], sample_labels or []):
+                span_samples.append(sample_id)
+                first_frames.append(first)
+                last_frames.append(last)
+                span_labels.append(label)
+        return cls(span_samples, first_frames, last_frames, span_labels)
+
+    def __len__(self) -> int:
+        """Get the number of spans.
+
+        Returns:
+            Number of spans
+        """
+        return len(self.first_frames)
+
+    def _sample_slice(self, sample_id: str) -> slice:
+        """Get the positions of the spans of a sample.
+
+        Args:
+            sample_id: ID of the sample
+
+        Returns:
+            Slice of the span arrays, empty if the sample has no spans
+        """
+        ind = self._sample_inds.get(sample_id)
+        if ind is None:
+            return slice(0, 0)
+        return slice(self.offsets[ind], self.offsets[ind + 1])
+
+    def labels_at(self, sample_id: str, frame_number: int) -> List[str]:
+        """Get all labels of a frame.
+
+        Args:
+            sample_id: ID of the sample
+            frame_number: Frame number, numbered from 1
+
+        Returns:
+            Labels of the spans containing the frame, in the order the spans start
+        """
+        spans = self._sample_slice(sample_id)
+        covering = (self.first_frames[spans] <= frame_number) & (self.last_frames[spans] >= frame_number)
+        return self.classes[self.label_codes[spans][covering]].tolist()
+
+    def label_of_frames(
+        self, sample_id: str, frame_numbers: Sequence[int], default: Optional[str] = None
+    ) -> np.ndarray:
+        """Get the label of many frames of a sample at once.
+
+        Args:
+            sample_id: ID of the sample
+            frame_numbers: Frame numbers, numbered from 1
+            default: Label of frames outside all spans
+
+        Returns:
+            Label of each frame, from the first span containing it
+        """
+        frame_numbers = np.asarray(frame_numbers, dtype=np.int64)
+        spans = self._sample_slice(sample_id)
+        covering = (self.first_frames[spans, None] <= frame_numbers[None, :]) & (
+            self.last_frames[spans, None] >= frame_numbers[None, :]
+        )
+        frame_labels = np.full(len(frame_numbers), default, dtype=object)
+        if covering.size:
+            is_labelled = covering.any(axis=0)
+            first_span = covering.argmax(axis=0)
+            frame_labels[is_labelled] = self.classes[self.label_codes[spans][first_span[is_labelled]]]
+        return frame_labels
+
+    def _label_matches(self, label: str) -> np.ndarray:
+        """Find the spans with a label.
+
+        Args:
+            label: Label to look for
+
+        Returns:
+            Mask of the spans with the label
+        """
+        code = np.searchsorted(self.classes, label)
+        if code >= len(self.classes) or self.classes[code] != label:
+            return np.zeros(len(self), dtype=bool)
+        return self.label_codes == code
+
+    def spans_with_label(self, label: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get the spans with a label.
+
+        Args:
+            label: Label to look for
+
+        Returns:
+            Sample ID, first frame number and last frame number of each span with the label
+        """
+        matches = self._label_matches(label)
+        return self.sample_ids[self.span_samples[matches]], self.first_frames[matches], self.last_frames[matches]
+
+    def frames_with_label(self, label: str) -> Dict[str, np.ndarray]:
+        """Get the frames with a label in each sample.
+
+        Args:
+            label: Label to look for
+
+        Returns:
+            Sorted unique frame numbers with the label for each sample that has any
+        """
+        matches = self._label_matches(label)
+        span_inds, frame_numbers = data.expand_frame_ranges(self.first_frames[matches], self.last_frames[matches] + 1)
+        frame_samples = self.span_samples[matches][span_inds]
+        order = np.lexsort((frame_numbers, frame_samples))
+        frame_samples, frame_numbers = frame_samples[order], frame_numbers[order]
+        is_new = np.ones(len(frame_numbers), dtype=bool)
+        is_new[1:] = (frame_samples[1:] != frame_samples[:-1]) | (frame_numbers[1:] != frame_numbers[:-1])
+        frame_samples, frame_numbers = frame_samples[is_new], frame_numbers[is_new]
+        samples, starts = np.unique(frame_samples, return_index=True)
+        return dict(zip(self.sample_ids[samples].tolist(), np.split(frame_numbers, starts[1:])))
+
+    def expand(self, sample_id: str) -> Dict[int, str]:
+        """Expand the spans of a sample to the label of each labelled frame, for exporters that need frame labels.
+
+        Args:
+            sample_id: ID of the sample
+
+        Returns:
+            Label for each frame number in any span of the sample
+        """
+        spans = self._sample_slice(sample_id)
+        if spans.start == spans.stop:
+            return {}
+        frame_numbers = np.arange(self.first_frames[spans].min(), self.last_frames[spans].max() + 1)
+        frame_labels = self.label_of_frames(sample_id, frame_numbers)
+        is_labelled = frame_labels != None  # pylint: disable=singleton-comparison
+        return dict(zip(frame_numbers[is_labelled].tolist(), frame_labels[is_labelled].tolist()))
@@ -0,0 +1,222 @@
+"""This module keeps the metadata of videos on disk so videos seen before are not probed again by any tool."""
+import collections
+import concurrent.futures
+import logging
+import os
+import pathlib
+import sqlite3
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from wai_data_tools.utils import transcoding
+
+# Index shared by all datasets and tools unless another path is given
+DEFAULT_INDEX_PATH = pathlib.Path.home() / ".cache" / "wai_data_tools" / "media_index.sqlite"
+
+# Metadata stored for each video, named like the fields of a FiftyOne VideoMetadata
+METADATA_FIELDS = (
+    "size_bytes",
+    "mime_type",
+    "frame_width",
+    "frame_height",
+    "frame_rate",
+    "total_frame_count",
+    "duration",
+    "encoding_str",
+)
+
+# Number of probed videos stored in the index per transaction
+WRITE_BATCH_SIZE = 100
+
+
+class MediaIndex:
+    """SQLite backed index of video metadata.
+
+    Entries are keyed on the resolved file path, and are only returned if the size and modification time of
+    the file still match the entry, so checking the index only needs a stat of the file.
+    """
+
+    def __init__(self, db_path: pathlib.Path = DEFAULT_INDEX_PATH) -> None:
+        """Open or create the index database.
+
+        Args:
+            db_path: Path to SQLite file to store metadata in, its folder is created if missing
+        """
+        self.db_path = db_path
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(db_path))
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS media (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size_bytes INTEGER,
+                mime_type TEXT,
+                frame_width INTEGER,
+                frame_height INTEGER,
+                frame_rate REAL,
+                total_frame_count INTEGER,
+                duration REAL,
+                encoding_str TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    def __enter__(self) -> "MediaIndex":
+        """Enter context.
+
+        Returns:
+            The index itself
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the index when leaving context.
+
+        Args:
+            *exc_info: Exception information, ignored
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        self.connection.close()
+
+    @staticmethod
+    def _file_key(filepath: pathlib.Path) -> Tuple[str, int, int]:
+        """Get the values identifying the current version of a file.
+
+        Args:
+            filepath: Path to file
+
+        Returns:
+            Tuple with resolved path, size and modification time in nanoseconds
+        """
+        stat = filepath.stat()
+        return str(filepath.resolve()), stat.st_size, stat.st_mtime_ns
+
+    def get(self, filepath: pathlib.Path) -> Optional[Dict[str, Any]]:
+        """Get the metadata of a video if it has not changed since it was stored.
+
+        Args:
+            filepath: Path to video file
+
+        Returns:
+            Metadata with the fields in METADATA_FIELDS, or None if there is no valid entry or the file is missing
+        """
+        try:
+            path, size, mtime_ns = self._file_key(filepath)
+        except FileNotFoundError:
+            return None
+        # Only the constant column names are formatted into the query, values are bound as parameters
+        columns = ", ".join(METADATA_FIELDS)
+        query = f"SELECT {columns} FROM media WHERE path = ? AND size = ? AND mtime_ns = ?"  # nosec B608
+        row = self.connection.execute(query, (path, size, mtime_ns)).fetchone()
+        return None if row is None else dict(zip(METADATA_FIELDS, row))
+
+    def put_many(self, entries: List[Tuple[pathlib.Path, Dict[str, Any]]]) -> None:
+        """Store the metadata of several videos in one transaction.
+
+        Args:
+            entries: Tuples with the path to a video file and its metadata with the fields in METADATA_FIELDS
+        """
+        rows = [
+            (*self._file_key(filepath), *(metadata.get(field) for field in METADATA_FIELDS), time.time())
+            for filepath, metadata in entries
+        ]
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO media VALUES ({', '.join('?' * (len(METADATA_FIELDS) + 4))})", rows
+        )
+        self.connection.commit()
+
+    def put(self, filepath: pathlib.Path, metadata: Dict[str, Any]) -> None:
+        """Store the metadata of a video.
+
+        Args:
+            filepath: Path to video file
+            metadata: Metadata of the video with the fields in METADATA_FIELDS
+        """
+        self.put_many([(filepath, metadata)])
+
+    def prune(self) -> int:
+        """Remove entries for files that no longer exist or have changed size or modification time.
+
+        Returns:
+            Number of removed entries
+        """
+        stale_paths = []
+        for path, size, mtime_ns in self.connection.execute("SELECT path, size, mtime_ns FROM media").fetchall():
+            filepath = pathlib.Path(path)
+            if not filepath.is_file():
+                stale_paths.append((path,))
+            else:
+                stat = filepath.stat()
+                if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                    stale_paths.append((path,))
+        self.connection.executemany("DELETE FROM media WHERE path = ?", stale_paths)
+        self.connection.commit()
+        return len(stale_paths)
+
+
+def _safe_video_metadata(filepath: pathlib.Path) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Read the metadata of a video and return any error as a message instead of raising it.
+
+    Args:
+        filepath: Path to video file
+
+    Returns:
+        Tuple with the metadata, or None if it failed, and the error message if any
+    """
+    try:
+        return transcoding.video_metadata(filepath), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def probe_videos(
+    filepaths: List[pathlib.Path], index: Optional[MediaIndex] = None, workers: Optional[int] = None
+) -> Iterator[Tuple[pathlib.Path, Optional[Dict[str, Any]]]]:
+    """Read the metadata of several videos with a pool of threads, reusing and filling an index.
+
+    Only videos without a valid index entry are probed. Reading a video header mostly waits on disk and
+    OpenCV releases the GIL while doing so, so threads are enough to probe videos in parallel. Results are
+    yielded in the same order as filepaths, and a video that can not be read is logged and yielded with None.
+
+    Args:
+        filepaths: Video files to read the metadata of
+        index: Index to read metadata from and store newly probed metadata in
+        workers: Number of videos probed at the same time, defaults to the number of CPU cores
+
+    Yields:
+        Tuple with the video file and its metadata with the fields in METADATA_FIELDS, or None if it failed
+    """
+    logger = logging.getLogger(__name__)
+
+    indexed = [None if index is None else index.get(filepath) for filepath in filepaths]
+    unindexed_files = [filepath for filepath, metadata in zip(filepaths, indexed) if metadata is None]
+    logger.info("Found indexed metadata for %s of %s videos", len(filepaths) - len(unindexed_files), len(filepaths))
+    if not unindexed_files:
+        yield from zip(filepaths, indexed)
+        return
+
+    new_entries = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = collections.deque(executor.submit(_safe_video_metadata, filepath) for filepath in unindexed_files)
+        try:
+            for filepath, metadata in zip(filepaths, indexed):
+                if metadata is None:
+                    metadata, error = futures.popleft().result()
+                    if error is not None:
+                        logger.error("Failed to read metadata of video %s: %s", filepath, error)
+                    elif index is not None:
+                        new_entries.append((filepath, metadata))
+                        if len(new_entries) >= WRITE_BATCH_SIZE:
+                            index.put_many(new_entries)
+                            new_entries = []
+                yield filepath, metadata
+        finally:
+            if index is not None and new_entries:
+                index.put_many(new_entries)
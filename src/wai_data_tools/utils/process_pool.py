@@ -0,0 +1,115 @@
+"""This module runs tasks in a pool of processes that recovers when a worker process dies."""
+import concurrent.futures
+import logging
+import multiprocessing.context
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+# Number of times a task that was running when its pool broke is run again on its own before it fails
+MAX_RETRIES = 2
+
+ResultT = TypeVar("ResultT")
+SafeTask = Callable[..., Tuple[Optional[ResultT], Optional[str]]]
+
+
+def _run_isolated(
+    function: SafeTask,
+    args: Sequence[Any],
+    error: BaseException,
+    initializer: Optional[Callable[[], Any]] = None,
+    mp_context: Optional[multiprocessing.context.BaseContext] = None,
+    max_retries: int = MAX_RETRIES,
+) -> Tuple[Optional[ResultT], Optional[str]]:
+    """Run a task in a process of its own, so a worker that dies again can only have been stopped by this task.
+
+    Args:
+        function: Function returning a tuple with its result and the error message if any
+        args: Arguments of the function
+        error: Error that broke the pool the task was running in
+        initializer: Function run when the worker process starts
+        mp_context: Multiprocessing context to start the worker process with
+        max_retries: Number of times to run the task before it fails
+
+    Returns:
+        Tuple with the result of the task, or None if it failed, and the error message if any
+    """
+    for _ in range(max_retries):
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, initializer=initializer, mp_context=mp_context
+        ) as executor:
+            try:
+                return executor.submit(function, *args).result()
+            except concurrent.futures.process.BrokenProcessPool as err:
+                error = err
+    return None, f"{type(error).__name__}: {error}"
+
+
+def run_tasks(
+    function: SafeTask,
+    tasks: Iterable[Sequence[Any]],
+    workers: int = 1,
+    initializer: Optional[Callable[[], Any]] = None,
+    mp_context: Optional[multiprocessing.context.BaseContext] = None,
+    max_retries: int = MAX_RETRIES,
+) -> Iterator[Tuple[Optional[ResultT], Optional[str]]]:
+    """Run a function on several sets of arguments, optionally spread over a pool of processes.
+
+    The function returns its errors instead of raising them, so only a worker process that dies, for example
+    by running out of memory, breaks the pool. The pool is then replaced and the unfinished tasks are submitted
+    to the new pool, while the task that was being waited for is run again on its own. It fails only after
+    dying max_retries times, so one bad video does not fail the tasks that were queued behind it.
+    Results are yielded in the same order as tasks.
+
+    Args:
+        function: Picklable function returning a tuple with its result and the error message if any
+        tasks: Arguments of each call of the function
+        workers: Number of processes to use. With 1 the tasks are run in the current process.
+        initializer: Function run when each worker process starts
+        mp_context: Multiprocessing context to start worker processes with
+        max_retries: Number of times a task that was running when its pool broke is run again on its own
+
+    Yields:
+        Tuple with the result of each task, or None if it failed, and the error message if any
+    """
+    logger = logging.getLogger(__name__)
+
+    if workers <= 1:
+        for args in tasks:
+            yield function(*args)
+        return
+
+    tasks = list(tasks)
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, mp_context=mp_context
+    )
+    try:
+        futures: List[concurrent.futures.Future] = [executor.submit(function, *args) for args in tasks]
+        for task_ind, args in enumerate(tasks):
+            try:
+                result = futures[task_ind].result()
+            except concurrent.futures.process.BrokenProcessPool as err:
+                executor.shutdown(wait=True)
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers, initializer=initializer, mp_context=mp_context
+                )
+                unfinished = [
+                    later_ind
+                    for later_ind in range(task_ind + 1, len(tasks))
+                    if isinstance(futures[later_ind].exception(), concurrent.futures.process.BrokenProcessPool)
+                ]
+                logger.warning("A worker process died, resubmitting %s unfinished tasks to a new pool", len(unfinished))
+                for later_ind in unfinished:
+                    futures[later_ind] = executor.submit(function, *tasks[later_ind])
+                result = _run_isolated(function, args, err, initializer, mp_context, max_retries)
+            yield result
+    finally:
+        executor.shutdown(wait=True)
@@ -1,10 +1,27 @@
 """This module helps with reading excel into dataframe."""
+import hashlib
+import importlib.util
 import logging
+import os
+import tempfile
 from pathlib import Path
-from typing import Dict, Union
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
+# Version of the cached label tables, bump it when the way sheets are parsed or stacked changes
+LABEL_CACHE_VERSION = 2
+
+# Dtypes of the label columns used by this package, other text columns are stored as strings
+LABEL_COLUMN_DTYPES = {
+    "filename": "string",
+    "label": "string",
+    "start": "float64",
+    "end": "float64",
+    "folder": "category",
+}
+
 
 def read_excel_to_dataframe(
     excel_filepath: Path,
@@ -23,10 +40,49 @@ def read_excel_to_dataframe(
     return pd.read_excel(excel_filepath, sheet_name=None)
 
 
+def read_excel_sheets(
+    excel_filepath: Path, sheet_names: Optional[Sequence[str]] = None
+) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """Read the sheets of an excel file one at a time.
+
+    Args:
+        excel_filepath: Path to excel file path
+        sheet_names: Names of the sheets to read, defaults to all sheets
+
+    Yields:
+        Tuple with the name and the content of each sheet
+    """
+    with pd.ExcelFile(excel_filepath) as workbook:
+        for sheet_name in workbook.sheet_names if sheet_names is None else sheet_names:
+            yield sheet_name, workbook.parse(sheet_name)
+
+
+def iter_sheet_rows(
+    dataframe_dict: Union[Mapping[str, pd.DataFrame], Iterable[Tuple[str, pd.DataFrame]]]
+) -> Iterator[pd.DataFrame]:
+    """Yield the rows of each dataframe in a dictionary with the dictionary key added as an extra column.
+
+    Streaming variant of stack_rows_from_dataframe_dictionary for callers that handle one sheet at a time.
+    The dataframes in the dictionary are not modified.
+
+    Args:
+        dataframe_dict: Dictionary with dataframes, or an iterable of key and dataframe pairs such as
+                        the one returned by read_excel_sheets
+
+    Yields:
+        Rows of each dataframe with the key in the folder column
+    """
+    items = dataframe_dict.items() if isinstance(dataframe_dict, Mapping) else dataframe_dict
+    for sheet_name, sheet_content in items:
+        # Column for the sheet the data was in the file is added for traceability
+        yield sheet_content.assign(folder=sheet_name)
+
+
 def stack_rows_from_dataframe_dictionary(dataframe_dict: Dict[str, pd.DataFrame]) -> pd.DataFrame:
     """Stacks the rows from dataframes in a dictionary to one single dataframe.
 
-    The dictionary key will be added as an extra row to the dataframe.
+    The dictionary key will be added as an extra categorical column to the dataframe, and the dataframes
+    in the dictionary are not modified. All dataframes are stacked with a single concatenation.
     Typically used for the content from excel/google sheets documents with multiple sheets.
 
     Args:
@@ -38,9 +94,132 @@ def stack_rows_from_dataframe_dictionary(dataframe_dict: Dict[str, pd.DataFrame]
     logger = logging.getLogger(__name__)
 
     logger.info("Merging all rows from dataframes in dictionary to one dataframe")
-    merged_dataframe = pd.DataFrame()
-    for sheet_name, sheet_content in dataframe_dict.items():
-        # Column for the sheet the data was in the file is added for traceability
-        sheet_content["folder"] = sheet_name
-        merged_dataframe = pd.concat([merged_dataframe, sheet_content])
+    if not dataframe_dict:
+        return pd.DataFrame({"folder": pd.Categorical([])})
+    merged_dataframe = pd.concat(list(dataframe_dict.values()))
+    # Column for the sheet the data was in the file is added for traceability
+    sheet_lengths = [len(sheet_content) for sheet_content in dataframe_dict.values()]
+    merged_dataframe["folder"] = pd.Categorical.from_codes(
+        np.repeat(np.arange(len(sheet_lengths)), sheet_lengths), categories=pd.Index(list(dataframe_dict), dtype=object)
+    )
     return merged_dataframe
+
+
+def parquet_engine_available() -> bool:
+    """Check if a Parquet engine for pandas is installed.
+
+    Returns:
+        True if pyarrow or fastparquet can be imported
+    """
+    return any(importlib.util.find_spec(name) is not None for name in ("pyarrow", "fastparquet"))
+
+
+def workbook_hash(excel_filepath: Path) -> str:
+    """Hash the content of a workbook.
+
+    Args:
+        excel_filepath: Path to excel file
+
+    Returns:
+        Hex digest of the hash
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with excel_filepath.open(mode="rb") as file_stream:
+        for block in iter(lambda: file_stream.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def label_cache_path(excel_filepath: Path, content_hash: str) -> Path:
+    """Get the path of the cached label table of a workbook, a hidden Parquet file next to the workbook.
+
+    Args:
+        excel_filepath: Path to excel file
+        content_hash: Hash of the content of the workbook, see workbook_hash
+
+    Returns:
+        Path to Parquet file
+    """
+    return excel_filepath.with_name(f".{excel_filepath.name}.{content_hash}.v{LABEL_CACHE_VERSION}.parquet")
+
+
+def _typed_label_table(df_labels: pd.DataFrame) -> pd.DataFrame:
+    """Give a stacked label table explicit column types, so it can be stored as Parquet.
+
+    Args:
+        df_labels: Stacked label table
+
+    Returns:
+        Label table with the dtypes in LABEL_COLUMN_DTYPES and string dtype for other text columns
+    """
+    dtypes = {column: dtype for column, dtype in LABEL_COLUMN_DTYPES.items() if column in df_labels.columns}
+    dtypes.update(
+        {column: "string" for column in df_labels.columns if df_labels[column].dtype == object and column not in dtypes}
+    )
+    df_labels = df_labels.astype(dtypes).reset_index(drop=True)
+    for column in df_labels.select_dtypes("category").columns:
+        # Parquet reads categories back as strings, so give a freshly parsed table the same categories
+        df_labels[column] = df_labels[column].cat.rename_categories(df_labels[column].cat.categories.astype(str))
+    df_labels.columns = df_labels.columns.astype(str)
+    return df_labels
+
+
+def _write_label_cache(df_labels: pd.DataFrame, cache_path: Path) -> None:
+    """Write a label table to a uniquely named temporary file and rename it, so readers never see a partial file.
+
+    Args:
+        df_labels: Label table to write
+        cache_path: Path to Parquet file
+    """
+    tmp_fd, tmp_name = tempfile.mkstemp(prefix=f"{cache_path.name}.", suffix=".tmp", dir=cache_path.parent)
+    os.close(tmp_fd)
+    tmp_path = Path(tmp_name)
+    try:
+        df_labels.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def read_label_table(
+    excel_filepath: Path, sheet_names: Optional[Sequence[str]] = None, use_cache: bool = True
+) -> pd.DataFrame:
+    """Read the label sheets of a workbook stacked into one table with typed columns.
+
+    With use_cache the stacked table of all sheets is cached as a hidden Parquet file next to the workbook,
+    keyed on the hash of the workbook, and later calls load it instead of parsing the workbook. Cached tables
+    of earlier versions of the workbook are removed. Caching needs a Parquet engine such as pyarrow, without
+    one the workbook is parsed every time.
+
+    Args:
+        excel_filepath: Path to excel file
+        sheet_names: Names of the sheets to read, defaults to all sheets
+        use_cache: Read and store the stacked table in the cache
+
+    Returns:
+        Rows of the sheets, with the sheet name of each row in the folder column
+    """
+    logger = logging.getLogger(__name__)
+
+    if use_cache and not parquet_engine_available():
+        logger.warning("Not caching label table of %s, install pyarrow to cache it", excel_filepath.name)
+        use_cache = False
+    if not use_cache:
+        logger.info("Reading excel datafile %s to dataframe", excel_filepath.name)
+        content = pd.read_excel(excel_filepath, sheet_name=None if sheet_names is None else list(sheet_names))
+        return _typed_label_table(stack_rows_from_dataframe_dictionary(dataframe_dict=content))
+
+    cache_path = label_cache_path(excel_filepath, workbook_hash(excel_filepath))
+    if cache_path.is_file():
+        logger.info("Reading cached label table %s", cache_path.name)
+        df_labels = pd.read_parquet(cache_path)
+    else:
+        df_labels = _typed_label_table(
+            stack_rows_from_dataframe_dictionary(dataframe_dict=read_excel_to_dataframe(excel_filepath))
+        )
+        for stale_path in excel_filepath.parent.glob(f".{excel_filepath.name}.*.parquet"):
+            stale_path.unlink(missing_ok=True)
+        _write_label_cache(df_labels, cache_path)
+    if sheet_names is not None:
+        df_labels = df_labels[df_labels["folder"].isin(list(sheet_names))].reset_index(drop=True)
+    return df_labels
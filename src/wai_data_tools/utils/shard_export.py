@@ -0,0 +1,456 @@
+"""This module packs exported frames into tar shards with an index, and streams them back for training."""
+import collections
+import concurrent.futures
+import io
+import json
+import logging
+import math
+import os
+import pathlib
+import random
+import tarfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from wai_data_tools.utils import frame_export, frame_source, process_pool
+
+# Index of an export, listing the classes and the shards of each split
+INDEX_FILENAME = "shards.json"
+INDEX_VERSION = 1
+
+DEFAULT_SAMPLES_PER_SHARD = 5000
+DEFAULT_SHUFFLE_BUFFER = 1000
+
+
+class ShardWriter:
+    """Writes samples to numbered tar shards holding at most samples_per_shard samples each.
+
+    Each sample is stored as consecutive tar members named {key}.{extension}, the layout read by iter_shard
+    and by WebDataset. A shard is written under a temporary name and only gets its final name once complete,
+    so an interrupted export never leaves a truncated shard behind.
+    """
+
+    def __init__(self, dst_dir: pathlib.Path, prefix: str, samples_per_shard: int = DEFAULT_SAMPLES_PER_SHARD) -> None:
+        """Prepare writing shards.
+
+        Args:
+            dst_dir: Folder to write the shards to, created if missing
+            prefix: Start of the shard filenames, followed by the shard number
+            samples_per_shard: Max number of samples in each shard
+        """
+        self.dst_dir = dst_dir
+        self.prefix = prefix
+        self.samples_per_shard = samples_per_shard
+        self.shards: List[Dict[str, Any]] = []
+        self._tar: Optional[tarfile.TarFile] = None
+        self._tmp_path: Optional[pathlib.Path] = None
+        self._n_samples = 0
+        dst_dir.mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self) -> "ShardWriter":
+        """Enter context.
+
+        Returns:
+            The writer itself
+        """
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        """Finish the last shard when leaving context, or remove it if an error occurred.
+
+        Args:
+            exc_type: Type of the exception raised in the context, if any
+            *exc_info: Exception value and traceback, ignored
+        """
+        if exc_type is None:
+            self.close()
+        elif self._tar is not None:
+            self._tar.close()
+            self._tmp_path.unlink(missing_ok=True)
+            self._tar = None
+
+    def _shard_path(self, shard_number: int) -> pathlib.Path:
+        """Get the final path of a shard.
+
+        Args:
+            shard_number: Number of the shard, starting from 0
+
+        Returns:
+            Path to the shard
+        """
+        return self.dst_dir / f"{self.prefix}-{shard_number:06d}.tar"
+
+    def write(self, key: str, files: Dict[str, bytes]) -> None:
+        """Add a sample to the current shard, starting a new shard when the current one is full.
+
+        Args:
+            key: Unique key of the sample without dots
+            files: Content of each file of the sample by extension
+        """
+        if self._tar is not None and self._n_samples >= self.samples_per_shard:
+            self._finish_shard()
+        if self._tar is None:
+            self._tmp_path = self._shard_path(len(self.shards)).with_suffix(".tar.tmp")
+            self._tar = tarfile.open(self._tmp_path, mode="w")  # pylint: disable=consider-using-with
+            self._n_samples = 0
+        for extension, content in files.items():
+            info = tarfile.TarInfo(name=f"{key}.{extension}")
+            info.size = len(content)
+            self._tar.addfile(info, io.BytesIO(content))
+        self._n_samples += 1
+
+    def _finish_shard(self) -> None:
+        """Close the current shard and give it its final name."""
+        self._tar.close()
+        shard_path = self._shard_path(len(self.shards))
+        os.replace(self._tmp_path, shard_path)
+        self.shards.append({"name": shard_path.name, "n_samples": self._n_samples})
+        self._tar = None
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Finish the current shard.
+
+        Returns:
+            Filename and number of samples of each written shard
+        """
+        if self._tar is not None:
+            self._finish_shard()
+        return self.shards
+
+
+def _encode_jpeg(image: np.ndarray, params: List[int]) -> bytes:
+    """Encode an image as JPEG in memory.
+
+    Args:
+        image: Image to encode
+        params: Parameters passed on to cv2.imencode
+
+    Returns:
+        Encoded image
+
+    Raises:
+        OSError: If the image could not be encoded
+    """
+    success, buffer = cv2.imencode(".jpg", image, params)  # pylint: disable=no-member
+    if not success:
+        raise OSError("Could not encode frame as JPEG")
+    return buffer.tobytes()
+
+
+def _encode_video_frames(
+    job: frame_export.VideoExportJob,
+    settings: frame_export.FrameExportSettings,
+    encoder: concurrent.futures.ThreadPoolExecutor,
+    max_pending: int,
+) -> List[Tuple[int, bytes]]:
+    """Decode the frames of a video and encode them as JPEGs in a pool of threads.
+
+    Args:
+        job: Video to encode the frames of
+        settings: Settings for sampling and encoding frames
+        encoder: Threads encoding frames
+        max_pending: Max number of decoded frames waiting to be encoded
+
+    Returns:
+        Frame number and encoded frame of each sampled frame
+    """
+    params = [cv2.IMWRITE_JPEG_QUALITY, settings.jpeg_quality]  # pylint: disable=no-member
+    pending: collections.deque = collections.deque()
+    encoded = []
+    frames = frame_source.iter_frames(pathlib.Path(job.filepath), settings.frame_source_settings())
+    for frame_number, frame in frames:
+        if len(pending) >= max_pending:
+            pending_number, future = pending.popleft()
+            encoded.append((pending_number, future.result()))
+        image = frame_export.resize_frame(frame, settings.size)
+        pending.append((frame_number, encoder.submit(_encode_jpeg, image, params)))
+    encoded.extend((frame_number, future.result()) for frame_number, future in pending)
+    return encoded
+
+
+def export_shard_group(
+    jobs: List[frame_export.VideoExportJob],
+    dst_dir: pathlib.Path,
+    prefix: str,
+    classes: List[str],
+    settings: Optional[frame_export.FrameExportSettings] = None,
+    samples_per_shard: int = DEFAULT_SAMPLES_PER_SHARD,
+    writer_threads: int = 4,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Decode a group of videos one after the other and pack their frames into one series of shards.
+
+    Each frame is stored as {key}.jpg with the encoded frame, {key}.cls with the index of its label in
+    classes and {key}.json with its label, video name and frame number. All frames of a video are encoded
+    before any of them is written, so a video that fails to decode leaves no samples in the shards.
+
+    Args:
+        jobs: Videos to export
+        dst_dir: Folder to write the shards to
+        prefix: Start of the shard filenames
+        classes: All labels of the export, frames are stored with the index of their label
+        settings: Settings for sampling and encoding frames, defaults to every frame at full size
+        samples_per_shard: Max number of samples in each shard
+        writer_threads: Number of threads encoding frames
+
+    Returns:
+        Tuple with the filename and number of samples of each shard, and the filepaths of failed videos
+    """
+    logger = logging.getLogger(__name__)
+
+    if settings is None:
+        settings = frame_export.FrameExportSettings()
+    class_inds = {label: ind for ind, label in enumerate(classes)}
+    failed = []
+    with ShardWriter(dst_dir, prefix, samples_per_shard) as writer, concurrent.futures.ThreadPoolExecutor(
+        max_workers=writer_threads
+    ) as encoder:
+        for job in jobs:
+            try:
+                encoded = _encode_video_frames(job, settings, encoder, max_pending=2 * writer_threads)
+            except Exception as err:  # pylint: disable=broad-except
+                logger.error("Failed to export video %s: %s: %s", job.filepath, type(err).__name__, err)
+                failed.append(job.filepath)
+                continue
+            for frame_number, jpeg in encoded:
+                label = job.frame_labels.get(frame_number, frame_export.DEFAULT_LABEL)
+                metadata = {"label": label, "video_name": job.video_name, "frame_number": frame_number}
+                writer.write(
+                    f"{job.video_name}___{frame_number}",
+                    {"jpg": jpeg, "cls": str(class_inds[label]).encode(), "json": json.dumps(metadata).encode()},
+                )
+    return writer.shards, failed
+
+
+def _safe_export_shard_group(
+    jobs: List[frame_export.VideoExportJob],
+    dst_dir: pathlib.Path,
+    prefix: str,
+    classes: List[str],
+    settings: Optional[frame_export.FrameExportSettings],
+    samples_per_shard: int,
+    writer_threads: int,
+) -> Tuple[Optional[Tuple[List[Dict[str, Any]], List[str]]], Optional[str]]:
+    """Run export_shard_group and return any error as a message instead of raising it.
+
+    Args:
+        jobs: Videos to export
+        dst_dir: Folder to write the shards to
+        prefix: Start of the shard filenames
+        classes: All labels of the export
+        settings: Settings for sampling and encoding frames
+        samples_per_shard: Max number of samples in each shard
+        writer_threads: Number of threads encoding frames
+
+    Returns:
+        Tuple with the result of export_shard_group, or None if it failed, and the error message if any
+    """
+    try:
+        return export_shard_group(jobs, dst_dir, prefix, classes, settings, samples_per_shard, writer_threads), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def read_index(export_location: pathlib.Path) -> Optional[Dict[str, Any]]:
+    """Read the index of a shard export.
+
+    Args:
+        export_location: Folder the shards were exported to
+
+    Returns:
+        Content of the index, or None if there is no export at export_location
+    """
+    index_path = export_location / INDEX_FILENAME
+    if not index_path.is_file():
+        return None
+    return json.loads(index_path.read_text(encoding="utf-8"))
+
+
+def export_shards(
+    jobs: List[frame_export.VideoExportJob],
+    export_location: pathlib.Path,
+    workers: int = 1,
+    writer_threads: int = 4,
+    settings: Optional[frame_export.FrameExportSettings] = None,
+    samples_per_shard: int = DEFAULT_SAMPLES_PER_SHARD,
+    fingerprint: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Export the frames of several videos to tar shards in a folder per split, with an index.
+
+    The videos of each split are divided into up to workers groups of consecutive videos, and each group is
+    packed into its own series of shards by a separate process, so shards are written in parallel without
+    any coordination. Every shard holds samples_per_shard samples except the last one of each group.
+    Shards of an earlier export to export_location are removed first and the index is written last, so
+    readers never see a partial export. Videos that fail to export are logged and left out.
+
+    Args:
+        jobs: Videos to export
+        export_location: Folder to export to
+        workers: Number of processes packing shards. With 1 all shards are packed in the current process.
+        writer_threads: Number of threads encoding frames in each process
+        settings: Settings for sampling and encoding frames
+        samples_per_shard: Max number of samples in each shard
+        fingerprint: Fingerprint of the export stored in the index, used to skip exporting it again
+
+    Returns:
+        Content of the written index
+    """
+    logger = logging.getLogger(__name__)
+
+    previous_index = read_index(export_location)
+    (export_location / INDEX_FILENAME).unlink(missing_ok=True)
+    if previous_index is not None:
+        for shards in previous_index["splits"].values():
+            for shard in shards:
+                (export_location / shard["path"]).unlink(missing_ok=True)
+
+    classes = sorted({label for job in jobs for label in job.frame_labels.values()} | {frame_export.DEFAULT_LABEL})
+    groups = []
+    for split in sorted({job.split for job in jobs}):
+        split_jobs = [job for job in jobs if job.split == split]
+        group_size = math.ceil(len(split_jobs) / min(max(workers, 1), len(split_jobs)))
+        for group_ind, start in enumerate(range(0, len(split_jobs), group_size)):
+            groups.append((split, f"{split}-{group_ind:03d}", split_jobs[start : start + group_size]))
+    args = [
+        (group_jobs, export_location / split, prefix, classes, settings, samples_per_shard, writer_threads)
+        for split, prefix, group_jobs in groups
+    ]
+
+    results = list(process_pool.run_tasks(_safe_export_shard_group, args, workers=workers))
+
+    splits: Dict[str, List[Dict[str, Any]]] = {}
+    n_failed = 0
+    for (split, prefix, group_jobs), (result, error) in zip(groups, results):
+        if error is not None:
+            logger.error("Failed to export shards %s: %s", prefix, error)
+            n_failed += len(group_jobs)
+            continue
+        shards, failed = result
+        n_failed += len(failed)
+        splits.setdefault(split, []).extend(
+            {"path": f"{split}/{shard['name']}", "n_samples": shard["n_samples"]} for shard in shards
+        )
+    if n_failed:
+        logger.error("Failed to export %s of %s videos", n_failed, len(jobs))
+
+    index = {
+        "version": INDEX_VERSION,
+        "classes": classes,
+        "samples_per_shard": samples_per_shard,
+        "fingerprint": fingerprint,
+        "splits": splits,
+    }
+    tmp_index_path = export_location / f"{INDEX_FILENAME}.tmp"
+    tmp_index_path.write_text(json.dumps(index, indent=4), encoding="utf-8")
+    os.replace(tmp_index_path, export_location / INDEX_FILENAME)
+    return index
+
+
+def iter_shard(shard_path: pathlib.Path) -> Iterator[Dict[str, Any]]:
+    """Read the samples of a shard in order with a single sequential pass over the file.
+
+    Args:
+        shard_path: Path to shard
+
+    Yields:
+        Sample with its key in "__key__" and the content of each of its files by extension
+    """
+    sample: Dict[str, Any] = {}
+    with tarfile.open(shard_path, mode="r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            key, _, extension = member.name.partition(".")
+            if sample and sample["__key__"] != key:
+                yield sample
+                sample = {}
+            sample.setdefault("__key__", key)
+            sample[extension] = tar.extractfile(member).read()
+    if sample:
+        yield sample
+
+
+class ShardReader:
+    """Streams the samples of one split of a shard export, reading whole shards sequentially.
+
+    The shards can be divided between several readers, such as the workers of a PyTorch DataLoader, with
+    rank and world_size. With shuffle the order of the shards changes every pass and samples go through a
+    shuffle buffer, which mixes frames of different videos without any random reads.
+    """
+
+    def __init__(
+        self,
+        export_location: pathlib.Path,
+        split: str,
+        shuffle: bool = False,
+        buffer_size: int = DEFAULT_SHUFFLE_BUFFER,
+        seed: Optional[int] = None,
+        rank: int = 0,
+        world_size: int = 1,
+    ) -> None:
+        """Read the index of an export.
+
+        Args:
+            export_location: Folder the shards were exported to
+            split: Name of the split to read, e.g. train or test
+            shuffle: Shuffle the shards and the samples
+            buffer_size: Number of samples held in the shuffle buffer
+            seed: Seed for shuffling
+            rank: Position of this reader among the readers sharing the shards
+            world_size: Number of readers sharing the shards
+
+        Raises:
+            FileNotFoundError: If there is no shard export at export_location
+        """
+        index = read_index(export_location)
+        if index is None:
+            raise FileNotFoundError(f"No shard index {INDEX_FILENAME} found in {export_location}")
+        self.export_location = export_location
+        self.classes: List[str] = index["classes"]
+        self.shards: List[Dict[str, Any]] = index["splits"].get(split, [])[rank::world_size]
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        # Shuffles training samples, not used for anything security related
+        self.rng = random.Random(seed)  # nosec B311
+
+    def __len__(self) -> int:
+        """Get the number of samples read in each pass.
+
+        Returns:
+            Number of samples in the shards of this reader
+        """
+        return sum(shard["n_samples"] for shard in self.shards)
+
+    def iter_samples(self) -> Iterator[Dict[str, Any]]:
+        """Read the samples of the shards without decoding them.
+
+        Yields:
+            Sample with its key in "__key__" and the content of each of its files by extension
+        """
+        shards = list(self.shards)
+        if not self.shuffle:
+            for shard in shards:
+                yield from iter_shard(self.export_location / shard["path"])
+            return
+        self.rng.shuffle(shards)
+        buffer: List[Dict[str, Any]] = []
+        for shard in shards:
+            for sample in iter_shard(self.export_location / shard["path"]):
+                buffer.append(sample)
+                if len(buffer) >= self.buffer_size:
+                    ind = self.rng.randrange(len(buffer))
+                    buffer[ind], buffer[-1] = buffer[-1], buffer[ind]
+                    yield buffer.pop()
+        self.rng.shuffle(buffer)
+        yield from buffer
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, int]]:
+        """Read and decode the samples of the shards.
+
+        Yields:
+            Tuple with the decoded frame in BGR order and the index of its label in classes
+        """
+        for sample in self.iter_samples():
+            buffer = np.frombuffer(sample["jpg"], dtype=np.uint8)
+            yield cv2.imdecode(buffer, cv2.IMREAD_COLOR), int(sample["cls"])  # pylint: disable=no-member
@@ -0,0 +1,199 @@
+"""This module exports preprocessed frames as memory mapped NumPy arrays, so training reads them without decoding."""
+import json
+import logging
+import os
+import pathlib
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from wai_data_tools.utils import frame_export, frame_source, process_pool
+
+# Frames as one uint8 array of shape (n_frames, height, width, 3) in RGB order
+FRAMES_FILENAME = "frames.npy"
+# Index of the label of each frame in the classes of the index
+LABELS_FILENAME = "labels.npy"
+# Index of the split of each frame in the splits of the index
+SPLITS_FILENAME = "splits.npy"
+# Index of an export, listing the classes and the range of frames of each split
+INDEX_FILENAME = "tensors.json"
+INDEX_VERSION = 1
+
+
+def preprocess_video_frames(
+    job: frame_export.VideoExportJob, settings: frame_export.FrameExportSettings
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode the sampled frames of a video resized and converted to RGB by the decode backend.
+
+    Args:
+        job: Video to preprocess the frames of
+        settings: Settings for sampling frames, size must be a fixed (width, height)
+
+    Returns:
+        Tuple with the frames as an uint8 array of shape (n_frames, height, width, 3) and their frame numbers
+    """
+    frame_numbers, preprocessed = [], []
+    frames = frame_source.iter_frames(pathlib.Path(job.filepath), settings.frame_source_settings(pixel_format="rgb24"))
+    for frame_number, frame in frames:
+        preprocessed.append(frame_export.resize_frame(frame, settings.size))
+        frame_numbers.append(frame_number)
+    if not preprocessed:
+        width, height = settings.size
+        return np.empty((0, height, width, 3), dtype=np.uint8), np.empty(0, dtype=np.int64)
+    return np.stack(preprocessed), np.asarray(frame_numbers, dtype=np.int64)
+
+
+def _safe_preprocess_video_frames(
+    job: frame_export.VideoExportJob, settings: frame_export.FrameExportSettings, dst_path: pathlib.Path
+) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """Preprocess the frames of a video into a file and return any error as a message instead of raising it.
+
+    Args:
+        job: Video to preprocess the frames of
+        settings: Settings for sampling frames
+        dst_path: Path to .npy file to save the frames to
+
+    Returns:
+        Tuple with the frame numbers, or None if it failed, and the error message if any
+    """
+    try:
+        frames, frame_numbers = preprocess_video_frames(job, settings)
+        np.save(dst_path, frames)
+        return frame_numbers, None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def read_index(export_location: pathlib.Path) -> Optional[Dict[str, Any]]:
+    """Read the index of a tensor export.
+
+    Args:
+        export_location: Folder the tensors were exported to
+
+    Returns:
+        Content of the index, or None if there is no export at export_location
+    """
+    index_path = export_location / INDEX_FILENAME
+    if not index_path.is_file():
+        return None
+    return json.loads(index_path.read_text(encoding="utf-8"))
+
+
+def export_tensors(
+    jobs: List[frame_export.VideoExportJob],
+    export_location: pathlib.Path,
+    settings: frame_export.FrameExportSettings,
+    workers: int = 1,
+    fingerprint: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Export the preprocessed frames of several videos to one contiguous array with parallel label and split arrays.
+
+    Videos are preprocessed in a pool of processes, each into its own temporary file, and then copied in
+    order into a single .npy file, so it can be memory mapped with np.load(mmap_mode="r"). The frames of
+    each split are stored next to each other, so a split is a slice of the array that needs no copy.
+    Videos that fail to export are logged and left out.
+
+    Args:
+        jobs: Videos to export
+        export_location: Folder to export to
+        settings: Settings for sampling frames, size must be a fixed (width, height)
+        workers: Number of processes preprocessing videos. With 1 the videos are decoded in the current process.
+        fingerprint: Fingerprint of the export stored in the index, used to skip exporting it again
+
+    Returns:
+        Content of the written index
+
+    Raises:
+        ValueError: If settings has no fixed frame size
+    """
+    logger = logging.getLogger(__name__)
+
+    if settings.size is None or min(settings.size) <= 0:
+        raise ValueError(f"Exporting tensors needs a fixed frame size in transformations.size, got {settings.size}")
+    width, height = settings.size
+    (export_location / INDEX_FILENAME).unlink(missing_ok=True)
+
+    splits = sorted({job.split for job in jobs})
+    jobs = sorted(jobs, key=lambda job: splits.index(job.split))
+    classes = sorted({label for job in jobs for label in job.frame_labels.values()} | {frame_export.DEFAULT_LABEL})
+    class_inds = {label: ind for ind, label in enumerate(classes)}
+
+    with tempfile.TemporaryDirectory(dir=export_location) as staging_dir:
+        chunk_paths = [pathlib.Path(staging_dir) / f"{job_ind:06d}.npy" for job_ind in range(len(jobs))]
+        results = list(
+            process_pool.run_tasks(
+                _safe_preprocess_video_frames,
+                [(job, settings, chunk_path) for job, chunk_path in zip(jobs, chunk_paths)],
+                workers=workers,
+            )
+        )
+
+        labels, split_codes, chunks = [], [], []
+        for job, chunk_path, (frame_numbers, error) in zip(jobs, chunk_paths, results):
+            if error is not None:
+                logger.error("Failed to export video %s: %s", job.filepath, error)
+                continue
+            labels.extend(
+                class_inds[job.frame_labels.get(frame_number, frame_export.DEFAULT_LABEL)]
+                for frame_number in frame_numbers.tolist()
+            )
+            split_codes.extend([splits.index(job.split)] * len(frame_numbers))
+            chunks.append((chunk_path, len(frame_numbers)))
+
+        tmp_frames_path = export_location / f"{FRAMES_FILENAME}.tmp"
+        frames = np.lib.format.open_memmap(
+            tmp_frames_path, mode="w+", dtype=np.uint8, shape=(len(labels), height, width, 3)
+        )
+        start = 0
+        for chunk_path, n_frames in chunks:
+            frames[start : start + n_frames] = np.load(chunk_path)
+            start += n_frames
+        frames.flush()
+        del frames
+    os.replace(tmp_frames_path, export_location / FRAMES_FILENAME)
+    np.save(export_location / LABELS_FILENAME, np.asarray(labels, dtype=np.int32))
+    split_codes = np.asarray(split_codes, dtype=np.uint8)
+    np.save(export_location / SPLITS_FILENAME, split_codes)
+
+    index = {
+        "version": INDEX_VERSION,
+        "classes": classes,
+        "channels": "RGB",
+        "size": [width, height],
+        "fingerprint": fingerprint,
+        "splits": {
+            split: {
+                "start": int(np.searchsorted(split_codes, code, side="left")),
+                "stop": int(np.searchsorted(split_codes, code, side="right")),
+            }
+            for code, split in enumerate(splits)
+        },
+    }
+    tmp_index_path = export_location / f"{INDEX_FILENAME}.tmp"
+    tmp_index_path.write_text(json.dumps(index, indent=4), encoding="utf-8")
+    os.replace(tmp_index_path, export_location / INDEX_FILENAME)
+    return index
+
+
+def load_split(export_location: pathlib.Path, split: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Memory map the frames of a split of a tensor export together with their labels.
+
+    Args:
+        export_location: Folder the tensors were exported to
+        split: Name of the split to load, e.g. train or test
+
+    Returns:
+        Tuple with a read only view of the frames of the split, of shape (n_frames, height, width, 3), and the
+        index of the label of each frame in the classes of the index
+
+    Raises:
+        FileNotFoundError: If there is no tensor export at export_location
+    """
+    index = read_index(export_location)
+    if index is None:
+        raise FileNotFoundError(f"No tensor index {INDEX_FILENAME} found in {export_location}")
+    split_range = index["splits"].get(split, {"start": 0, "stop": 0})
+    frames = np.load(export_location / FRAMES_FILENAME, mmap_mode="r")
+    labels = np.load(export_location / LABELS_FILENAME)
+    return frames[split_range["start"] : split_range["stop"]], labels[split_range["start"] : split_range["stop"]]
@@ -0,0 +1,395 @@
+"""This module transcodes videos with several concurrent ffmpeg processes, skipping videos that are already done."""
+import concurrent.futures
+import dataclasses
+import logging
+import mimetypes
+import os
+import pathlib
+import subprocess  # nosec B404
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+
+TRANSCODED = "transcoded"
+SKIPPED = "skipped"
+
+# Video extensions that are not registered in mimetypes, e.g. raw MJPEG streams from trail cameras
+EXTRA_VIDEO_EXTENSIONS = {".mjpg", ".mjpeg"}
+
+# FOURCC codes OpenCV reports for H.264 streams
+H264_FOURCCS = {"avc1", "avc3", "h264", "x264"}
+
+# Encoder options matching the defaults FiftyOne uses when reencoding videos
+H264_OUTPUT_OPTIONS = ["-c:v", "libx264", "-preset", "medium", "-crf", "23", "-pix_fmt", "yuv420p", "-an"]
+
+# Max difference in frames per second for a video to count as having the target frame rate
+FPS_TOLERANCE = 0.01
+
+
+@dataclasses.dataclass(frozen=True)
+class TranscodeJob:
+    """A video to transcode to H.264.
+
+    Attributes:
+        src_path: Video to transcode
+        dst_path: Path to write the transcoded video to, can be the same as src_path to transcode in place
+        fps: Optional frame rate to convert to
+        size: Optional (width, height) to resize to. One of them can be -1 to keep the aspect ratio.
+    """
+
+    src_path: pathlib.Path
+    dst_path: pathlib.Path
+    fps: Optional[float] = None
+    size: Optional[Tuple[int, int]] = None
+
+
+def list_videos(data_dir: pathlib.Path) -> List[pathlib.Path]:
+    """List the video files in a folder and its subfolders, recognized on their file extension.
+
+    Hidden files and temporary files left by an interrupted transcoding are ignored.
+
+    Args:
+        data_dir: Folder to look in
+
+    Returns:
+        Sorted list of video files
+    """
+    return sorted(
+        path
+        for path in data_dir.rglob("*")
+        if path.is_file() and is_video_path(path) and not path.name.startswith(".") and ".tmp." not in path.name
+    )
+
+
+def is_video_path(path: pathlib.Path) -> bool:
+    """Check if a file is a video from its extension.
+
+    Args:
+        path: Path to file
+
+    Returns:
+        True if the file is a video
+    """
+    return path.suffix.lower() in EXTRA_VIDEO_EXTENSIONS or (mimetypes.guess_type(path.name)[0] or "").startswith(
+        "video/"
+    )
+
+
+def probe_video(filepath: pathlib.Path) -> Optional[Tuple[float, int, int, str]]:
+    """Read the frame rate, size and codec of a video from its header.
+
+    Args:
+        filepath: Path to video file
+
+    Returns:
+        Tuple with frames per second, width, height and lowercase FOURCC of the codec, or None if it can not be read
+    """
+    cap = cv2.VideoCapture(str(filepath))  # pylint: disable=no-member
+    try:
+        if not cap.isOpened():
+            return None
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))  # pylint: disable=no-member
+        return (
+            cap.get(cv2.CAP_PROP_FPS),  # pylint: disable=no-member
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),  # pylint: disable=no-member
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),  # pylint: disable=no-member
+            fourcc.to_bytes(4, byteorder="little").decode(errors="replace").strip("\x00 ").lower(),
+        )
+    finally:
+        cap.release()
+
+
+def is_up_to_date(job: TranscodeJob, metadata: Optional[Dict[str, Any]] = None) -> bool:
+    """Check if the output of a job already exists with the target codec, frame rate and size.
+
+    An output written to another path must also be newer than its source.
+
+    Args:
+        job: Transcoding job
+        metadata: Known metadata of the output as returned by video_metadata, the output is probed if not given
+
+    Returns:
+        True if the job does not need to run
+    """
+    if not job.dst_path.is_file():
+        return False
+    if job.dst_path != job.src_path and job.src_path.is_file():
+        if job.dst_path.stat().st_mtime_ns < job.src_path.stat().st_mtime_ns:
+            return False
+    if metadata is not None:
+        properties: Optional[Tuple[float, int, int, str]] = (
+            metadata["frame_rate"],
+            metadata["frame_width"],
+            metadata["frame_height"],
+            (metadata["encoding_str"] or "").lower(),
+        )
+    else:
+        properties = probe_video(job.dst_path)
+    return properties is not None and matches_target(job, *properties)
+
+
+def matches_target(job: TranscodeJob, fps: float, width: int, height: int, codec: str) -> bool:
+    """Check if video properties match the target of a job.
+
+    Args:
+        job: Transcoding job
+        fps: Frames per second of the video
+        width: Width of the video
+        height: Height of the video
+        codec: Lowercase FOURCC of the codec of the video
+
+    Returns:
+        True if the video has the target codec, frame rate and size
+    """
+    if codec not in H264_FOURCCS:
+        return False
+    if job.fps is not None and abs(fps - job.fps) > FPS_TOLERANCE:
+        return False
+    if job.size is None:
+        return True
+    target_width, target_height = job.size
+    return (target_width <= 0 or width == target_width) and (target_height <= 0 or height == target_height)
+
+
+def ffmpeg_command(job: TranscodeJob, output_path: pathlib.Path, ffmpeg: str = "ffmpeg", threads: int = 0) -> List[str]:
+    """Build the ffmpeg command for a job.
+
+    Args:
+        job: Transcoding job
+        output_path: Path for ffmpeg to write to
+        ffmpeg: ffmpeg executable
+        threads: Number of threads for ffmpeg, 0 lets ffmpeg decide
+
+    Returns:
+        Command as a list of arguments
+    """
+    filters = []
+    if job.fps is not None:
+        filters.append(f"fps={job.fps:g}")
+    if job.size is not None:
+        # -2 keeps the aspect ratio while rounding to the even sizes libx264 requires
+        width, height = (value if value > 0 else -2 for value in job.size)
+        filters.append(f"scale={width}:{height}")
+    command = [ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin", "-y", "-i", str(job.src_path)]
+    if filters:
+        command += ["-vf", ",".join(filters)]
+    else:
+        command += ["-vsync", "0"]
+    command += H264_OUTPUT_OPTIONS + ["-movflags", "+faststart", "-threads", str(threads), str(output_path)]
+    return command
+
+
+def transcode_video(job: TranscodeJob, ffmpeg: str = "ffmpeg", threads: int = 0) -> str:
+    """Transcode a video unless its output is up to date.
+
+    The output is written to a uniquely named temporary file next to dst_path and renamed to dst_path when
+    ffmpeg has finished, so an interrupted run never leaves a partial video at dst_path and concurrent runs
+    writing the same output do not interfere.
+
+    Args:
+        job: Transcoding job
+        ffmpeg: ffmpeg executable
+        threads: Number of threads for ffmpeg, 0 lets ffmpeg decide
+
+    Returns:
+        TRANSCODED or SKIPPED
+
+    Raises:
+        RuntimeError: If ffmpeg fails
+    """
+    if is_up_to_date(job):
+        return SKIPPED
+    job.dst_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_fd, tmp_name = tempfile.mkstemp(
+        prefix=f".{job.dst_path.stem}.", suffix=f".tmp{job.dst_path.suffix}", dir=job.dst_path.parent
+    )
+    os.close(tmp_fd)
+    tmp_path = pathlib.Path(tmp_name)
+    try:
+        # The argument list is built by ffmpeg_command and run without a shell
+        result = subprocess.run(  # nosec B603
+            ffmpeg_command(job, tmp_path, ffmpeg=ffmpeg, threads=threads),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+        if result.returncode != 0:
+            message = result.stderr.decode(errors="replace").strip()
+            raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {message}")
+        os.replace(tmp_path, job.dst_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return TRANSCODED
+
+
+def _safe_transcode_video(job: TranscodeJob, ffmpeg: str, threads: int) -> Tuple[Optional[str], Optional[str]]:
+    """Run transcode_video and return any error as a message instead of raising it.
+
+    Args:
+        job: Transcoding job
+        ffmpeg: ffmpeg executable
+        threads: Number of threads for ffmpeg
+
+    Returns:
+        Tuple with the result of transcode_video, or None if it failed, and the error message if any
+    """
+    try:
+        return transcode_video(job, ffmpeg=ffmpeg, threads=threads), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def transcode_videos(
+    jobs: List[TranscodeJob], workers: Optional[int] = None, ffmpeg: str = "ffmpeg"
+) -> Iterator[Tuple[TranscodeJob, Optional[str]]]:
+    """Run several transcoding jobs with a number of ffmpeg processes running at the same time.
+
+    The CPU cores are divided between the ffmpeg processes. Results are yielded in the same order as jobs,
+    and a job that fails is logged and yielded with None instead of stopping the other jobs.
+
+    Args:
+        jobs: Transcoding jobs
+        workers: Number of concurrent ffmpeg processes, defaults to the number of CPU cores
+        ffmpeg: ffmpeg executable
+
+    Yields:
+        Tuple with the job and TRANSCODED, SKIPPED or None if it failed
+    """
+    logger = logging.getLogger(__name__)
+
+    cpu_count = os.cpu_count() or 1
+    workers = workers or cpu_count
+    threads = max(cpu_count // workers, 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_safe_transcode_video, job, ffmpeg, threads) for job in jobs]
+        for job, future in zip(jobs, futures):
+            status, error = future.result()
+            if error is not None:
+                logger.error("Failed to transcode video %s: %s", job.src_path, error)
+            yield job, status
+
+
+def video_metadata(filepath: pathlib.Path) -> Dict[str, Any]:
+    """Read the metadata of a video from its header, with the fields of a FiftyOne VideoMetadata.
+
+    Args:
+        filepath: Path to video file
+
+    Returns:
+        Metadata of the video
+
+    Raises:
+        RuntimeError: If the video can not be read
+    """
+    cap = cv2.VideoCapture(str(filepath))  # pylint: disable=no-member
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f"Could not open video {filepath}")
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))  # pylint: disable=no-member
+        frame_rate = cap.get(cv2.CAP_PROP_FPS)  # pylint: disable=no-member
+        total_frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))  # pylint: disable=no-member
+        return {
+            "size_bytes": filepath.stat().st_size,
+            "mime_type": mimetypes.guess_type(filepath.name)[0],
+            "frame_width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),  # pylint: disable=no-member
+            "frame_height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),  # pylint: disable=no-member
+            "frame_rate": frame_rate,
+            "total_frame_count": total_frame_count,
+            "duration": total_frame_count / frame_rate if frame_rate > 0 else None,
+            "encoding_str": fourcc.to_bytes(4, byteorder="little").decode(errors="replace").strip("\x00 "),
+        }
+    finally:
+        cap.release()
+
+
+def _safe_ingest_video(job: TranscodeJob, ffmpeg: str, threads: int) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Transcode a video if its output differs from its source and read the metadata of the output.
+
+    Args:
+        job: Transcoding job, a job with the same source and output only reads the metadata
+        ffmpeg: ffmpeg executable
+        threads: Number of threads for ffmpeg
+
+    Returns:
+        Tuple with the metadata of the output, or None if it failed, and the error message if any
+    """
+    try:
+        if job.src_path != job.dst_path:
+            transcode_video(job, ffmpeg=ffmpeg, threads=threads)
+        return video_metadata(job.dst_path), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def ingest_videos(
+    jobs: List[TranscodeJob], workers: Optional[int] = None, ffmpeg: str = "ffmpeg"
+) -> Iterator[Tuple[TranscodeJob, Optional[Dict[str, Any]]]]:
+    """Transcode and read the metadata of several videos as one pipeline stage per video.
+
+    Each video goes through transcoding and metadata reading in the same worker, so a video can be added to
+    a dataset as soon as it is ready instead of after passes over all videos. Sources are never modified.
+    Results are yielded in the same order as jobs, and a video that fails is logged and yielded with None.
+
+    Args:
+        jobs: Transcoding jobs, jobs with the same source and output are ingested as they are
+        workers: Number of videos processed at the same time, defaults to the number of CPU cores
+        ffmpeg: ffmpeg executable
+
+    Yields:
+        Tuple with the job and the metadata of its output, or None if it failed
+    """
+    logger = logging.getLogger(__name__)
+
+    cpu_count = os.cpu_count() or 1
+    workers = workers or cpu_count
+    threads = max(cpu_count // workers, 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_safe_ingest_video, job, ffmpeg, threads) for job in jobs]
+        for job, future in zip(jobs, futures):
+            metadata, error = future.result()
+            if error is not None:
+                logger.error("Failed to ingest video %s: %s", job.src_path, error)
+            yield job, metadata
+
+
+def ingest_jobs(
+    video_paths: List[pathlib.Path], data_dir: pathlib.Path, output_dir: Optional[pathlib.Path] = None
+) -> List[TranscodeJob]:
+    """Plan how to ingest the videos in a folder, transcoding the ones that are not .mp4.
+
+    Videos written next to their sources by an earlier ingest are recognized as outputs of those sources, so
+    ingesting the same folder again plans the same outputs instead of ingesting them as new videos.
+
+    Args:
+        video_paths: Videos in data_dir
+        data_dir: Folder with the videos
+        output_dir: Folder to write transcoded videos to, keeping the subfolders of data_dir.
+                    Defaults to writing them next to their sources.
+
+    Returns:
+        List of transcoding jobs, with the same source and output for videos that are ingested as they are
+    """
+    converted = set()
+    if output_dir is None:
+        converted = {
+            dst_path
+            for src_path in video_paths
+            if src_path.suffix.lower() != ".mp4"
+            for dst_path in (src_path.with_suffix(".mp4"), src_path.with_name(f"{src_path.name}.mp4"))
+        }.intersection(video_paths)
+    planned = set()
+    jobs = []
+    for src_path in video_paths:
+        if src_path in converted:
+            continue
+        if src_path.suffix.lower() == ".mp4":
+            jobs.append(TranscodeJob(src_path=src_path, dst_path=src_path))
+            continue
+        dst_dir = src_path.parent if output_dir is None else output_dir / src_path.parent.relative_to(data_dir)
+        dst_path = dst_dir / f"{src_path.stem}.mp4"
+        if dst_path in planned:
+            dst_path = dst_dir / f"{src_path.name}.mp4"
+        planned.add(dst_path)
+        jobs.append(TranscodeJob(src_path=src_path, dst_path=dst_path))
+    return jobs
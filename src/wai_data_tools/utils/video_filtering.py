@@ -1,11 +1,46 @@
 """This module allows naive processing of videos."""
 
+import dataclasses
 import itertools
+import json
+import logging
 import pathlib
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import cv2
 import numpy as np
 
+from wai_data_tools.utils import frame_source, process_pool
+
+# Bump whenever a change to the detection logic can change the result for the same video and settings
+DETECTOR_VERSION = 1
+
+
+@dataclasses.dataclass(frozen=True)
+class DifferenceSettings:
+    """Settings for how frames are prepared and compared when looking for activity.
+
+    The defaults compare full resolution frames one pair at a time, as check_frames_differences does.
+
+    Attributes:
+        grayscale: Convert frames to grayscale before comparing them
+        downscale: Integer factor to shrink the frames by before comparing them
+        roi: Optional region of interest given as (x, y, width, height) in pixels of the original frame.
+             Everything outside it, e.g. a timestamp overlay, is ignored.
+        batch_size: Number of new frames stacked into one array and scored together
+        frame_stride: Only every frame_stride-th frame is decoded and compared
+        sample_fps: Optional frame rate to sample the video at, overrides frame_stride when given
+        backend: Name of the backend decoding the videos, see frame_source.BACKENDS
+    """
+
+    grayscale: bool = False
+    downscale: int = 1
+    roi: Optional[Tuple[int, int, int, int]] = None
+    batch_size: int = 1
+    frame_stride: int = 1
+    sample_fps: Optional[float] = None
+    backend: str = frame_source.DEFAULT_BACKEND
+
 
 # taken from itertools recipes(exists in 3.10+)
 def pairwise(iterable):
@@ -24,24 +59,64 @@ def pairwise(iterable):
     return zip(op1, op2)
 
 
-def convert_video_to_frames(src_file: pathlib.Path):
+def convert_video_to_frames(src_file: pathlib.Path, backend: str = frame_source.DEFAULT_BACKEND):
     """Get a video and returns frames.
 
     Args:
         src_file: full path filename
+        backend: Name of the backend decoding the video, see frame_source.BACKENDS
 
     Returns:
-        list of all frames from the video
-    """
-    reader = cv2.VideoCapture(str(src_file))  # pylint: disable=no-member
-    frames = []
-    success = True
-    while success:
-        success, frame = reader.read()
-        frames.append(frame)
+        list of all frames from the video, followed by None
+    """
+    settings = frame_source.FrameSourceSettings(backend=backend)
+    frames = [frame for _, frame in frame_source.iter_frames(src_file, settings)]
+    frames.append(None)
     return frames
 
 
+def iter_numbered_video_frames(
+    src_file: pathlib.Path,
+    frame_stride: int = 1,
+    sample_fps: Optional[float] = None,
+    backend: str = frame_source.DEFAULT_BACKEND,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Lazily read the frames of a video one at a time together with their frame numbers.
+
+    Skipped frames are not converted to images, with OpenCV they are only grabbed, not retrieved.
+
+    Args:
+        src_file: full path filename
+        frame_stride: Only every frame_stride-th frame is yielded
+        sample_fps: Optional frame rate to sample the video at, overrides frame_stride when given
+        backend: Name of the backend decoding the video, see frame_source.BACKENDS
+
+    Returns:
+        Iterator of tuples with the number of the frame in the video, starting from 1, and the decoded frame
+    """
+    settings = frame_source.FrameSourceSettings(backend=backend, frame_stride=frame_stride, sample_fps=sample_fps)
+    return frame_source.iter_frames(src_file, settings)
+
+
+def iter_video_frames(
+    src_file: pathlib.Path, frame_stride: int = 1, sample_fps: Optional[float] = None
+) -> Iterator[np.ndarray]:
+    """Lazily read the frames of a video one at a time.
+
+    Skipped frames are only grabbed, not retrieved, so they are never converted to images.
+
+    Args:
+        src_file: full path filename
+        frame_stride: Only every frame_stride-th frame is yielded
+        sample_fps: Optional frame rate to sample the video at, overrides frame_stride when given
+
+    Yields:
+        decoded frames in playback order
+    """
+    for _, frame in iter_numbered_video_frames(src_file, frame_stride=frame_stride, sample_fps=sample_fps):
+        yield frame
+
+
 def check_frames_differences(frames, threshold=50):
     """Return a list of differences between 2 adjacent frames.
 
@@ -64,18 +139,320 @@ def check_frames_differences(frames, threshold=50):
     return diffs
 
 
-def video_process_content(src_file: pathlib.Path, threshold: int = 50) -> bool:
+def prepare_frame(frame: np.ndarray, settings: DifferenceSettings) -> np.ndarray:
+    """Crop, convert and shrink a frame according to the difference settings.
+
+    Args:
+        frame: Frame to prepare
+        settings: Difference settings to apply
+
+    Returns:
+        Prepared frame
+    """
+    if settings.roi is not None:
+        x_start, y_start, width, height = settings.roi
+        frame = frame[y_start : y_start + height, x_start : x_start + width]
+    if settings.grayscale and frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # pylint: disable=no-member
+    if settings.downscale > 1:
+        height, width = frame.shape[:2]
+        size = (max(width // settings.downscale, 1), max(height // settings.downscale, 1))
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)  # pylint: disable=no-member
+    return frame
+
+
+def score_frame_differences(frames: np.ndarray, threshold: int = 50) -> np.ndarray:
+    """Count the pixels that changed between adjacent frames in a stack of frames.
+
+    Args:
+        frames: Array of stacked frames with the frame index as first dimension
+        threshold: Threshold for activity to use when filtering
+
+    Returns:
+        Array with the number of changed pixels between any two adjacent frames
+    """
+    n_frames = len(frames)
+    if n_frames < 2:
+        return np.zeros(0, dtype=np.int64)
+    flat_frames = frames.reshape(n_frames, -1)
+    diffs = cv2.absdiff(flat_frames[1:], flat_frames[:-1])  # pylint: disable=no-member
+    return np.count_nonzero(diffs >= threshold, axis=1)
+
+
+def iter_frame_batches(frames: Iterable[np.ndarray], batch_size: int = 1) -> Iterator[np.ndarray]:
+    """Stack frames into overlapping batches so no adjacent pair is lost between two batches.
+
+    Each batch starts with the last frame of the previous batch followed by up to batch_size new frames.
+
+    Args:
+        frames: Iterable of frames
+        batch_size: Number of new frames in each batch
+
+    Yields:
+        Array of stacked frames
+    """
+    frames = iter(frames)
+    previous_frame = next(frames, None)
+    if previous_frame is None:
+        return
+    while True:
+        new_frames = list(itertools.islice(frames, batch_size))
+        if not new_frames:
+            return
+        yield np.stack([previous_frame] + new_frames)
+        previous_frame = new_frames[-1]
+
+
+def measure_motion(
+    frames: Iterable[np.ndarray], threshold: int = 50, settings: Optional[DifferenceSettings] = None
+) -> int:
+    """Measure the motion in a sequence of frames, stopping at the first difference found.
+
+    Only the previous frame and the current batch are kept in memory, so passing a generator such as
+    the one from iter_video_frames means the rest of the video is never decoded once motion is found.
+
+    Args:
+        frames: Iterable of frames
+        threshold: Threshold for activity to use when filtering
+        settings: Settings for preparing and comparing the frames, defaults to comparing them unchanged
+
+    Returns:
+        Number of changed pixels between the first two adjacent frames that differ, 0 if no frames differ
+    """
+    if settings is None:
+        settings = DifferenceSettings()
+    prepared_frames = (prepare_frame(frame, settings) for frame in frames)
+    for batch in iter_frame_batches(prepared_frames, batch_size=settings.batch_size):
+        scores = score_frame_differences(batch, threshold=threshold)
+        moving = np.flatnonzero(scores)
+        if moving.size:
+            return int(scores[moving[0]])
+    return 0
+
+
+def detect_motion(
+    frames: Iterable[np.ndarray], threshold: int = 50, settings: Optional[DifferenceSettings] = None
+) -> bool:
+    """Check if any two adjacent frames differ, stopping at the first difference found.
+
+    Args:
+        frames: Iterable of frames
+        threshold: Threshold for activity to use when filtering
+        settings: Settings for preparing and comparing the frames, defaults to comparing them unchanged
+
+    Returns:
+        True if any two adjacent frames differ. Otherwise, False.
+    """
+    return measure_motion(frames, threshold=threshold, settings=settings) > 0
+
+
+def video_motion_score(
+    src_file: pathlib.Path, threshold: int = 50, settings: Optional[DifferenceSettings] = None
+) -> int:
+    """Decode a video lazily and measure its motion, stopping at the first motion found.
+
+    Args:
+        src_file: full path filename
+        threshold: Threshold for activity to use when filtering
+        settings: Settings for sampling, preparing and comparing the frames
+
+    Returns:
+        Number of changed pixels between the first two sampled frames that differ, 0 if the video is empty
+    """
+    if settings is None:
+        settings = DifferenceSettings()
+    source = frame_source.FrameSourceSettings(
+        backend=settings.backend, frame_stride=settings.frame_stride, sample_fps=settings.sample_fps
+    )
+    if settings.roi is None:
+        # Without a crop the frames can be converted and shrunk by the backend while they are decoded
+        source = dataclasses.replace(
+            source, pixel_format="gray" if settings.grayscale else "bgr24", downscale=settings.downscale
+        )
+        settings = dataclasses.replace(settings, grayscale=False, downscale=1)
+    frames = (frame for _, frame in frame_source.iter_frames(src_file, source))
+    return measure_motion(frames, threshold=threshold, settings=settings)
+
+
+def video_process_content(
+    src_file: pathlib.Path,
+    threshold: int = 50,
+    streaming: bool = True,
+    settings: Optional[DifferenceSettings] = None,
+) -> bool:
     """Check content of the video and returns if the video is empty.
 
     Args:
         src_file: full path filename
         threshold: Threshold for activity to use when filtering
+        streaming: If True, frames are decoded lazily and decoding stops at the first motion found.
+                   If False, the whole video is decoded before the frames are compared.
+        settings: Settings for sampling, preparing and comparing the frames when streaming
 
     Returns:
         True if video is empty. Otherwise, False.
     """
-    frames = convert_video_to_frames(src_file)
+    if streaming:
+        return video_motion_score(src_file, threshold=threshold, settings=settings) == 0
+    backend = frame_source.DEFAULT_BACKEND if settings is None else settings.backend
+    frames = convert_video_to_frames(src_file, backend=backend)
     frame_diff = check_frames_differences(frames, threshold=threshold)
     if any(x > 0 for x in frame_diff):
         return False
     return True
+
+
+def detector_key(threshold: int, settings: Optional[DifferenceSettings] = None) -> str:
+    """Describe the detector version, threshold and settings as a string, e.g. for keying cached results.
+
+    Args:
+        threshold: Threshold for activity to use when filtering
+        settings: Settings for sampling, preparing and comparing the frames
+
+    Returns:
+        JSON string that changes whenever the detector would give a different result
+    """
+    if settings is None:
+        settings = DifferenceSettings()
+    settings_description = dataclasses.asdict(settings)
+    # Batching only changes how many frames are scored at once, not the result
+    del settings_description["batch_size"]
+    if settings.backend == frame_source.DEFAULT_BACKEND:
+        # Leave out the default backend so results cached before backends were selectable stay valid
+        del settings_description["backend"]
+    description = {"version": DETECTOR_VERSION, "threshold": threshold, "settings": settings_description}
+    return json.dumps(description, sort_keys=True)
+
+
+def init_worker() -> None:
+    """Limit OpenCV to one thread per worker process so the pool does not oversubscribe the cores."""
+    cv2.setNumThreads(1)  # pylint: disable=no-member
+
+
+def _safe_video_motion_score(
+    src_file: pathlib.Path, threshold: int, settings: Optional[DifferenceSettings]
+) -> Tuple[Optional[int], Optional[str]]:
+    """Run video_motion_score and return any error as a message instead of raising it.
+
+    Args:
+        src_file: full path filename
+        threshold: Threshold for activity to use when filtering
+        settings: Settings for preparing and comparing the frames
+
+    Returns:
+        Tuple with the result of video_motion_score, or None if it failed, and the error message if any
+    """
+    try:
+        return video_motion_score(src_file, threshold=threshold, settings=settings), None
+    except Exception as err:  # pylint: disable=broad-except
+        return None, f"{type(err).__name__}: {err}"
+
+
+def process_videos_motion(
+    src_files: List[pathlib.Path],
+    threshold: int = 50,
+    workers: int = 1,
+    settings: Optional[DifferenceSettings] = None,
+) -> Iterator[Tuple[pathlib.Path, Optional[int]]]:
+    """Measure the motion in several videos, optionally spread over a pool of processes.
+
+    Results are yielded in the same order as src_files regardless of which worker finishes first.
+    A video that fails to be processed is logged and yielded with None instead of stopping the run.
+
+    Args:
+        src_files: List of video files to process
+        threshold: Threshold for activity to use when filtering
+        workers: Number of processes to use. With 1 the videos are processed in the current process.
+        settings: Settings for preparing and comparing the frames
+
+    Yields:
+        Tuple with the video file and its motion score, or None if it could not be processed
+    """
+    logger = logging.getLogger(__name__)
+
+    results = process_pool.run_tasks(
+        _safe_video_motion_score,
+        [(src_file, threshold, settings) for src_file in src_files],
+        workers=workers,
+        initializer=init_worker,
+    )
+    for src_file, (score, error) in zip(src_files, results):
+        if error is not None:
+            logger.error("Failed to process file %s: %s", src_file.name, error)
+        yield src_file, score
+
+
+def process_videos_content(
+    src_files: List[pathlib.Path],
+    threshold: int = 50,
+    workers: int = 1,
+    settings: Optional[DifferenceSettings] = None,
+) -> Iterator[Tuple[pathlib.Path, Optional[bool]]]:
+    """Check the content of several videos, optionally spread over a pool of processes.
+
+    Args:
+        src_files: List of video files to process
+        threshold: Threshold for activity to use when filtering
+        workers: Number of processes to use. With 1 the videos are processed in the current process.
+        settings: Settings for preparing and comparing the frames
+
+    Yields:
+        Tuple with the video file and True if it is empty, False if not and None if it could not be processed
+    """
+    for src_file, score in process_videos_motion(src_files, threshold=threshold, workers=workers, settings=settings):
+        yield src_file, None if score is None else score == 0
+
+
+def calculate_recall(reference_empty: List[Optional[bool]], sampled_empty: List[Optional[bool]]) -> float:
+    """Calculate how many of the non-empty videos in a reference run were also found non-empty in a sampled run.
+
+    Args:
+        reference_empty: Results of video_process_content when comparing every frame
+        sampled_empty: Results of video_process_content for the same videos with frame sampling
+
+    Returns:
+        Ratio of non-empty videos in the reference that are also non-empty in the sampled results.
+        1.0 if no video is non-empty in the reference.
+    """
+    reference_non_empty = np.array([is_empty is False for is_empty in reference_empty], dtype=bool)
+    sampled_non_empty = np.array([is_empty is False for is_empty in sampled_empty], dtype=bool)
+    n_non_empty = np.count_nonzero(reference_non_empty)
+    if n_non_empty == 0:
+        return 1.0
+    return float(np.count_nonzero(reference_non_empty & sampled_non_empty) / n_non_empty)
+
+
+def calculate_sampling_recall(
+    src_files: List[pathlib.Path],
+    settings: DifferenceSettings,
+    threshold: int = 50,
+    workers: int = 1,
+    sampled_empty: Optional[List[Optional[bool]]] = None,
+) -> float:
+    """Calculate the recall of non-empty videos found with frame sampling compared to comparing every frame.
+
+    Args:
+        src_files: List of video files to evaluate
+        settings: Settings to evaluate, typically with a frame stride or sample frame rate
+        threshold: Threshold for activity to use when filtering
+        workers: Number of processes to use
+        sampled_empty: Optional results already computed with settings, to avoid processing the videos again
+
+    Returns:
+        Ratio of non-empty videos when comparing every frame that are also non-empty with the given settings
+    """
+    if sampled_empty is None:
+        sampled_empty = [
+            is_empty
+            for _, is_empty in process_videos_content(
+                src_files, threshold=threshold, workers=workers, settings=settings
+            )
+        ]
+    reference_settings = dataclasses.replace(settings, frame_stride=1, sample_fps=None)
+    reference_empty = [
+        is_empty
+        for _, is_empty in process_videos_content(
+            src_files, threshold=threshold, workers=workers, settings=reference_settings
+        )
+    ]
+    return calculate_recall(reference_empty=reference_empty, sampled_empty=sampled_empty)
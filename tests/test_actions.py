@@ -0,0 +1,399 @@
+"""Tests for actions module, using a mocked dataset in place of a FiftyOne database."""
+import pathlib
+import shutil
+from typing import Any, Dict, List, Sequence
+from unittest.mock import MagicMock
+
+import fiftyone as fo
+import numpy as np
+import pandas as pd
+import pytest
+
+from wai_data_tools import actions
+from wai_data_tools.utils import (
+    annotation_jobs,
+    filter_cache,
+    label_classes,
+    label_timeline,
+    media_index,
+)
+
+EXAMPLE_PACKAGE = pathlib.Path(__file__).parents[1] / "ww_data_example"
+
+
+def make_dataset(samples: List[Dict[str, Any]]) -> MagicMock:
+    """Create a mocked dataset that stores the values set on it, so later selections read them back.
+
+    Spans are replaced per sample and frame labels per frame, like set_values does for a dataset.
+
+    Args:
+        samples: Values of each sample keyed on field path, including id
+
+    Returns:
+        Mocked dataset, with the stored values of each field in its stored attribute
+    """
+    dataset = MagicMock()
+    dataset.info = {}
+    dataset.stored = {}
+
+    def set_values(field: str, values: Dict[str, Any], key_field: str) -> None:
+        assert key_field == "id"
+        stored = dataset.stored.setdefault(field, {})
+        if field == label_timeline.FRAMES_FIELD:
+            for sample_id, frames in values.items():
+                stored.setdefault(sample_id, {}).update(frames)
+        else:
+            stored.update(values)
+
+    def stored_values(sample_ids: Sequence[str], fields: Sequence[str]) -> List[list]:
+        spans = dataset.stored.get(label_timeline.SPANS_FIELD, {})
+        frames = dataset.stored.get(label_timeline.FRAMES_FIELD, {})
+        columns = {
+            "id": list(sample_ids),
+            f"{label_timeline.SPANS_FIELD}.detections.support": [
+                [span.support for span in spans[sample_id].detections] if sample_id in spans else None
+                for sample_id in sample_ids
+            ],
+            f"{label_timeline.SPANS_FIELD}.detections.label": [
+                [span.label for span in spans[sample_id].detections] if sample_id in spans else None
+                for sample_id in sample_ids
+            ],
+            "frames.frame_number": [list(frames.get(sample_id, {})) for sample_id in sample_ids],
+            f"{label_timeline.FRAMES_FIELD}.classifications.label": [
+                [
+                    [classification.label for classification in frame_labels.classifications]
+                    for frame_labels in frames.get(sample_id, {}).values()
+                ]
+                for sample_id in sample_ids
+            ],
+        }
+        return [columns[field] for field in fields]
+
+    def select(sample_ids: Sequence[str]) -> MagicMock:
+        view = MagicMock()
+        view.values.side_effect = lambda fields: stored_values(list(sample_ids), fields)
+        return view
+
+    dataset.set_values.side_effect = set_values
+    dataset.select.side_effect = select
+    dataset.values.side_effect = lambda fields: [[sample[field] for sample in samples] for field in fields]
+    return dataset
+
+
+def stored_spans(dataset: MagicMock) -> Dict[str, List[tuple]]:
+    """Get the spans stored for each sample of a mocked dataset.
+
+    Args:
+        dataset: Mocked dataset created with make_dataset
+
+    Returns:
+        First frame, last frame and label of each span of each labelled sample
+    """
+    return {
+        sample_id: [(*span.support, span.label) for span in labels.detections]
+        for sample_id, labels in dataset.stored.get(label_timeline.SPANS_FIELD, {}).items()
+    }
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_add_camtrap_dp_labels(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """Test that observations of the example package are written as spans of the samples they were matched to.
+
+    A second observation of the first video is appended to the package, so it is read in a later chunk and
+    merged with the spans written for the first chunk.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video probing
+        tmp_path: Temporary directory fixture
+    """
+    package_path = tmp_path / "package"
+    shutil.copytree(EXAMPLE_PACKAGE, package_path, ignore=shutil.ignore_patterns("media"))
+    df_observations = pd.read_csv(package_path / "observations.csv", dtype=str, encoding="utf-8-sig")
+    extra_row = dict(
+        df_observations.iloc[0],
+        observationID="extra001",
+        eventStart="2023-12-06T04:33:30+12:00",
+        eventEnd="2023-12-06T04:33:31+12:00",
+        scientificName="Felis catus",
+    )
+    pd.concat([df_observations, pd.DataFrame([extra_row])]).to_csv(package_path / "observations.csv", index=False)
+
+    samples = [
+        {"filepath": "/data/20231206043328-MOV000001.mp4", "metadata.frame_rate": 10.0},
+        {"filepath": "/data/20231206053328-MOV000002.mp4", "metadata.frame_rate": None},
+        {"filepath": "/data/20231206055428-MOV000003.mp4", "metadata.frame_rate": 10.0},
+        {"filepath": "/data/unknown.mp4", "metadata.frame_rate": 10.0},
+    ]
+    for sample_ind, sample in enumerate(samples):
+        sample["id"] = f"s{sample_ind}"
+        sample["metadata.total_frame_count"] = 40 if sample_ind == 2 else 100 if sample["metadata.frame_rate"] else None
+    dataset = make_dataset(samples)
+    probed_metadata = {"frame_rate": 5.0, "total_frame_count": 100, "frame_width": 640, "frame_height": 480}
+    mocked_probe_videos = MagicMock(
+        side_effect=lambda filepaths, index: [(path, probed_metadata) for path in filepaths]
+    )
+    monkeypatch.setattr(target=media_index, name="probe_videos", value=mocked_probe_videos)
+
+    actions._add_camtrap_dp_labels(  # pylint: disable=protected-access
+        dataset, package_path, chunk_size=3, index=MagicMock()
+    )
+
+    assert mocked_probe_videos.call_args.args[0] == [pathlib.Path("/data/20231206053328-MOV000002.mp4")]
+    assert dataset.stored["metadata"]["s1"].frame_rate == 5.0
+    assert dataset.stored["camtrap_media_id"] == {"s0": "89bb0355", "s1": "6aa925c4", "s2": "a4c9b59d"}
+    assert set(dataset.stored["location"]) == {"s0", "s1", "s2"}
+    assert stored_spans(dataset) == {
+        "s0": [(1, 60, "Rattus rattus"), (21, 30, "Felis catus")],
+        "s1": [(1, 30, "Rhaphidophoridae")],
+        "s2": [(1, 40, "Opiliones")],
+    }
+    span_writes = [call for call in dataset.set_values.call_args_list if call.args[0] == label_timeline.SPANS_FIELD]
+    assert [set(call.args[1]) for call in span_writes] == [{"s0", "s1", "s2"}, {"s0"}]
+    assert label_timeline.FRAMES_FIELD not in dataset.stored
+
+
+@pytest.mark.parametrize(argnames="frame_labels", argvalues=[False, True])
+def test_add_classifications(frame_labels: bool) -> None:
+    """Test that label rows are joined to samples on the video name, skipping samples that can not be labelled.
+
+    Args:
+        frame_labels: Also store a classification on each labelled frame
+    """
+    samples = [
+        {"id": "s0", "filepath": "/data/folder/video_0.mp4", "metadata.frame_rate": 2.0},
+        {"id": "s1", "filepath": "/data/folder/video_1.avi", "metadata.frame_rate": 1.0},
+        {"id": "s2", "filepath": "/data/folder/video_2.mp4", "metadata.frame_rate": 1.0},
+        {"id": "s3", "filepath": "/data/folder/video_3.mp4", "metadata.frame_rate": None},
+        {"id": "s4", "filepath": "/data/folder/video_4.mp4", "metadata.frame_rate": 1.0},
+    ]
+    df_labels = pd.DataFrame(
+        {
+            "filename": ["video_0.MP4", "video_0.mp4", "video_1.mp4", "video_2.mp4", "video_3.mp4"],
+            "label": ["rat", "cat", "weta", "nothing", "rat"],
+            "start": [0.0, 0.0, 1.0, 0.0, 0.0],
+            "end": [1.0, 5.0, 3.0, 2.0, 2.0],
+        }
+    )
+    dataset = make_dataset(samples)
+
+    actions._add_classifications(dataset, df_labels, frame_labels=frame_labels)  # pylint: disable=protected-access
+
+    assert stored_spans(dataset) == {"s0": [(1, 2, "rat")], "s1": [(2, 3, "weta")]}
+    if frame_labels:
+        assert {
+            sample_id: {frame_number: frame.classifications[0].label for frame_number, frame in frames.items()}
+            for sample_id, frames in dataset.stored[label_timeline.FRAMES_FIELD].items()
+        } == {"s0": {1: "rat", 2: "rat"}, "s1": {2: "weta", 3: "weta"}}
+    else:
+        assert label_timeline.FRAMES_FIELD not in dataset.stored
+
+
+def stored_frame_labels(dataset: MagicMock) -> Dict[str, Dict[int, List[str]]]:
+    """Get the labels stored on each frame of each sample of a mocked dataset.
+
+    Args:
+        dataset: Mocked dataset created with make_dataset
+
+    Returns:
+        Labels of each labelled frame of each labelled sample
+    """
+    return {
+        sample_id: {
+            frame_number: [classification.label for classification in frame.classifications]
+            for frame_number, frame in frames.items()
+        }
+        for sample_id, frames in dataset.stored.get(label_timeline.FRAMES_FIELD, {}).items()
+    }
+
+
+@pytest.mark.parametrize(argnames="frame_labels", argvalues=[False, True])
+def test_write_labels(frame_labels: bool) -> None:
+    """Test that duplicate ranges are written once and empty ranges are skipped.
+
+    Args:
+        frame_labels: Also store a classification on each labelled frame
+    """
+    dataset = make_dataset([])
+
+    n_frames = actions._write_labels(  # pylint: disable=protected-access
+        dataset,
+        span_sample_ids=np.array(["s0", "s0", "s0", "s1"]),
+        frame_start=np.array([0, 0, 1, 4]),
+        frame_end=np.array([2, 2, 3, 4]),
+        labels=np.array(["rat", "rat", "weta", "cat"], dtype=object),
+        frame_labels=frame_labels,
+    )
+
+    assert n_frames == 6
+    assert stored_spans(dataset) == {"s0": [(1, 2, "rat"), (2, 3, "weta")]}
+    dataset.select.assert_not_called()
+    if frame_labels:
+        assert stored_frame_labels(dataset) == {"s0": {1: ["rat"], 2: ["rat", "weta"], 3: ["weta"]}}
+    else:
+        assert label_timeline.FRAMES_FIELD not in dataset.stored
+    assert set(dataset.info[label_classes.VERSIONS_INFO_KEY]) == {label_timeline.SPANS_FIELD} | (
+        {label_timeline.FRAMES_FIELD} if frame_labels else set()
+    )
+
+
+def test_write_labels_in_batches() -> None:
+    """Test that labels of a sample written in an earlier batch are kept when it is labelled again."""
+    dataset = make_dataset([])
+    for sample_ids, frame_start, frame_end, labels, earlier_ids in (
+        (["s0", "s1"], [0, 0], [3, 1], ["rat", "cat"], set()),
+        (["s0", "s2"], [2, 0], [4, 1], ["weta", "cat"], {"s0", "s1"}),
+    ):
+        actions._write_labels(  # pylint: disable=protected-access
+            dataset,
+            span_sample_ids=np.array(sample_ids),
+            frame_start=np.array(frame_start),
+            frame_end=np.array(frame_end),
+            labels=np.array(labels, dtype=object),
+            earlier_ids=earlier_ids,
+            frame_labels=True,
+        )
+
+    assert stored_spans(dataset) == {
+        "s0": [(1, 3, "rat"), (3, 4, "weta")],
+        "s1": [(1, 1, "cat")],
+        "s2": [(1, 1, "cat")],
+    }
+    assert stored_frame_labels(dataset) == {
+        "s0": {1: ["rat"], 2: ["rat"], 3: ["rat", "weta"], 4: ["weta"]},
+        "s1": {1: ["cat"]},
+        "s2": {1: ["cat"]},
+    }
+    assert [call.args[0] for call in dataset.select.call_args_list] == [["s0"], ["s0"]]
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_filter_empty_videos_skips_cache_files(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """Test that a cache stored among the videos, and the journal files next to it, are not processed as videos.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video processing
+        tmp_path: Temporary directory fixture
+    """
+    src = tmp_path / "src"
+    src.mkdir()
+    video_paths = [src / "video_0.mp4", src / "video_1.mp4"]
+    for video_path in video_paths:
+        video_path.write_bytes(b"video")
+    cache_path = src / "filter_cache.sqlite"
+    filter_cache.FilterResultCache(cache_path).close()
+    for suffix in filter_cache.SQLITE_SIDECAR_SUFFIXES:
+        cache_path.with_name(f"{cache_path.name}{suffix}").write_bytes(b"journal")
+    mocked_process_videos = MagicMock(side_effect=lambda src_files, **kwargs: [(src_file, 0) for src_file in src_files])
+    monkeypatch.setattr(target=filter_cache, name="process_videos_motion_cached", value=mocked_process_videos)
+
+    actions.filter_empty_videos(src=src, dest=tmp_path / "dest", dry_run=True, cache_path=cache_path)
+
+    assert mocked_process_videos.call_args.args[0] == video_paths
+
+
+def make_annotation_dataset(sample_ids: List[str], fail_once: Sequence[str] = ()) -> MagicMock:
+    """Create a mocked dataset with a mocked annotation backend that records the runs uploaded and loaded.
+
+    Args:
+        sample_ids: IDs of the samples in the dataset
+        fail_once: Annotation keys whose upload creates the run but fails the first time
+
+    Returns:
+        Mocked dataset, with the annotation keys of each upload in its uploaded attribute
+    """
+    dataset = MagicMock()
+    dataset.info = {}
+    dataset.uploaded = []
+    runs = set()
+    failing = set(fail_once)
+
+    def select(selected_ids: List[str], ordered: bool) -> MagicMock:
+        assert ordered
+
+        def annotate(anno_key: str, **kwargs: Any) -> None:
+            assert kwargs["label_field"] == actions.ANNOTATION_LABEL_FIELD
+            assert set(selected_ids) <= set(sample_ids)
+            runs.add(anno_key)
+            dataset.uploaded.append(anno_key)
+            if anno_key in failing:
+                failing.discard(anno_key)
+                raise ConnectionError("CVAT went away")
+
+        view = MagicMock()
+        view.annotate.side_effect = annotate
+        return view
+
+    dataset.values.return_value = list(sample_ids)
+    dataset.select.side_effect = select
+    dataset.list_annotation_runs.side_effect = lambda: sorted(runs)
+    dataset.delete_annotation_run.side_effect = runs.discard
+    return dataset
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_annotate_chunk(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the samples of a chunk are uploaded as their own annotation run.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking the dataset
+    """
+    dataset = make_annotation_dataset(["s0", "s1", "s2"])
+    mocked_load_dataset = MagicMock(return_value=dataset)
+    monkeypatch.setattr(target=fo, name="load_dataset", value=mocked_load_dataset)
+    chunk = annotation_jobs.AnnotationChunk(key="job_chunk0001", sample_ids=["s2", "s0"])
+
+    actions._annotate_chunk(  # pylint: disable=protected-access
+        "videos", {"label_field": actions.ANNOTATION_LABEL_FIELD, "classes": ["rat"]}, chunk
+    )
+
+    mocked_load_dataset.assert_called_once_with("videos")
+    dataset.select.assert_called_once_with(["s2", "s0"], ordered=True)
+    assert dataset.uploaded == ["job_chunk0001"]
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_create_annotation_job_resumes(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a chunk that failed to upload is uploaded again, after removing its incomplete run.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking the dataset
+    """
+    dataset = make_annotation_dataset([f"s{ind}" for ind in range(5)], fail_once=["job_chunk0001"])
+    monkeypatch.setattr(target=fo, name="load_dataset", value=MagicMock(return_value=dataset))
+
+    actions.create_annotation_job("videos", "job", classes=["rat"], chunk_size=2)
+
+    chunks = annotation_jobs.load_chunks(dataset.info, "job")
+    assert [chunk.sample_ids for chunk in chunks] == [["s0", "s1"], ["s2", "s3"], ["s4"]]
+    assert [chunk.uploaded for chunk in chunks] == [True, False, True]
+
+    actions.create_annotation_job("videos", "job", classes=["rat"])
+
+    dataset.delete_annotation_run.assert_called_once_with("job_chunk0001")
+    assert dataset.uploaded == ["job_chunk0000", "job_chunk0001", "job_chunk0002", "job_chunk0001"]
+    assert all(chunk.uploaded for chunk in annotation_jobs.load_chunks(dataset.info, "job"))
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_read_annotations_resumes(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that only uploaded chunks that were not loaded yet are loaded, and the loaded field is invalidated.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking the dataset
+    """
+    dataset = make_annotation_dataset(["s0", "s1", "s2"])
+    monkeypatch.setattr(target=fo, name="load_dataset", value=MagicMock(return_value=dataset))
+    chunks = annotation_jobs.plan_chunks("job", ["s0", "s1", "s2"], chunk_size=1)
+    for chunk, uploaded, loaded in zip(chunks, [True, True, False], [True, False, False]):
+        chunk.uploaded, chunk.loaded = uploaded, loaded
+    annotation_jobs.store_chunks(dataset.info, "job", chunks)
+
+    actions.read_annotations("videos", "job", cleanup=True)
+
+    dataset.load_annotations.assert_called_once_with("job_chunk0001", cleanup=True)
+    assert [chunk.loaded for chunk in annotation_jobs.load_chunks(dataset.info, "job")] == [True, True, False]
+    assert dataset.info[label_classes.VERSIONS_INFO_KEY][actions.ANNOTATION_LABEL_FIELD] == 1
+
+    actions.read_annotations("videos", "job")
+
+    assert dataset.load_annotations.call_count == 1
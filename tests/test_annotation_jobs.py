@@ -0,0 +1,244 @@
+"""Tests for annotation_jobs module, using a local stand-in for the task API of CVAT."""
+import functools
+import http.server
+import json
+import threading
+import time
+import urllib.request
+from typing import Dict, Iterator, List, Set
+
+import pytest
+
+from wai_data_tools.utils import annotation_jobs
+
+
+class MockCvatServer(http.server.ThreadingHTTPServer):
+    """HTTP server standing in for CVAT, storing uploaded tasks and returning annotations for them.
+
+    Attributes:
+        tasks: Sample IDs of each uploaded task
+        fail_once: Names of tasks that fail the first time they are uploaded
+        delay: Seconds each request takes
+        in_flight: Number of requests currently handled
+        max_in_flight: Largest number of requests handled at the same time
+    """
+
+    def __init__(self, delay: float = 0.0) -> None:
+        """Start listening on a free local port.
+
+        Args:
+            delay: Seconds each request takes
+        """
+        super().__init__(("127.0.0.1", 0), MockCvatHandler)
+        self.tasks: Dict[str, List[str]] = {}
+        self.fail_once: Set[str] = set()
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """URL of the server.
+
+        Returns:
+            Base URL
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class MockCvatHandler(http.server.BaseHTTPRequestHandler):
+    """Handles task uploads with POST /api/tasks/<name> and annotation downloads with GET /api/tasks/<name>."""
+
+    server: MockCvatServer
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        """Silence request logging.
+
+        Args:
+            *args: Ignored
+        """
+
+    def _respond(self, status: int, body: object) -> None:
+        """Send a JSON response.
+
+        Args:
+            status: HTTP status code
+            body: Content to send as JSON
+        """
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _handle(self, method: str) -> None:
+        """Handle a request while keeping track of how many are handled at the same time.
+
+        Args:
+            method: HTTP method of the request
+        """
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            time.sleep(self.server.delay)
+            name = self.path.rsplit("/", maxsplit=1)[-1]
+            if method == "POST":
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with self.server.lock:
+                    if name in self.server.fail_once:
+                        self.server.fail_once.discard(name)
+                        self._respond(500, {"detail": "upload failed"})
+                        return
+                    self.server.tasks[name] = body["sample_ids"]
+                self._respond(201, {"name": name})
+            elif name in self.server.tasks:
+                self._respond(200, {"labels": {sample_id: "rat" for sample_id in self.server.tasks[name]}})
+            else:
+                self._respond(404, {"detail": "no such task"})
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """Upload a task."""
+        self._handle("POST")
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Download the annotations of a task."""
+        self._handle("GET")
+
+
+@pytest.fixture(name="cvat_server")
+def fixture_cvat_server() -> Iterator[MockCvatServer]:
+    """Run a mock CVAT server in a background thread.
+
+    Yields:
+        The running server
+    """
+    server = MockCvatServer(delay=0.2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def upload_chunk(url: str, chunk: annotation_jobs.AnnotationChunk) -> None:
+    """Upload a chunk as a task to the mock server.
+
+    Args:
+        url: URL of the server
+        chunk: Chunk to upload
+    """
+    request = urllib.request.Request(
+        f"{url}/api/tasks/{chunk.key}",
+        data=json.dumps({"sample_ids": chunk.sample_ids}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=10):
+        pass
+
+
+def download_chunk(url: str, chunk: annotation_jobs.AnnotationChunk) -> Dict[str, str]:
+    """Download the annotations of a chunk from the mock server.
+
+    Args:
+        url: URL of the server
+        chunk: Chunk to download
+
+    Returns:
+        Label of each sample in the chunk
+    """
+    with urllib.request.urlopen(f"{url}/api/tasks/{chunk.key}", timeout=10) as response:
+        return json.loads(response.read())["labels"]
+
+
+def test_plan_chunks() -> None:
+    """Test that samples are split into chunks with valid annotation keys."""
+    chunks = annotation_jobs.plan_chunks("job", [str(ind) for ind in range(5)], chunk_size=2)
+
+    assert [chunk.key for chunk in chunks] == ["job_chunk0000", "job_chunk0001", "job_chunk0002"]
+    assert [chunk.sample_ids for chunk in chunks] == [["0", "1"], ["2", "3"], ["4"]]
+    assert all(chunk.key.isidentifier() for chunk in chunks)
+    with pytest.raises(ValueError):
+        annotation_jobs.plan_chunks("job", ["0"], chunk_size=0)
+
+
+def test_store_and_load_chunks() -> None:
+    """Test that chunks stored in dataset info are loaded with their state."""
+    info = {"other": 1}
+    chunks = annotation_jobs.plan_chunks("job", ["a", "b", "c"], chunk_size=2)
+    chunks[0].uploaded = True
+
+    annotation_jobs.store_chunks(info, "job", chunks)
+
+    assert annotation_jobs.load_chunks(info, "job") == chunks
+    assert annotation_jobs.load_chunks(info, "other_job") is None
+    annotation_jobs.store_chunks(info, "job", None)
+    assert annotation_jobs.load_chunks(info, "job") is None
+    assert info["other"] == 1
+
+
+def test_run_chunks_uploads_concurrently(cvat_server: MockCvatServer) -> None:
+    """Test that chunks are uploaded at the same time by several workers.
+
+    Args:
+        cvat_server: Mock CVAT server
+    """
+    chunks = annotation_jobs.plan_chunks("job", [str(ind) for ind in range(8)], chunk_size=2)
+
+    results = list(annotation_jobs.run_chunks(chunks, functools.partial(upload_chunk, cvat_server.url), workers=4))
+
+    assert results == [(chunk, None) for chunk in chunks]
+    assert sorted(cvat_server.tasks) == [chunk.key for chunk in chunks]
+    assert cvat_server.max_in_flight > 1
+
+
+def test_run_chunks_resumes_failed_chunks(cvat_server: MockCvatServer) -> None:
+    """Test that a failed chunk is reported and only that chunk is uploaded when the job is resumed.
+
+    Args:
+        cvat_server: Mock CVAT server
+    """
+    info: dict = {}
+    annotation_jobs.store_chunks(info, "job", annotation_jobs.plan_chunks("job", ["a", "b", "c", "d"], chunk_size=1))
+    cvat_server.fail_once.add("job_chunk0002")
+    task = functools.partial(upload_chunk, cvat_server.url)
+
+    for attempt in range(2):
+        chunks = annotation_jobs.load_chunks(info, "job")
+        pending_chunks = [chunk for chunk in chunks if not chunk.uploaded]
+        for chunk, error in annotation_jobs.run_chunks(pending_chunks, task, workers=2):
+            chunk.uploaded = error is None
+            if attempt == 0 and chunk.key == "job_chunk0002":
+                assert "500" in error
+        annotation_jobs.store_chunks(info, "job", chunks)
+        if attempt == 1:
+            assert [chunk.key for chunk in pending_chunks] == ["job_chunk0002"]
+
+    assert all(chunk.uploaded for chunk in annotation_jobs.load_chunks(info, "job"))
+    assert cvat_server.tasks["job_chunk0002"] == ["c"]
+
+
+def test_run_chunks_loads_annotations_in_current_process(cvat_server: MockCvatServer) -> None:
+    """Test that annotations of uploaded chunks can be loaded back with a single worker.
+
+    Args:
+        cvat_server: Mock CVAT server
+    """
+    chunks = annotation_jobs.plan_chunks("job", ["a", "b", "c"], chunk_size=2)
+    list(annotation_jobs.run_chunks(chunks[:1], functools.partial(upload_chunk, cvat_server.url)))
+    labels: Dict[str, str] = {}
+
+    results = list(
+        annotation_jobs.run_chunks(chunks, lambda chunk: labels.update(download_chunk(cvat_server.url, chunk)))
+    )
+
+    assert results[0] == (chunks[0], None)
+    assert "404" in results[1][1]
+    assert labels == {"a": "rat", "b": "rat"}
@@ -0,0 +1,114 @@
+"""Tests for annotation_sampling module."""
+import pathlib
+
+import numpy as np
+import pytest
+
+from wai_data_tools.utils import annotation_sampling, video_filtering
+
+
+def test_difference_hash_is_stable_for_similar_frames() -> None:
+    """Test that a slightly changed frame keeps its hash and a different frame does not."""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, size=(60, 80, 3), dtype=np.uint8)
+    noisy_frame = np.clip(frame.astype(int) + rng.integers(-2, 3, size=frame.shape), 0, 255).astype(np.uint8)
+    other_frame = rng.integers(0, 256, size=(60, 80, 3), dtype=np.uint8)
+
+    frame_hash = np.uint64(annotation_sampling.difference_hash(frame))
+    other_hashes = np.array(
+        [annotation_sampling.difference_hash(noisy_frame), annotation_sampling.difference_hash(other_frame)],
+        dtype=np.uint64,
+    )
+    distances = annotation_sampling.hamming_distances(frame_hash, other_hashes)
+
+    assert distances[0] <= annotation_sampling.DEFAULT_MAX_HASH_DISTANCE
+    assert distances[1] > annotation_sampling.DEFAULT_MAX_HASH_DISTANCE
+
+
+def test_hamming_distances() -> None:
+    """Test case for hamming_distances."""
+    values = np.array([0, 1, 0b1011, 2**64 - 1], dtype=np.uint64)
+    assert annotation_sampling.hamming_distances(np.uint64(0), values).tolist() == [0, 1, 3, 64]
+
+
+@pytest.mark.parametrize(
+    argnames="counts,n_samples,expected",
+    argvalues=[
+        ([10, 10, 10], 6, [2, 2, 2]),
+        ([1, 10, 10], 9, [1, 4, 4]),
+        ([1, 2, 3], 10, [1, 2, 3]),
+        ([5, 5], 3, [1, 2]),
+    ],
+)
+def test_stratified_quotas(counts: list, n_samples: int, expected: list) -> None:
+    """Test that samples are divided evenly between strata without exceeding their sizes.
+
+    Args:
+        counts: Number of samples in each stratum
+        n_samples: Number of samples to divide
+        expected: Expected number of samples from each stratum
+    """
+    quotas = annotation_sampling.stratified_quotas(np.array(counts), n_samples)
+    assert sorted(quotas.tolist()) == sorted(expected)
+    assert quotas.sum() == min(n_samples, sum(counts))
+    assert np.all(quotas <= counts)
+
+
+def test_select_samples_is_stratified() -> None:
+    """Test that rare labels get their share of the selection."""
+    labels = ["nothing"] * 90 + ["rat"] * 8 + ["weta"] * 2
+    selection = annotation_sampling.select_samples(labels, [0] * 100, [None] * 100, n_samples=10, seed=0)
+
+    selected_labels = [labels[ind] for ind in selection]
+    assert len(set(selection.tolist())) == 10
+    assert selected_labels.count("weta") == 2
+    assert selected_labels.count("rat") == 4
+    assert selected_labels.count("nothing") == 4
+
+
+def test_select_samples_prefers_motion() -> None:
+    """Test that clips with motion are selected more often than empty clips."""
+    motion_scores = [0] * 50 + [100000] * 50
+    n_with_motion = sum(
+        np.sum(annotation_sampling.select_samples(["rat"] * 100, motion_scores, [None] * 100, 10, seed=seed) >= 50)
+        for seed in range(20)
+    )
+    assert n_with_motion > 0.75 * 20 * 10
+
+
+def test_select_samples_skips_near_duplicates() -> None:
+    """Test that near duplicate keyframes are skipped unless there is nothing else to fill the selection with."""
+    hashes = ["00000000000000ff", "00000000000000fe", "ffffffff00000000", None]
+
+    selection = annotation_sampling.select_samples(["rat"] * 4, [0] * 4, hashes, n_samples=3, seed=0)
+    assert sorted(selection.tolist()) == [0, 2, 3] or sorted(selection.tolist()) == [1, 2, 3]
+
+    selection = annotation_sampling.select_samples(["rat"] * 4, [0] * 4, hashes, n_samples=4, max_hash_distance=-1)
+    assert sorted(selection.tolist()) == [0, 1, 2, 3]
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_process_videos_features(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that features are yielded in order with hashes as hex strings and failing videos as None.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video decoding
+    """
+
+    def video_motion_score(src_file: pathlib.Path, threshold: int, settings=None) -> int:
+        if src_file.name == "broken.mp4":
+            raise RuntimeError("corrupt file")
+        assert threshold == 50 and settings is None
+        return len(src_file.name)
+
+    monkeypatch.setattr(target=video_filtering, name="video_motion_score", value=video_motion_score)
+    monkeypatch.setattr(target=annotation_sampling, name="video_keyframe_hash", value=lambda src_file: 255)
+    src_files = [pathlib.Path("a.mp4"), pathlib.Path("broken.mp4"), pathlib.Path("bb.mp4")]
+
+    results = list(annotation_sampling.process_videos_features(src_files))
+
+    assert results == [
+        (src_files[0], 5, "00000000000000ff"),
+        (src_files[1], None, None),
+        (src_files[2], 6, "00000000000000ff"),
+    ]
@@ -0,0 +1,64 @@
+"""Tests for benchmarks module."""
+import pathlib
+
+import pytest
+
+from wai_data_tools import benchmarks
+from wai_data_tools.utils import video_filtering
+
+
+@pytest.mark.parametrize(argnames="container", argvalues=list(benchmarks.CONTAINERS))
+def test_generate_clip(container: str, tmp_path: pathlib.Path) -> None:
+    """Test that static clips are found empty and clips with moving blobs are not.
+
+    Args:
+        container: File extension of the clip
+        tmp_path: Temporary directory fixture
+    """
+    static_clip = benchmarks.generate_clip(tmp_path / f"static.{container}", 64, 48, n_frames=10, motion=False)
+    motion_clip = benchmarks.generate_clip(tmp_path / f"motion.{container}", 64, 48, n_frames=10)
+
+    assert len(list(video_filtering.iter_video_frames(static_clip))) == 10
+    assert video_filtering.video_process_content(static_clip)
+    assert not video_filtering.video_process_content(motion_clip)
+
+
+def test_build_cases() -> None:
+    """Test that video cases are built for every clip and backend, and the other cases once."""
+    cases = benchmarks.build_cases(
+        resolutions=[(64, 48), (32, 24)], n_frames=[10], containers=["avi"], backends=["opencv"]
+    )
+
+    assert [case.benchmark for case in cases].count("video_process_content") == 4
+    assert [case.benchmark for case in cases].count("edge_impulse_export") == 2
+    assert [case.benchmark for case in cases].count("add_classifications") == 1
+    assert cases[0].name == (
+        "video_process_content[width=64,height=48,n_frames=10,container=avi,motion=False,backend=opencv]"
+    )
+
+
+def test_run_benchmarks(tmp_path: pathlib.Path) -> None:
+    """Test that results are measured, written as JSON and compared, and failing cases are kept with their error.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    cases = benchmarks.build_cases(
+        benchmarks=["video_process_content", "stack_rows_from_dataframe_dictionary"],
+        resolutions=[(64, 48)],
+        n_frames=[10],
+        containers=["avi"],
+        backends=["opencv", "unknown"],
+    )
+    benchmarks.generate_clips(cases, tmp_path / "clips")
+
+    results = list(benchmarks.run_benchmarks(cases, tmp_path / "clips", repeats=2, isolate=False))
+
+    assert [result["error"] is None for result in results] == [True, False, True, False, True]
+    assert [result.get("items") for result in results if result["error"] is None] == [10, 6, 100000]
+    assert all(result["items_per_second"] > 0 and len(result["times"]) == 2 for result in results[::2])
+
+    content = benchmarks.write_results(results, tmp_path / "results.json")
+    assert benchmarks.read_results(tmp_path / "results.json") == content
+    comparison = benchmarks.compare_results(content, content)
+    assert [case["ratio"] for case in comparison] == [1.0, 1.0, 1.0]
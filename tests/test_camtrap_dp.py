@@ -0,0 +1,125 @@
+"""Tests for camtrap_dp module."""
+import json
+import pathlib
+
+import pandas as pd
+import pytest
+
+from wai_data_tools.utils import camtrap_dp
+
+EXAMPLE_PACKAGE = pathlib.Path(__file__).parents[1] / "ww_data_example"
+
+
+def write_package(package_dir: pathlib.Path, n_media: int, observations_per_media: int) -> None:
+    """Write a data package with media that all start at the same time and have several observations.
+
+    Args:
+        package_dir: Folder to write the package to
+        n_media: Number of media
+        observations_per_media: Number of observations of each media, each one second later than the previous
+    """
+    resources = [
+        {"name": name, "path": f"{name}.csv", "profile": "tabular-data-resource"}
+        for name in ("deployments", "media", "observations")
+    ]
+    (package_dir / camtrap_dp.DATAPACKAGE_FILENAME).write_text(json.dumps({"resources": resources}))
+    pd.DataFrame(
+        {
+            "deploymentID": ["d1"],
+            "locationID": ["l1"],
+            "locationName": ["site"],
+            "latitude": [-39.2],
+            "longitude": [174],
+        }
+    ).to_csv(package_dir / "deployments.csv", index=False)
+    pd.DataFrame(
+        {
+            "mediaID": [f"m{ind}" for ind in range(n_media)],
+            "deploymentID": "d1",
+            "timestamp": "2023-12-06T04:00:00+12:00",
+            "filePath": [f"media/video{ind}.avi" for ind in range(n_media)],
+            "fileName": [f"video{ind}.avi" for ind in range(n_media)],
+        }
+    ).to_csv(package_dir / "media.csv", index=False)
+    pd.DataFrame(
+        {
+            "observationID": [f"o{ind}" for ind in range(n_media * observations_per_media)],
+            "mediaID": [f"m{ind % n_media}" for ind in range(n_media * observations_per_media)],
+            "eventStart": [
+                f"2023-12-05T16:00:{ind // n_media:02d}Z" for ind in range(n_media * observations_per_media)
+            ],
+            "eventEnd": [
+                f"2023-12-05T16:00:{ind // n_media + 1:02d}Z" for ind in range(n_media * observations_per_media)
+            ],
+            "observationLevel": "media",
+            "observationType": "animal",
+            "scientificName": "Rattus rattus",
+        }
+    ).to_csv(package_dir / "observations.csv", index=False)
+
+
+def test_read_example_package() -> None:
+    """Test that the example package is joined on media and deployments, skipping event level and blank rows."""
+    df_media = camtrap_dp.read_media(EXAMPLE_PACKAGE)
+
+    assert len(df_media) == 7
+    assert df_media.loc[0, "video_name"] == "20231206043328-MOV000001"
+    assert df_media.loc[0, "locationName"] == "Taranaki_powell_01"
+    assert str(df_media["timestamp"].dt.tz) == "UTC"
+
+    df_observations = pd.concat(list(camtrap_dp.read_observations(EXAMPLE_PACKAGE, df_media, chunk_size=3)))
+
+    assert len(df_observations) == 6
+    assert df_observations["label"].tolist()[:2] == ["Rattus rattus", "Rhaphidophoridae"]
+    assert (df_observations["start"] == 0).all()
+    assert (df_observations["end"] == 6).all()
+
+
+def test_read_observations_in_chunks(tmp_path: pathlib.Path) -> None:
+    """Test that observations are yielded in chunks with times relative to the start of their media.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    write_package(tmp_path, n_media=4, observations_per_media=5)
+    df_media = camtrap_dp.read_media(tmp_path / camtrap_dp.DATAPACKAGE_FILENAME)
+
+    chunks = list(camtrap_dp.read_observations(tmp_path, df_media, chunk_size=6))
+
+    assert [len(chunk) for chunk in chunks] == [6, 6, 6, 2]
+    df_observations = pd.concat(chunks)
+    assert df_observations.groupby("mediaID")["start"].apply(sorted).tolist() == [[0, 1, 2, 3, 4]] * 4
+    assert (df_observations["end"] - df_observations["start"] == 1).all()
+
+
+def test_read_observations_skips_event_level(tmp_path: pathlib.Path) -> None:
+    """Test that an event level observation is skipped even when it lists a media.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    write_package(tmp_path, n_media=2, observations_per_media=1)
+    df_observations = pd.read_csv(tmp_path / "observations.csv")
+    event_row = dict(
+        df_observations.iloc[0], observationID="e0", observationLevel="event", scientificName="Felis catus"
+    )
+    pd.concat([df_observations, pd.DataFrame([event_row])]).to_csv(tmp_path / "observations.csv", index=False)
+    df_media = camtrap_dp.read_media(tmp_path)
+
+    df_result = pd.concat(list(camtrap_dp.read_observations(tmp_path, df_media)))
+
+    assert df_result["observationID"].tolist() == ["o0", "o1"]
+    assert "Felis catus" not in df_result["label"].tolist()
+
+
+def test_resource_paths_requires_tables(tmp_path: pathlib.Path) -> None:
+    """Test that a package without the observations table is rejected.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    (tmp_path / camtrap_dp.DATAPACKAGE_FILENAME).write_text(
+        json.dumps({"resources": [{"name": "media", "path": "media.csv"}, {"name": "deployments", "path": "d.csv"}]})
+    )
+    with pytest.raises(ValueError, match="observations"):
+        camtrap_dp.resource_paths(tmp_path)
@@ -5,7 +5,7 @@ import pytest
 from wai_data_tools.utils import data
 
 
-@pytest.mark.parametrize("n_files, test_split_size, expected_indices", [[10, 0.2, np.array([2, 8])]])
+@pytest.mark.parametrize("n_files, test_split_size, expected_indices", [[10, 0.2, np.array([4, 6])]])
 def test_calc_test_split_indices(n_files: int, test_split_size: int, expected_indices: np.ndarray):
     """Test cases for calc_test_split_indices function.
 
@@ -21,6 +21,34 @@ def test_calc_test_split_indices(n_files: int, test_split_size: int, expected_in
     assert np.allclose(result_indices, expected_indices)
 
 
+def test_calc_test_split_mask_keeps_groups_together() -> None:
+    """Test that files of a group end up in the same split and files without a group are split on their own."""
+    groups = ["cam1"] * 4 + ["cam2"] * 3 + [None, None, "cam3"]
+
+    for seed in range(10):
+        is_test = data.calc_test_split_mask(n_files=10, test_split_size=0.3, seed=seed, groups=groups)
+
+        assert len(set(is_test[:4])) == 1
+        assert len(set(is_test[4:7])) == 1
+        assert 0 < is_test.sum() < 10
+
+
+def test_calc_test_split_mask_stratifies() -> None:
+    """Test that each stratum gets its share of test files and that the split does not touch global random state."""
+    np.random.seed(1)
+    expected_random = np.random.rand()
+    np.random.seed(1)
+
+    is_test = data.calc_test_split_mask(n_files=8, test_split_size=0.5, seed=3, strata=["rat"] * 6 + ["weta"] * 2)
+
+    assert np.random.rand() == expected_random
+    assert is_test[:6].sum() == 3
+    assert is_test[6:].sum() == 1
+    assert np.array_equal(
+        is_test, data.calc_test_split_mask(n_files=8, test_split_size=0.5, seed=3, strata=["rat"] * 6 + ["weta"] * 2)
+    )
+
+
 @pytest.mark.parametrize(
     argnames="t_start, t_end, fps, expected_frames",
     argvalues=[
@@ -48,3 +76,40 @@ def test_calculate_frames_in_timespan(t_start: float, t_end: float, fps: float,
     )
 
     assert np.allclose(result_frames, expected_frames)
+
+
+@pytest.mark.parametrize(
+    argnames="t_start, t_end, fps",
+    argvalues=[
+        (0, 10, 1),
+        (1, 20, 2),
+        (0.25, 10, 1),
+        (0, 9.75, 1),
+        (0.1, 0.7, 30),
+        (1.3, 2.2, 3.731),
+    ],
+)
+def test_calculate_frame_ranges(t_start: float, t_end: float, fps: float) -> None:
+    """Test that calculate_frame_ranges gives the same frames as calculate_frames_in_timespan.
+
+    Args:
+        t_start: start of time interval in seconds
+        t_end: end of time interval in seconds
+        fps: frames per second
+    """
+    frame_start, frame_end = data.calculate_frame_ranges(
+        t_start=np.array([t_start]), t_end=np.array([t_end]), fps=np.array([fps])
+    )
+    expected_frames = data.calculate_frames_in_timespan(t_start=t_start, t_end=t_end, fps=fps)
+
+    assert np.array_equal(np.arange(frame_start[0], frame_end[0]), expected_frames)
+
+
+def test_expand_frame_ranges() -> None:
+    """Test case for expand_frame_ranges."""
+    range_inds, frame_inds = data.expand_frame_ranges(
+        frame_start=np.array([2, 5, 0, 1]), frame_end=np.array([4, 5, 3, 2])
+    )
+
+    assert np.array_equal(range_inds, [0, 0, 2, 2, 2, 3])
+    assert np.array_equal(frame_inds, [2, 3, 0, 1, 2, 1])
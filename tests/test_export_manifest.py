@@ -0,0 +1,127 @@
+"""Tests for export_manifest module."""
+import json
+import pathlib
+
+from wai_data_tools.utils import export_manifest
+
+
+def test_export_manifest(tmp_path: pathlib.Path) -> None:
+    """Test that records are kept between runs, the last record wins and reset starts over.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    manifest = export_manifest.ExportManifest(tmp_path)
+    manifest.record("a", {"source": "1"}, outputs={"n_frames": 3})
+    manifest.record("b", {"source": "1"})
+    manifest.record("a", {"source": "2"}, outputs={"n_frames": 4})
+
+    with (tmp_path / export_manifest.MANIFEST_FILENAME).open(mode="a") as manifest_file:
+        manifest_file.write('{"key": "c", "finger')
+
+    reloaded = export_manifest.ExportManifest(tmp_path)
+    assert reloaded.is_up_to_date("a", {"source": "2"})
+    assert not reloaded.is_up_to_date("a", {"source": "1"})
+    assert reloaded.is_up_to_date("b", {"source": "1"})
+    assert not reloaded.is_up_to_date("c", {"source": "1"})
+    assert reloaded.get("a")["outputs"] == {"n_frames": 4}
+
+    reset = export_manifest.ExportManifest(tmp_path, reset=True)
+    assert reset.get("a") is None
+
+
+def test_fingerprints(tmp_path: pathlib.Path) -> None:
+    """Test that fingerprints change with the content of the media and with the labels.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    filepath = tmp_path / "video.mp4"
+    filepath.write_bytes(b"content")
+    source = export_manifest.source_fingerprint(filepath)
+    filepath.write_bytes(b"new content")
+    assert export_manifest.source_fingerprint(filepath) != source
+
+    labels = export_manifest.labels_fingerprint({1: "rat", 2: "rat"})
+    assert labels == export_manifest.labels_fingerprint({2: "rat", 1: "rat"})
+    assert labels != export_manifest.labels_fingerprint({1: "rat", 2: "weta"})
+
+
+def _write_fiftyone_export(export_dir: pathlib.Path, names) -> None:
+    """Write a minimal FiftyOne video labels export.
+
+    Args:
+        export_dir: Folder to write export to
+        names: Names of samples to write
+    """
+    index = []
+    for name in names:
+        (export_dir / "data" / name).parent.mkdir(parents=True, exist_ok=True)
+        (export_dir / "labels" / name).parent.mkdir(parents=True, exist_ok=True)
+        (export_dir / "data" / f"{name}.mp4").write_text(f"{export_dir.name} {name}")
+        (export_dir / "labels" / f"{name}.json").write_text("{}")
+        index.append({"data": f"data/{name}.mp4", "labels": f"labels/{name}.json"})
+    manifest = {"type": "LabeledVideoDataset", "description": "", "index": index}
+    (export_dir / export_manifest.FIFTYONE_MANIFEST_FILENAME).write_text(json.dumps(manifest))
+
+
+def test_merge_fiftyone_export(tmp_path: pathlib.Path) -> None:
+    """Test that merging a staged export replaces changed samples and keeps the other samples.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    export_location = tmp_path / "export"
+    staging_dir = tmp_path / "staging"
+    _write_fiftyone_export(export_location, ["a", "b"])
+    _write_fiftyone_export(staging_dir, ["b", "c"])
+
+    records = export_manifest.merge_fiftyone_export(staging_dir, export_location)
+
+    assert [record["data"] for record in records] == ["data/b.mp4", "data/c.mp4"]
+    manifest = json.loads((export_location / export_manifest.FIFTYONE_MANIFEST_FILENAME).read_text())
+    assert [record["data"] for record in manifest["index"]] == ["data/a.mp4", "data/b.mp4", "data/c.mp4"]
+    assert (export_location / "data" / "b.mp4").read_text() == "staging b"
+    assert (export_location / "data" / "a.mp4").read_text() == "export a"
+
+
+def test_merge_fiftyone_export_same_names_in_subfolders(tmp_path: pathlib.Path) -> None:
+    """Test that samples with the same name in different folders are kept apart, and replaced records are removed.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    export_location = tmp_path / "export"
+    _write_fiftyone_export(export_location, ["night_1/a", "b"])
+    _write_fiftyone_export(tmp_path / "staging", ["night_2/a", "sub/b"])
+    replaced_records = [{"data": "data/b.mp4", "labels": "labels/b.json"}]
+
+    export_manifest.merge_fiftyone_export(tmp_path / "staging", export_location, replaced_records)
+
+    manifest = json.loads((export_location / export_manifest.FIFTYONE_MANIFEST_FILENAME).read_text())
+    assert [record["data"] for record in manifest["index"]] == [
+        "data/night_1/a.mp4",
+        "data/night_2/a.mp4",
+        "data/sub/b.mp4",
+    ]
+    assert (export_location / "data" / "night_1" / "a.mp4").read_text() == "export night_1/a"
+    assert not (export_location / "data" / "b.mp4").exists()
+    assert not (export_location / "labels" / "b.json").exists()
+
+
+def test_merge_fiftyone_export_into_empty_folder(tmp_path: pathlib.Path) -> None:
+    """Test that merging into a folder without an export creates the export.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    export_location = tmp_path / "export"
+    export_location.mkdir()
+    staging_dir = tmp_path / "staging"
+    _write_fiftyone_export(staging_dir, ["a"])
+
+    export_manifest.merge_fiftyone_export(staging_dir, export_location)
+
+    manifest = json.loads((export_location / export_manifest.FIFTYONE_MANIFEST_FILENAME).read_text())
+    assert manifest["type"] == "LabeledVideoDataset"
+    assert (export_location / "labels" / "a.json").is_file()
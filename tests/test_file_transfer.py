@@ -0,0 +1,119 @@
+"""Tests for file_transfer module."""
+import errno
+import os
+import pathlib
+from unittest.mock import MagicMock
+
+import pytest
+
+from wai_data_tools.utils import file_transfer
+
+
+@pytest.fixture(name="src_file")
+def fixture_src_file(tmp_path: pathlib.Path) -> pathlib.Path:
+    """Source file in a temporary directory.
+
+    Args:
+        tmp_path: Temporary directory fixture
+
+    Returns:
+        Path to source file
+    """
+    src_file = tmp_path / "src" / "video.mp4"
+    src_file.parent.mkdir()
+    src_file.write_bytes(b"video content" * 1000)
+    return src_file
+
+
+@pytest.mark.parametrize(argnames="mode", argvalues=file_transfer.TRANSFER_MODES)
+def test_transfer_file(tmp_path: pathlib.Path, src_file: pathlib.Path, mode: str) -> None:
+    """Test that every transfer mode gives a file with the same content at dest.
+
+    Args:
+        tmp_path: Temporary directory fixture
+        src_file: Source file fixture
+        mode: Transfer mode to test
+    """
+    content = src_file.read_bytes()
+    dest_file = tmp_path / "video.mp4"
+    dest_file.write_bytes(b"old content")
+
+    used_mode = file_transfer.transfer_file(src=src_file, dest=dest_file, mode=mode)
+
+    assert used_mode in (mode, file_transfer.COPY)
+    assert dest_file.read_bytes() == content
+    assert src_file.exists() == (mode != file_transfer.MOVE)
+    if used_mode == file_transfer.SYMLINK:
+        assert dest_file.is_symlink()
+    if used_mode == file_transfer.HARDLINK:
+        assert dest_file.samefile(src_file)
+
+
+@pytest.mark.parametrize(
+    argnames="mode,patched_function",
+    argvalues=[
+        (file_transfer.HARDLINK, "link"),
+        (file_transfer.SYMLINK, "symlink"),
+        (file_transfer.MOVE, "replace"),
+    ],
+)
+@pytest.mark.usefixtures("monkeypatch")
+def test_transfer_file_falls_back_across_filesystems(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, src_file: pathlib.Path, mode: str, patched_function: str
+) -> None:
+    """Test that links and moves fall back to copying when src and dest are on different filesystems.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking os functions
+        tmp_path: Temporary directory fixture
+        src_file: Source file fixture
+        mode: Transfer mode to test
+        patched_function: Name of os function to make fail
+    """
+    content = src_file.read_bytes()
+    dest_file = tmp_path / "video.mp4"
+    mocked_function = MagicMock(side_effect=OSError(errno.EXDEV, "Invalid cross-device link"))
+    monkeypatch.setattr(target=os, name=patched_function, value=mocked_function)
+
+    used_mode = file_transfer.transfer_file(src=src_file, dest=dest_file, mode=mode)
+
+    assert used_mode == (file_transfer.MOVE if mode == file_transfer.MOVE else file_transfer.COPY)
+    assert not dest_file.is_symlink()
+    assert dest_file.read_bytes() == content
+    assert src_file.exists() == (mode != file_transfer.MOVE)
+
+
+def test_transfer_file_same_file(src_file: pathlib.Path) -> None:
+    """Test that transferring a file onto itself leaves it untouched.
+
+    Args:
+        src_file: Source file fixture
+    """
+    content = src_file.read_bytes()
+    file_transfer.transfer_file(src=src_file, dest=src_file, mode=file_transfer.COPY)
+    assert src_file.read_bytes() == content
+
+
+def test_transfer_file_unknown_mode(tmp_path: pathlib.Path, src_file: pathlib.Path) -> None:
+    """Test that an unknown transfer mode raises ValueError.
+
+    Args:
+        tmp_path: Temporary directory fixture
+        src_file: Source file fixture
+    """
+    with pytest.raises(ValueError):
+        file_transfer.transfer_file(src=src_file, dest=tmp_path / "video.mp4", mode="teleport")
+
+
+def test_copy_file_keeps_permissions(tmp_path: pathlib.Path, src_file: pathlib.Path) -> None:
+    """Test that copy_file copies content and permission bits.
+
+    Args:
+        tmp_path: Temporary directory fixture
+        src_file: Source file fixture
+    """
+    src_file.chmod(0o640)
+    dest_file = tmp_path / "video.mp4"
+    file_transfer.copy_file(src=src_file, dest=dest_file)
+    assert dest_file.read_bytes() == src_file.read_bytes()
+    assert dest_file.stat().st_mode & 0o777 == 0o640
@@ -0,0 +1,120 @@
+"""Tests for filter_cache module."""
+import os
+import pathlib
+from unittest.mock import MagicMock
+
+import pytest
+
+from wai_data_tools.utils import filter_cache, video_filtering
+
+
+@pytest.fixture(name="cache")
+def fixture_cache(tmp_path: pathlib.Path):
+    """Cache stored in a temporary directory.
+
+    Args:
+        tmp_path: Temporary directory fixture
+
+    Yields:
+        Opened cache
+    """
+    with filter_cache.FilterResultCache(tmp_path / "cache.sqlite") as cache:
+        yield cache
+
+
+@pytest.mark.parametrize(argnames="size", argvalues=[10, 100, 1000])
+def test_partial_file_hash(tmp_path: pathlib.Path, size: int) -> None:
+    """Test that partial_file_hash changes when the start, the end or the size of the file changes.
+
+    Args:
+        tmp_path: Temporary directory fixture
+        size: Size of the file in bytes
+    """
+    filepath = tmp_path / "video.mp4"
+    filepath.write_bytes(bytes(size))
+    original_hash = filter_cache.partial_file_hash(filepath, chunk_size=16)
+
+    filepath.write_bytes(b"1" + bytes(size - 1))
+    assert filter_cache.partial_file_hash(filepath, chunk_size=16) != original_hash
+
+    filepath.write_bytes(bytes(size - 1) + b"1")
+    assert filter_cache.partial_file_hash(filepath, chunk_size=16) != original_hash
+
+    filepath.write_bytes(bytes(size + 1))
+    assert filter_cache.partial_file_hash(filepath, chunk_size=16) != original_hash
+
+
+def test_cache_invalidation(tmp_path: pathlib.Path, cache: filter_cache.FilterResultCache) -> None:
+    """Test that cached results are only returned for unchanged files with the same detector key.
+
+    Args:
+        tmp_path: Temporary directory fixture
+        cache: Cache fixture
+    """
+    filepath = tmp_path / "video.mp4"
+    filepath.write_bytes(b"content")
+    key = video_filtering.detector_key(threshold=50)
+
+    assert cache.get(filepath, key) is None
+    cache.put(filepath, key, 42)
+    assert cache.get(filepath, key) == 42
+    assert cache.get(filepath, video_filtering.detector_key(threshold=40)) is None
+    assert (
+        cache.get(filepath, video_filtering.detector_key(50, video_filtering.DifferenceSettings(downscale=2))) is None
+    )
+
+    filepath.write_bytes(b"changed content")
+    assert cache.get(filepath, key) is None
+
+
+def test_cache_prune(tmp_path: pathlib.Path, cache: filter_cache.FilterResultCache) -> None:
+    """Test that prune removes entries for missing and changed files and for other detector keys.
+
+    Args:
+        tmp_path: Temporary directory fixture
+        cache: Cache fixture
+    """
+    key = video_filtering.detector_key(threshold=50)
+    other_key = video_filtering.detector_key(threshold=40)
+    unchanged, changed, removed = [tmp_path / f"{name}.mp4" for name in ("unchanged", "changed", "removed")]
+    for filepath in (unchanged, changed, removed):
+        filepath.write_bytes(b"content")
+        cache.put(filepath, key, 0)
+    cache.put(unchanged, other_key, 0)
+
+    changed.write_bytes(b"changed content")
+    os.remove(removed)
+
+    assert cache.prune() == 2
+    assert cache.get(unchanged, other_key) == 0
+    assert cache.prune(detector_key=key) == 1
+    assert cache.get(unchanged, key) == 0
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_process_videos_motion_cached(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, cache: filter_cache.FilterResultCache
+) -> None:
+    """Test that only uncached videos are processed and results keep the order of the files.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video processing
+        tmp_path: Temporary directory fixture
+        cache: Cache fixture
+    """
+    src_files = [tmp_path / f"{ind}.mp4" for ind in range(4)]
+    for src_file in src_files:
+        src_file.write_bytes(src_file.name.encode())
+    cache.put(src_files[1], video_filtering.detector_key(threshold=50), 7)
+
+    mocked_process_videos_motion = MagicMock(
+        return_value=iter([(src_files[0], 0), (src_files[2], None), (src_files[3], 3)])
+    )
+    monkeypatch.setattr(target=video_filtering, name="process_videos_motion", value=mocked_process_videos_motion)
+
+    result = list(filter_cache.process_videos_motion_cached(src_files=src_files, cache=cache))
+
+    assert result == [(src_files[0], 0), (src_files[1], 7), (src_files[2], None), (src_files[3], 3)]
+    assert mocked_process_videos_motion.call_args.args[0] == [src_files[0], src_files[2], src_files[3]]
+    assert cache.get(src_files[3], video_filtering.detector_key(threshold=50)) == 3
+    assert cache.get(src_files[2], video_filtering.detector_key(threshold=50)) is None
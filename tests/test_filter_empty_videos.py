@@ -6,7 +6,7 @@ import cv2
 import numpy as np
 import pytest
 
-from wai_data_tools.utils import video_filtering
+from wai_data_tools.utils import frame_source, video_filtering
 
 
 @pytest.mark.parametrize(
@@ -45,6 +45,60 @@ def test_convert_video_to_frames(monkeypatch):
     assert len(result) == 3
 
 
+@pytest.mark.usefixtures("monkeypatch")
+def test_iter_video_frames(monkeypatch):
+    """Test case for iter_video_frames."""
+    src_file = pathlib.Path("/a/path/to/movie.file")
+    mocked_video_reader_read = MagicMock(
+        side_effect=[
+            (True, np.ones((2, 2))),
+            (True, np.ones((2, 2))),
+            (False, None),
+        ]
+    )
+    monkeypatch.setattr(
+        target=cv2.VideoCapture, name="read", value=mocked_video_reader_read  # pylint: disable=no-member
+    )
+    result = list(video_filtering.iter_video_frames(src_file=src_file))
+    assert len(result) == 2
+
+
+@pytest.mark.parametrize(
+    argnames="frames,expected",
+    argvalues=[
+        ([10 * np.ones(1), 20 * np.ones(1), 30 * np.ones(1)], False),
+        ([10 * np.ones(1), 20 * np.ones(1), 70 * np.ones(1)], True),
+        ([10 * np.ones(1)], False),
+        ([], False),
+    ],
+)
+def test_detect_motion(frames, expected):
+    """Test case for detect_motion."""
+    assert video_filtering.detect_motion(frames=frames) == expected
+
+
+def test_detect_motion_stops_at_first_motion():
+    """Test that detect_motion does not consume frames after the first motion."""
+    frames = iter([10 * np.ones(1), 70 * np.ones(1), 10 * np.ones(1), 70 * np.ones(1)])
+    assert video_filtering.detect_motion(frames=frames)
+    assert len(list(frames)) == 2
+
+
+@pytest.mark.parametrize(
+    argnames="frames,expected",
+    argvalues=[
+        ([10 * np.ones(1), 20 * np.ones(1)], True),
+        ([10 * np.ones(1), 70 * np.ones(1)], False),
+    ],
+)
+@pytest.mark.usefixtures("monkeypatch")
+def test_video_process_content_streaming(monkeypatch, frames, expected):
+    """Test case for video_process_content with streaming decoding."""
+    monkeypatch.setattr(target=frame_source, name="iter_frames", value=MagicMock(return_value=enumerate(frames, 1)))
+    result = video_filtering.video_process_content(pathlib.Path("/path/to/file"))
+    assert result == expected
+
+
 @pytest.mark.parametrize(
     argnames="frames,expected_diff_length",
     argvalues=[
@@ -71,5 +125,208 @@ def test_video_process_content(monkeypatch):
     )
 
     expected = False
-    result = video_filtering.video_process_content(pathlib.Path("/path/to/file"))
+    result = video_filtering.video_process_content(pathlib.Path("/path/to/file"), streaming=False)
+    assert result == expected
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_process_videos_content_keeps_order_and_survives_errors(monkeypatch):
+    """Test that process_videos_content yields results in order and None for videos that fail."""
+    src_files = [pathlib.Path("/path/to/a"), pathlib.Path("/path/to/b"), pathlib.Path("/path/to/c")]
+    monkeypatch.setattr(
+        target=video_filtering,
+        name="video_motion_score",
+        value=MagicMock(side_effect=[0, RuntimeError("corrupt file"), 12]),
+    )
+    result = list(video_filtering.process_videos_content(src_files=src_files))
+    assert result == [(src_files[0], True), (src_files[1], None), (src_files[2], False)]
+
+
+def test_process_videos_content_with_process_pool():
+    """Test that a process pool gives the same results as processing the videos serially."""
+    media_dir = pathlib.Path(__file__).parents[1] / "ww_data_example" / "media"
+    src_files = sorted(media_dir.iterdir())[:3] + [media_dir / "missing.mp4"]
+    serial = list(video_filtering.process_videos_content(src_files=src_files, workers=1))
+    parallel = list(video_filtering.process_videos_content(src_files=src_files, workers=2))
+    assert parallel == serial
+    assert [src_file for src_file, _ in parallel] == src_files
+
+
+@pytest.mark.parametrize(
+    argnames="settings,expected_shape",
+    argvalues=[
+        (video_filtering.DifferenceSettings(), (8, 12, 3)),
+        (video_filtering.DifferenceSettings(grayscale=True), (8, 12)),
+        (video_filtering.DifferenceSettings(downscale=4), (2, 3, 3)),
+        (video_filtering.DifferenceSettings(roi=(2, 4, 6, 2)), (2, 6, 3)),
+        (video_filtering.DifferenceSettings(grayscale=True, downscale=2, roi=(0, 0, 12, 4)), (2, 6)),
+    ],
+)
+def test_prepare_frame(settings, expected_shape):
+    """Test case for prepare_frame."""
+    frame = np.zeros((8, 12, 3), dtype=np.uint8)
+    result = video_filtering.prepare_frame(frame=frame, settings=settings)
+    assert result.shape == expected_shape
+
+
+@pytest.mark.parametrize(
+    argnames="frames",
+    argvalues=[
+        [10 * np.ones(1), 20 * np.ones(1), 70 * np.ones(1), 100 * np.ones(1)],
+        [10 * np.ones(1), 70 * np.ones(1), 120 * np.ones(1), 70 * np.ones(1)],
+        [np.full((4, 4), fill_value=value, dtype=np.uint8) for value in (0, 60, 60, 200)],
+    ],
+)
+def test_score_frame_differences(frames):
+    """Test that score_frame_differences gives the same differences as check_frames_differences."""
+    result = video_filtering.score_frame_differences(frames=np.stack(frames))
+    expected = video_filtering.check_frames_differences(frames=frames)
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize(
+    argnames="n_frames,batch_size,expected_batch_lengths",
+    argvalues=[
+        (0, 2, []),
+        (1, 2, []),
+        (5, 1, [2, 2, 2, 2]),
+        (5, 2, [3, 3]),
+        (6, 2, [3, 3, 2]),
+    ],
+)
+def test_iter_frame_batches(n_frames, batch_size, expected_batch_lengths):
+    """Test case for iter_frame_batches."""
+    frames = [np.full(1, fill_value=ind) for ind in range(n_frames)]
+    batches = list(video_filtering.iter_frame_batches(frames=frames, batch_size=batch_size))
+    assert [len(batch) for batch in batches] == expected_batch_lengths
+    for batch, next_batch in video_filtering.pairwise(batches):
+        if next_batch is not None:
+            assert batch[-1] == next_batch[0]
+
+
+@pytest.mark.parametrize(
+    argnames="settings,expected",
+    argvalues=[
+        (video_filtering.DifferenceSettings(batch_size=3), True),
+        (video_filtering.DifferenceSettings(roi=(0, 0, 4, 2)), False),
+        (video_filtering.DifferenceSettings(grayscale=True, downscale=2, batch_size=2), True),
+    ],
+)
+def test_detect_motion_with_settings(settings, expected):
+    """Test case for detect_motion with different difference settings."""
+    frames = [np.zeros((4, 4, 3), dtype=np.uint8) for _ in range(4)]
+    frames[-1][2:, 2:] = 255
+    assert video_filtering.detect_motion(frames=frames, settings=settings) == expected
+
+
+@pytest.mark.parametrize(
+    argnames="video_fps,frame_stride,sample_fps,expected",
+    argvalues=[
+        (30, 1, None, 1),
+        (30, 5, None, 5),
+        (30, 5, 3, 10),
+        (15, 1, 30, 1),
+        (0, 4, 3, 4),
+    ],
+)
+def test_calculate_frame_stride(video_fps, frame_stride, sample_fps, expected):
+    """Test case for calculate_frame_stride."""
+    result = frame_source.calculate_frame_stride(
+        video_fps=video_fps, frame_stride=frame_stride, sample_fps=sample_fps
+    )
+    assert result == expected
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_iter_video_frames_with_stride(monkeypatch):
+    """Test that iter_video_frames only retrieves every frame_stride-th frame."""
+    frames = [np.full(1, fill_value=ind) for ind in range(7)]
+    frame_iter = iter(frames)
+
+    def read(_self):
+        frame = next(frame_iter, None)
+        return frame is not None, frame
+
+    def grab(_self):
+        return next(frame_iter, None) is not None
+
+    monkeypatch.setattr(target=cv2.VideoCapture, name="read", value=read)  # pylint: disable=no-member
+    monkeypatch.setattr(target=cv2.VideoCapture, name="grab", value=grab)  # pylint: disable=no-member
+    result = list(video_filtering.iter_video_frames(src_file=pathlib.Path("/a/path/to/movie.file"), frame_stride=3))
+    assert [int(frame[0]) for frame in result] == [0, 3, 6]
+
+
+@pytest.mark.parametrize(
+    argnames="reference_empty,sampled_empty,expected",
+    argvalues=[
+        ([False, False, True, True], [False, False, True, True], 1.0),
+        ([False, False, True, True], [False, True, True, False], 0.5),
+        ([False, None, True], [None, False, True], 0.0),
+        ([True, True], [False, True], 1.0),
+    ],
+)
+def test_calculate_recall(reference_empty, sampled_empty, expected):
+    """Test case for calculate_recall."""
+    result = video_filtering.calculate_recall(reference_empty=reference_empty, sampled_empty=sampled_empty)
     assert result == expected
+
+
+@pytest.mark.parametrize(
+    argnames="frames,expected",
+    argvalues=[
+        ([np.zeros((2, 2)), np.zeros((2, 2)), np.zeros((2, 2))], 0),
+        ([np.zeros((2, 2)), np.zeros((2, 2)), np.full((2, 2), fill_value=100)], 4),
+        ([np.zeros((2, 2)), np.array([[100, 0], [0, 0]]), np.full((2, 2), fill_value=100)], 1),
+    ],
+)
+def test_measure_motion(frames, expected):
+    """Test that measure_motion returns the changed pixels between the first frames that differ."""
+    assert video_filtering.measure_motion(frames=frames) == expected
+
+
+def test_detector_key():
+    """Test that detector_key changes with threshold and settings that change the result."""
+    key = video_filtering.detector_key(threshold=50)
+    assert key == video_filtering.detector_key(threshold=50, settings=video_filtering.DifferenceSettings())
+    assert key != video_filtering.detector_key(threshold=51)
+    assert key != video_filtering.detector_key(
+        threshold=50, settings=video_filtering.DifferenceSettings(grayscale=True)
+    )
+    assert key != video_filtering.detector_key(
+        threshold=50, settings=video_filtering.DifferenceSettings(backend="pyav")
+    )
+    assert '"backend"' not in key
+    assert key == video_filtering.detector_key(threshold=50, settings=video_filtering.DifferenceSettings(batch_size=8))
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_video_motion_score_decodes_prepared_frames(monkeypatch):
+    """Test that grayscale and downscale are done by the decode backend when no region of interest is cropped."""
+    frames = [np.zeros((2, 2), dtype=np.uint8), np.full((2, 2), fill_value=100, dtype=np.uint8)]
+    mocked_iter_frames = MagicMock(return_value=enumerate(frames, 1))
+    monkeypatch.setattr(target=frame_source, name="iter_frames", value=mocked_iter_frames)
+    settings = video_filtering.DifferenceSettings(grayscale=True, downscale=4, frame_stride=2, backend="ffmpeg")
+
+    assert video_filtering.video_motion_score(pathlib.Path("/a/movie.file"), settings=settings) == 4
+    assert mocked_iter_frames.call_args.args[1] == frame_source.FrameSourceSettings(
+        backend="ffmpeg", downscale=4, pixel_format="gray", frame_stride=2
+    )
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_iter_numbered_video_frames(monkeypatch):
+    """Test that iter_numbered_video_frames numbers frames from 1 and counts skipped frames."""
+    frame_iter = iter([np.full(1, fill_value=ind) for ind in range(7)])
+
+    def read(_self):
+        frame = next(frame_iter, None)
+        return frame is not None, frame
+
+    def grab(_self):
+        return next(frame_iter, None) is not None
+
+    monkeypatch.setattr(target=cv2.VideoCapture, name="read", value=read)  # pylint: disable=no-member
+    monkeypatch.setattr(target=cv2.VideoCapture, name="grab", value=grab)  # pylint: disable=no-member
+    result = list(video_filtering.iter_numbered_video_frames(src_file=pathlib.Path("/a/movie.file"), frame_stride=2))
+    assert [frame_number for frame_number, _ in result] == [1, 3, 5, 7]
+    assert [int(frame[0]) for _, frame in result] == [0, 2, 4, 6]
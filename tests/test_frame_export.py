@@ -0,0 +1,172 @@
+"""Tests for frame_export module."""
+import pathlib
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import cv2
+import numpy as np
+import pytest
+
+from wai_data_tools.utils import frame_export, frame_source
+
+
+@pytest.mark.parametrize(
+    argnames="label,expected",
+    argvalues=[
+        (None, "nothing"),
+        (SimpleNamespace(label="rat"), "rat"),
+        (SimpleNamespace(classifications=[SimpleNamespace(label="weta"), SimpleNamespace(label="rat")]), "weta"),
+        (SimpleNamespace(classifications=[]), "nothing"),
+    ],
+)
+def test_label_to_name(label, expected: str) -> None:
+    """Test case for label_to_name.
+
+    Args:
+        label: Label to get name of
+        expected: Expected name
+    """
+    assert frame_export.label_to_name(label) == expected
+
+
+def test_frame_filename() -> None:
+    """Test case for frame_filename."""
+    assert frame_export.frame_filename("rat", "MOV0001", 12) == "rat.MOV0001___12.jpg"
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_export_videos(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """Test that export_videos writes labelled frames to split folders and survives failing videos.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video decoding
+        tmp_path: Temporary directory fixture
+    """
+    frames = [np.full((4, 4, 3), fill_value=value, dtype=np.uint8) for value in (0, 100, 200)]
+
+    def iter_frames(src_file: pathlib.Path, settings: frame_source.FrameSourceSettings):
+        if src_file.name == "broken.mp4":
+            raise RuntimeError("corrupt file")
+        assert settings.sample_fps is None
+        return enumerate(frames, start=1)
+
+    monkeypatch.setattr(target=frame_source, name="iter_frames", value=iter_frames)
+    jobs = [
+        frame_export.VideoExportJob(filepath="/a/MOV1.mp4", video_name="MOV1", split="train", frame_labels={2: "rat"}),
+        frame_export.VideoExportJob(filepath="/a/broken.mp4", video_name="broken", split="train", frame_labels={}),
+        frame_export.VideoExportJob(filepath="/a/MOV2.mp4", video_name="MOV2", split="test", frame_labels={}),
+    ]
+
+    results = list(frame_export.export_videos(jobs=jobs, export_location=tmp_path, writer_threads=2))
+
+    assert results == [(jobs[0], 3), (jobs[1], None), (jobs[2], 3)]
+    assert sorted(path.name for path in (tmp_path / "train").iterdir()) == [
+        "nothing.MOV1___1.jpg",
+        "nothing.MOV1___3.jpg",
+        "rat.MOV1___2.jpg",
+    ]
+    assert len(list((tmp_path / "test").iterdir())) == 3
+    image = cv2.imread(str(tmp_path / "train" / "rat.MOV1___2.jpg"))  # pylint: disable=no-member
+    assert np.allclose(image, frames[1], atol=2)
+
+
+def test_bounded_writer_raises_write_errors(tmp_path: pathlib.Path) -> None:
+    """Test that errors from the writer threads are raised when the writer is closed.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    writer = frame_export.BoundedWriter(threads=1)
+    writer.write(tmp_path / "missing_dir" / "image.jpg", np.zeros((2, 2, 3), dtype=np.uint8))
+    with pytest.raises(OSError):
+        writer.close()
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_bounded_writer_limits_pending_writes(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """Test that all queued images are written even when more are queued than there are slots.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking image writing
+        tmp_path: Temporary directory fixture
+    """
+    mocked_imwrite = MagicMock(return_value=True)
+    monkeypatch.setattr(target=cv2, name="imwrite", value=mocked_imwrite)
+    with frame_export.BoundedWriter(threads=2, max_pending=2) as writer:
+        for ind in range(10):
+            writer.write(tmp_path / f"{ind}.jpg", np.zeros((2, 2, 3), dtype=np.uint8))
+    assert mocked_imwrite.call_count == 10
+
+
+def test_remove_exported_frames(tmp_path: pathlib.Path) -> None:
+    """Test that remove_exported_frames removes the frames described by job_outputs and nothing else.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    job = frame_export.VideoExportJob(filepath="/a/MOV1.mp4", video_name="MOV1", split="train", frame_labels={2: "rat"})
+    (tmp_path / "train").mkdir()
+    for filename in ("nothing.MOV1___1.jpg", "rat.MOV1___2.jpg", "nothing.MOV1___3.jpg", "nothing.MOV2___1.jpg"):
+        (tmp_path / "train" / filename).write_bytes(b"")
+
+    frame_export.remove_exported_frames(tmp_path, **frame_export.job_outputs(job, n_frames=3))
+
+    assert [path.name for path in (tmp_path / "train").iterdir()] == ["nothing.MOV2___1.jpg"]
+
+
+@pytest.mark.parametrize(
+    argnames="size,expected_shape",
+    argvalues=[
+        (None, (30, 40, 3)),
+        ((48, 48), (48, 48, 3)),
+        ((20, -1), (15, 20, 3)),
+        ((-1, 15), (15, 20, 3)),
+        ((-1, -1), (30, 40, 3)),
+    ],
+)
+def test_resize_frame(size, expected_shape) -> None:
+    """Test case for resize_frame.
+
+    Args:
+        size: Size to resize to as (width, height)
+        expected_shape: Expected shape of the resized frame
+    """
+    frame = np.zeros((30, 40, 3), dtype=np.uint8)
+    assert frame_export.resize_frame(frame, size).shape == expected_shape
+
+
+def test_frame_export_settings_from_config() -> None:
+    """Test that settings are read from the transformations in a config file."""
+    settings = frame_export.FrameExportSettings.from_config({"transformations": {"fps": 8, "size": [48, 48]}}, 80)
+    assert settings == frame_export.FrameExportSettings(jpeg_quality=80, fps=8, size=(48, 48))
+    assert frame_export.FrameExportSettings.from_config({}) == frame_export.FrameExportSettings()
+    assert "backend" not in settings.fingerprint()
+    assert frame_export.FrameExportSettings(backend="pyav").fingerprint()["backend"] == "pyav"
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_export_video_frames_with_settings(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """Test that sampled frames keep their frame numbers and are resized before they are written.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video decoding
+        tmp_path: Temporary directory fixture
+    """
+    frames = [(frame_number, np.zeros((30, 40, 3), dtype=np.uint8)) for frame_number in (1, 4, 7)]
+    mocked_iter_frames = MagicMock(return_value=iter(frames))
+    monkeypatch.setattr(target=frame_source, name="iter_frames", value=mocked_iter_frames)
+    job = frame_export.VideoExportJob(filepath="/a/MOV1.mp4", video_name="MOV1", split="train", frame_labels={4: "rat"})
+    (tmp_path / "train").mkdir()
+
+    settings = frame_export.FrameExportSettings(fps=8, size=(8, 6))
+    last_frame_number = frame_export.export_video_frames(job, tmp_path, settings=settings, writer_threads=1)
+
+    assert last_frame_number == 7
+    assert mocked_iter_frames.call_args.args[1] == frame_source.FrameSourceSettings(size=(8, 6), sample_fps=8)
+    assert sorted(path.name for path in (tmp_path / "train").iterdir()) == [
+        "nothing.MOV1___1.jpg",
+        "nothing.MOV1___7.jpg",
+        "rat.MOV1___4.jpg",
+    ]
+    image = cv2.imread(str(tmp_path / "train" / "rat.MOV1___4.jpg"))  # pylint: disable=no-member
+    assert image.shape == (6, 8, 3)
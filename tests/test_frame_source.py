@@ -0,0 +1,126 @@
+"""Tests for frame_source module."""
+import pathlib
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from wai_data_tools.utils import frame_source
+
+
+@pytest.fixture(name="video_path")
+def fixture_video_path(tmp_path: pathlib.Path) -> pathlib.Path:
+    """Write a short MJPEG video where each frame is brighter than the one before.
+
+    Args:
+        tmp_path: Temporary directory fixture
+
+    Returns:
+        Path to the video
+    """
+    video_path = tmp_path / "movie.avi"
+    fourcc = cv2.VideoWriter_fourcc(*"MJPG")  # pylint: disable=no-member
+    writer = cv2.VideoWriter(str(video_path), fourcc, 10, (32, 24))  # pylint: disable=no-member
+    for value in range(0, 250, 25):
+        writer.write(np.full((24, 32, 3), fill_value=value, dtype=np.uint8))
+    writer.release()
+    return video_path
+
+
+@pytest.mark.parametrize(
+    argnames="size,downscale,expected",
+    argvalues=[
+        (None, 1, (40, 30)),
+        (None, 4, (10, 7)),
+        ((8, 6), 4, (8, 6)),
+        ((-1, 15), 1, (20, 15)),
+        ((20, -1), 1, (20, 15)),
+        ((-1, -1), 1, (40, 30)),
+    ],
+)
+def test_target_size(size, downscale, expected):
+    """Test case for target_size."""
+    assert frame_source.target_size(40, 30, size=size, downscale=downscale) == expected
+
+
+@pytest.mark.parametrize(argnames="backend", argvalues=list(frame_source.BACKENDS))
+def test_iter_frames(backend: str, video_path: pathlib.Path) -> None:
+    """Test that every backend samples, scales and converts frames the same way.
+
+    Args:
+        backend: Name of decode backend
+        video_path: Video fixture
+    """
+    if backend not in frame_source.available_backends():
+        pytest.skip(f"decode backend {backend} is not available")
+    settings = frame_source.FrameSourceSettings(backend=backend, size=(16, -1), pixel_format="gray", frame_stride=3)
+
+    result = list(frame_source.iter_frames(video_path, settings))
+
+    assert [frame_number for frame_number, _ in result] == [1, 4, 7, 10]
+    assert all(frame.shape == (12, 16) and frame.dtype == np.uint8 for _, frame in result)
+    assert np.allclose([frame.mean() for _, frame in result], [0, 75, 150, 225], atol=8)
+
+
+def test_iter_frames_opencv_pixel_formats(video_path: pathlib.Path) -> None:
+    """Test that OpenCV frames are converted to the requested pixel format and sampled at a frame rate.
+
+    Args:
+        video_path: Video fixture
+    """
+    settings = frame_source.FrameSourceSettings(pixel_format="rgb24", sample_fps=2, downscale=2)
+
+    result = list(frame_source.iter_frames(video_path, settings))
+
+    assert [frame_number for frame_number, _ in result] == [1, 6]
+    assert result[1][1].shape == (12, 16, 3)
+
+
+def test_iter_frames_unknown_backend(video_path: pathlib.Path) -> None:
+    """Test that an unknown backend or pixel format raises an error.
+
+    Args:
+        video_path: Video fixture
+    """
+    with pytest.raises(ValueError):
+        frame_source.iter_frames(video_path, frame_source.FrameSourceSettings(backend="gstreamer"))
+    with pytest.raises(ValueError):
+        frame_source.iter_frames(video_path, frame_source.FrameSourceSettings(pixel_format="yuv420p"))
+
+
+@pytest.mark.parametrize(
+    argnames="version,expected",
+    argvalues=[("4.4.2-0ubuntu0.22.04.1", "-vsync"), ("5.1.2", "-fps_mode"), ("N-112345-gabcdef", "-fps_mode")],
+)
+def test_ffmpeg_frames_command(version: str, expected: str, tmp_path: pathlib.Path) -> None:
+    """Test that frames are sampled and scaled by ffmpeg filters, with the frame rate option the version has.
+
+    Args:
+        version: Version printed by ffmpeg
+        expected: Option passing frames through without duplicating or dropping them
+        tmp_path: Temporary directory fixture
+    """
+    ffmpeg_path = tmp_path / "ffmpeg"
+    ffmpeg_path.write_text(f"#!/bin/sh\necho 'ffmpeg version {version} Copyright (c) the FFmpeg developers'\n")
+    ffmpeg_path.chmod(0o755)
+    settings = frame_source.FrameSourceSettings(backend=frame_source.FFMPEG_BACKEND, ffmpeg=str(ffmpeg_path))
+
+    command = frame_source.ffmpeg_frames_command(pathlib.Path("movie.avi"), settings, 3, (16, 12))
+
+    assert command[command.index("-vf") + 1] == "select=not(mod(n\\,3)),scale=16:12:flags=area"
+    assert command[command.index(expected) + 1] == "passthrough"
+    assert command[-5:] == ["-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_iter_frames_ffmpeg_fails(tmp_path: pathlib.Path) -> None:
+    """Test that the ffmpeg backend raises an error for a file that is not a video.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    src_file = tmp_path / "movie.avi"
+    src_file.write_bytes(b"not a video")
+    with pytest.raises(RuntimeError):
+        list(frame_source.iter_frames(src_file, frame_source.FrameSourceSettings(backend=frame_source.FFMPEG_BACKEND)))
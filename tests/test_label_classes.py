@@ -0,0 +1,115 @@
+"""Tests for label_classes module."""
+import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from wai_data_tools.utils import label_classes
+
+
+class Classifications:  # pylint: disable=too-few-public-methods
+    """Stand-in for the FiftyOne Classifications label type."""
+
+
+def make_dataset(document_type: type, labels: list) -> MagicMock:
+    """Create a mocked dataset with a frame level label field.
+
+    Args:
+        document_type: Type of labels in the field
+        labels: Label names returned by the distinct aggregation
+
+    Returns:
+        Mocked dataset
+    """
+    dataset = MagicMock()
+    dataset.info = {}
+    dataset.count.return_value = 3
+    dataset.get_field.return_value = SimpleNamespace(document_type=document_type)
+    dataset.distinct.return_value = labels
+    dataset.max.return_value = datetime.datetime(2024, 1, 1)
+    return dataset
+
+
+@pytest.mark.parametrize(
+    argnames="document_type,expected",
+    argvalues=[
+        (Classifications, "frames.ground_truth.classifications.label"),
+        (SimpleNamespace, "frames.ground_truth.label"),
+    ],
+)
+def test_label_path(document_type: type, expected: str) -> None:
+    """Test that the path to the label names depends on the label type.
+
+    Args:
+        document_type: Type of labels in the field
+        expected: Expected path
+    """
+    dataset = make_dataset(document_type, [])
+    assert label_classes.label_path(dataset, "frames.ground_truth") == expected
+
+
+def test_discover_classes_uses_cache_until_labels_change() -> None:
+    """Test that classes are aggregated once and aggregated again after the label field version is bumped."""
+    dataset = make_dataset(Classifications, ["weta", None, "rat"])
+
+    assert label_classes.discover_classes(dataset) == ["rat", "weta"]
+    dataset.distinct.assert_called_once_with("frames.ground_truth.classifications.label")
+
+    dataset.distinct.return_value = ["cat"]
+    assert label_classes.discover_classes(dataset) == ["rat", "weta"]
+    assert dataset.distinct.call_count == 1
+
+    label_classes.bump_label_field_version(dataset, "frames.ground_truth")
+    assert label_classes.discover_classes(dataset) == ["cat"]
+    assert dataset.distinct.call_count == 2
+
+
+def test_discover_classes_sees_other_writers() -> None:
+    """Test that classes are aggregated again when samples were modified without bumping the label field version."""
+    dataset = make_dataset(Classifications, ["rat"])
+
+    assert label_classes.discover_classes(dataset) == ["rat"]
+    dataset.max.assert_called_with("frames.last_modified_at")
+
+    dataset.distinct.return_value = ["cat"]
+    dataset.max.return_value = datetime.datetime(2024, 1, 2)
+    assert label_classes.discover_classes(dataset) == ["cat"]
+    assert dataset.distinct.call_count == 2
+
+
+def test_label_field_version_without_modification_times() -> None:
+    """Test that the version only counts writes and samples when FiftyOne does not track modification times."""
+    dataset = make_dataset(Classifications, [])
+    dataset.get_field.side_effect = lambda path: None if path.endswith("last_modified_at") else SimpleNamespace()
+
+    assert label_classes.label_field_version(dataset, "ground_truth_spans") == {"labels": 0, "samples": 3}
+    dataset.max.assert_not_called()
+
+
+def test_discover_classes_without_cache() -> None:
+    """Test that views are aggregated every time without touching the cache."""
+    view = make_dataset(Classifications, ["rat"])
+
+    assert label_classes.discover_classes(view, use_cache=False) == ["rat"]
+    assert label_classes.discover_classes(view, use_cache=False) == ["rat"]
+    assert view.distinct.call_count == 2
+    assert not view.info
+    view.save.assert_not_called()
+
+
+def test_discover_classes_missing_field() -> None:
+    """Test that a missing label field has no classes."""
+    dataset = make_dataset(Classifications, ["rat"])
+    dataset.get_field.return_value = None
+    assert not label_classes.discover_classes(dataset)
+
+
+def test_first_frame_labels() -> None:
+    """Test that samples without labelled frames get the default label."""
+    dataset = make_dataset(Classifications, [])
+    dataset.values.return_value = ["rat", None]
+    assert label_classes.first_frame_labels(dataset) == ["rat", "nothing"]
+
+    dataset.get_field.return_value = None
+    assert label_classes.first_frame_labels(dataset) == ["nothing"] * 3
@@ -0,0 +1,92 @@
+"""Tests for label_timeline module."""
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from wai_data_tools.utils import label_timeline
+
+
+@pytest.fixture(name="timeline")
+def fixture_timeline() -> label_timeline.LabelTimeline:
+    """Timeline with overlapping spans in one sample, given out of order.
+
+    Returns:
+        Label timeline
+    """
+    return label_timeline.LabelTimeline(
+        sample_ids=["b", "a", "a", "b"],
+        first_frames=[1, 20, 5, 30],
+        last_frames=[10, 30, 25, 31],
+        labels=["rat", "rat", "weta", "weta"],
+    )
+
+
+def test_labels_at(timeline: label_timeline.LabelTimeline) -> None:
+    """Test that all labels of a frame are found, ordered on the start of their spans.
+
+    Args:
+        timeline: Timeline fixture
+    """
+    assert timeline.labels_at("a", 22) == ["weta", "rat"]
+    assert timeline.labels_at("a", 25) == ["weta", "rat"]
+    assert timeline.labels_at("a", 26) == ["rat"]
+    assert timeline.labels_at("a", 4) == []
+    assert timeline.labels_at("missing", 1) == []
+    assert timeline.label_of_frames("a", [4, 5, 22, 30, 31], default="nothing").tolist() == [
+        "nothing",
+        "weta",
+        "weta",
+        "rat",
+        "nothing",
+    ]
+
+
+def test_frames_with_label(timeline: label_timeline.LabelTimeline) -> None:
+    """Test that spans and frames with a label are found across samples.
+
+    Args:
+        timeline: Timeline fixture
+    """
+    sample_ids, first_frames, last_frames = timeline.spans_with_label("weta")
+    assert list(zip(sample_ids, first_frames, last_frames)) == [("a", 5, 25), ("b", 30, 31)]
+
+    frames = timeline.frames_with_label("rat")
+    assert sorted(frames) == ["a", "b"]
+    np.testing.assert_array_equal(frames["a"], np.arange(20, 31))
+    np.testing.assert_array_equal(frames["b"], np.arange(1, 11))
+    assert timeline.frames_with_label("kiwi") == {}
+
+
+def test_expand(timeline: label_timeline.LabelTimeline) -> None:
+    """Test that spans are expanded to the label of each labelled frame, from the span starting first.
+
+    Args:
+        timeline: Timeline fixture
+    """
+    frame_labels = timeline.expand("a")
+
+    assert sorted(frame_labels) == list(range(5, 31))
+    assert frame_labels[5] == frame_labels[25] == "weta"
+    assert frame_labels[26] == "rat"
+    assert timeline.expand("missing") == {}
+
+
+def test_from_collection_and_first_labels() -> None:
+    """Test that a timeline is built from stored spans with one projection and first labels come from spans."""
+    collection = MagicMock()
+    collection.get_field.return_value = object()
+    collection.values.return_value = (
+        ["a", "b", "c"],
+        [[[5, 25], [20, 30]], None, [[1, 2]]],
+        [["weta", "rat"], None, ["rat"]],
+    )
+
+    timeline = label_timeline.LabelTimeline.from_collection(collection)
+
+    assert len(timeline) == 3
+    assert timeline.labels_at("c", 2) == ["rat"]
+
+    collection.values.return_value = [["weta", "rat"], None, ["rat"]]
+    assert label_timeline.first_labels(collection) == ["weta", "nothing", "rat"]
+    collection.values.assert_called_with(f"{label_timeline.SPANS_FIELD}.detections.label")
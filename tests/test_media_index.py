@@ -0,0 +1,108 @@
+"""Tests for media_index module."""
+import os
+import pathlib
+from typing import List
+
+import pytest
+
+from wai_data_tools.utils import media_index, transcoding
+
+METADATA = {
+    "size_bytes": 5,
+    "mime_type": "video/mp4",
+    "frame_width": 640,
+    "frame_height": 480,
+    "frame_rate": 8.0,
+    "total_frame_count": 80,
+    "duration": 10.0,
+    "encoding_str": "avc1",
+}
+
+
+@pytest.fixture(name="index")
+def fixture_index(tmp_path: pathlib.Path):
+    """Index stored in a temporary directory.
+
+    Args:
+        tmp_path: Temporary directory fixture
+
+    Yields:
+        Opened index
+    """
+    with media_index.MediaIndex(tmp_path / "index" / "media.sqlite") as index:
+        yield index
+
+
+def test_index_invalidation(tmp_path: pathlib.Path, index: media_index.MediaIndex) -> None:
+    """Test that metadata is only returned for unchanged files and stale entries are pruned.
+
+    Args:
+        tmp_path: Temporary directory fixture
+        index: Index fixture
+    """
+    filepath = tmp_path / "video.mp4"
+    filepath.write_bytes(b"video")
+
+    assert index.get(filepath) is None
+    index.put(filepath, METADATA)
+    assert index.get(filepath) == METADATA
+    assert index.get(tmp_path / "missing.mp4") is None
+
+    os.utime(filepath, ns=(1, 1))
+    assert index.get(filepath) is None
+    assert index.prune() == 1
+    filepath.unlink()
+    assert index.prune() == 0
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_probe_videos_reuses_index(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, index: media_index.MediaIndex
+) -> None:
+    """Test that only unindexed videos are probed, failures are not indexed and a second run probes nothing.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video probing
+        tmp_path: Temporary directory fixture
+        index: Index fixture
+    """
+    probed: List[str] = []
+
+    def mock_video_metadata(filepath: pathlib.Path) -> dict:
+        probed.append(filepath.name)
+        if filepath.name == "broken.mp4":
+            raise RuntimeError("Could not open video")
+        return dict(METADATA, frame_rate=float(len(filepath.stem)))
+
+    monkeypatch.setattr(target=transcoding, name="video_metadata", value=mock_video_metadata)
+    filepaths = [tmp_path / name for name in ("a.mp4", "broken.mp4", "ccc.mp4")]
+    for filepath in filepaths:
+        filepath.write_bytes(b"video")
+    index.put(filepaths[0], dict(METADATA, frame_rate=25.0))
+
+    results = list(media_index.probe_videos(filepaths, index=index, workers=2))
+
+    assert [filepath for filepath, _ in results] == filepaths
+    assert [None if metadata is None else metadata["frame_rate"] for _, metadata in results] == [25.0, None, 3.0]
+    assert sorted(probed) == ["broken.mp4", "ccc.mp4"]
+
+    probed.clear()
+    list(media_index.probe_videos([filepaths[0], filepaths[2]], index=index))
+    assert not probed
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_is_up_to_date_with_metadata(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """Test that known metadata of an output is used instead of probing it.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video probing
+        tmp_path: Temporary directory fixture
+    """
+    monkeypatch.setattr(target=transcoding, name="probe_video", value=lambda filepath: pytest.fail("probed"))
+    video_path = tmp_path / "a.mp4"
+    video_path.write_bytes(b"video")
+    job = transcoding.TranscodeJob(video_path, video_path, fps=8, size=(-1, 480))
+
+    assert transcoding.is_up_to_date(job, METADATA)
+    assert not transcoding.is_up_to_date(job, dict(METADATA, encoding_str="FMP4"))
@@ -0,0 +1,55 @@
+"""Tests for process_pool module."""
+import os
+import pathlib
+from typing import Optional, Tuple
+
+import pytest
+
+from wai_data_tools.utils import process_pool
+
+
+def _square_or_die(value: int, marker_dir: pathlib.Path) -> Tuple[Optional[int], Optional[str]]:
+    """Square a value, stopping the worker process for negative values.
+
+    Values below -1 always stop the process, while -1 stops it only the first time it is run.
+
+    Args:
+        value: Value to square
+        marker_dir: Folder where a file is written once -1 has stopped a process
+
+    Returns:
+        Tuple with the square of the value and no error
+    """
+    marker_path = marker_dir / "died"
+    if value < -1 or (value == -1 and not marker_path.exists()):
+        marker_path.touch()
+        os._exit(1)  # pylint: disable=protected-access
+    return value**2, None
+
+
+@pytest.mark.parametrize(argnames="workers", argvalues=[1, 2])
+def test_run_tasks(workers: int, tmp_path: pathlib.Path) -> None:
+    """Test that results are yielded in the same order as tasks.
+
+    Args:
+        workers: Number of processes
+        tmp_path: Temporary directory fixture
+    """
+    results = process_pool.run_tasks(_square_or_die, [(value, tmp_path) for value in range(5)], workers=workers)
+
+    assert list(results) == [(0, None), (1, None), (4, None), (9, None), (16, None)]
+
+
+def test_run_tasks_worker_dies(tmp_path: pathlib.Path) -> None:
+    """Test that only the task that stopped its worker fails, after being retried, and the others are resubmitted.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    values = [1, -1, 2, 3, -2, 4, 5, 6]
+
+    results = list(process_pool.run_tasks(_square_or_die, [(value, tmp_path) for value in values], workers=2))
+
+    assert [result for result, _ in results] == [1, 1, 4, 9, None, 16, 25, 36]
+    assert [error is None for _, error in results] == [True, True, True, True, False, True, True, True]
+    assert results[4][1].startswith("BrokenProcessPool")
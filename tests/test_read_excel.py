@@ -1,4 +1,5 @@
 """Tests for read_excel module."""
+import pathlib
 from typing import Dict
 
 import pandas as pd
@@ -35,3 +36,99 @@ def test_stack_rows_from_dataframe_dictionary(dataframe_dict: Dict[str, pd.DataF
     assert sorted(result_dataframe["folder"].unique()) == sorted(list(dataframe_dict.keys()))
     expected_n_rows = sum([len(sheet_df) for sheet_df in dataframe_dict.values()])
     assert len(result_dataframe) == expected_n_rows
+
+
+def test_stack_rows_does_not_modify_sheets() -> None:
+    """Test that the sheet name is a categorical column of the stacked table and not added to the sheets."""
+    dataframe_dict = {
+        "sheet_1": pd.DataFrame({"col_1": [1, 2]}),
+        "empty": pd.DataFrame({"col_1": []}),
+        "sheet_2": pd.DataFrame({"col_1": [3]}),
+    }
+
+    result_dataframe = read_excel.stack_rows_from_dataframe_dictionary(dataframe_dict=dataframe_dict)
+
+    assert all("folder" not in sheet_df.columns for sheet_df in dataframe_dict.values())
+    assert isinstance(result_dataframe["folder"].dtype, pd.CategoricalDtype)
+    assert result_dataframe["folder"].tolist() == ["sheet_1", "sheet_1", "sheet_2"]
+    assert result_dataframe["col_1"].tolist() == [1, 2, 3]
+    assert len(read_excel.stack_rows_from_dataframe_dictionary(dataframe_dict={})) == 0
+
+
+def test_iter_sheet_rows(workbook: pathlib.Path) -> None:
+    """Test that sheets read one at a time are yielded with their sheet name.
+
+    Args:
+        workbook: Workbook fixture
+    """
+    sheets = list(read_excel.iter_sheet_rows(read_excel.read_excel_sheets(workbook)))
+
+    assert [sheet_df["folder"].unique().tolist() for sheet_df in sheets] == [["night_1"], ["night_2"]]
+    assert [len(sheet_df) for sheet_df in sheets] == [2, 1]
+    only_second = list(read_excel.iter_sheet_rows(read_excel.read_excel_sheets(workbook, sheet_names=["night_2"])))
+    assert only_second[0]["filename"].tolist() == ["c.mjpg"]
+
+
+@pytest.fixture(name="workbook")
+def fixture_workbook(tmp_path: pathlib.Path) -> pathlib.Path:
+    """Label workbook with two sheets.
+
+    Args:
+        tmp_path: Temporary directory fixture
+
+    Returns:
+        Path to the workbook
+    """
+    excel_filepath = tmp_path / "labels.xlsx"
+    with pd.ExcelWriter(excel_filepath) as writer:
+        pd.DataFrame(
+            {"filename": ["a.mjpg", "b.mjpg"], "label": ["rat", "nothing"], "start": [1, 0], "end": [2, 0]}
+        ).to_excel(writer, sheet_name="night_1", index=False)
+        pd.DataFrame({"filename": ["c.mjpg"], "label": ["weta"], "start": [0.5], "end": [3.0]}).to_excel(
+            writer, sheet_name="night_2", index=False
+        )
+    return excel_filepath
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_read_label_table_uses_cache(monkeypatch: pytest.MonkeyPatch, workbook: pathlib.Path) -> None:
+    """Test that the stacked table is typed, cached next to the workbook and loaded without parsing the workbook.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for detecting workbook parsing
+        workbook: Workbook fixture
+    """
+    df_labels = read_excel.read_label_table(workbook)
+
+    assert df_labels["folder"].tolist() == ["night_1", "night_1", "night_2"]
+    assert df_labels["start"].dtype == "float64"
+    assert df_labels["label"].dtype == "string"
+    cache_path = read_excel.label_cache_path(workbook, read_excel.workbook_hash(workbook))
+    assert cache_path.is_file()
+
+    monkeypatch.setattr(target=pd, name="read_excel", value=lambda *args, **kwargs: pytest.fail("parsed workbook"))
+    df_cached = read_excel.read_label_table(workbook)
+    pd.testing.assert_frame_equal(df_cached, df_labels)
+    assert df_cached["folder"].dtype == "category"
+    df_subset = read_excel.read_label_table(workbook, sheet_names=["night_2"])
+    assert df_subset["filename"].tolist() == ["c.mjpg"]
+
+
+def test_read_label_table_invalidation(workbook: pathlib.Path) -> None:
+    """Test that a changed workbook is parsed again and the stale cache is removed.
+
+    Args:
+        workbook: Workbook fixture
+    """
+    read_excel.read_label_table(workbook)
+    old_cache_path = read_excel.label_cache_path(workbook, read_excel.workbook_hash(workbook))
+
+    with pd.ExcelWriter(workbook) as writer:
+        pd.DataFrame({"filename": ["d.mjpg"], "label": ["rat"], "start": [0], "end": [1]}).to_excel(
+            writer, sheet_name="night_3", index=False
+        )
+
+    assert read_excel.read_label_table(workbook)["filename"].tolist() == ["d.mjpg"]
+    assert not old_cache_path.exists()
+    assert len(list(workbook.parent.glob(".labels.xlsx.*.parquet"))) == 1
+    assert read_excel.read_label_table(workbook, sheet_names=["night_3"], use_cache=False)["label"].tolist() == ["rat"]
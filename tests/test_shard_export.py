@@ -0,0 +1,117 @@
+"""Tests for shard_export module."""
+import json
+import pathlib
+import tarfile
+
+import numpy as np
+import pytest
+
+from wai_data_tools.utils import frame_export, frame_source, shard_export
+
+
+@pytest.fixture(name="jobs")
+def fixture_jobs(monkeypatch: pytest.MonkeyPatch) -> list:
+    """Export jobs for three videos of three frames each, where the second video can not be decoded.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video decoding
+
+    Returns:
+        Export jobs
+    """
+    frames = [np.full((4, 4, 3), fill_value=value, dtype=np.uint8) for value in (0, 100, 200)]
+
+    def iter_frames(src_file: pathlib.Path, settings: frame_source.FrameSourceSettings):
+        if src_file.name == "broken.mp4":
+            raise RuntimeError("corrupt file")
+        assert settings.sample_fps is None
+        return enumerate(frames, start=1)
+
+    monkeypatch.setattr(target=frame_source, name="iter_frames", value=iter_frames)
+    return [
+        frame_export.VideoExportJob(filepath="/a/MOV1.mp4", video_name="MOV1", split="train", frame_labels={2: "rat"}),
+        frame_export.VideoExportJob(filepath="/a/broken.mp4", video_name="broken", split="train", frame_labels={}),
+        frame_export.VideoExportJob(filepath="/a/MOV2.mp4", video_name="MOV2", split="train", frame_labels={}),
+        frame_export.VideoExportJob(filepath="/a/MOV3.mp4", video_name="MOV3", split="test", frame_labels={1: "weta"}),
+    ]
+
+
+def test_export_shards(jobs: list, tmp_path: pathlib.Path) -> None:
+    """Test that export_shards packs frames into full shards per split and leaves out failing videos.
+
+    Args:
+        jobs: Export jobs fixture
+        tmp_path: Temporary directory fixture
+    """
+    index = shard_export.export_shards(jobs, export_location=tmp_path, samples_per_shard=4, writer_threads=2)
+
+    assert index == shard_export.read_index(tmp_path)
+    assert index["classes"] == ["nothing", "rat", "weta"]
+    assert index["splits"] == {
+        "test": [{"path": "test/test-000-000000.tar", "n_samples": 3}],
+        "train": [
+            {"path": "train/train-000-000000.tar", "n_samples": 4},
+            {"path": "train/train-000-000001.tar", "n_samples": 2},
+        ],
+    }
+    assert sorted(path.name for path in (tmp_path / "train").iterdir()) == [
+        "train-000-000000.tar",
+        "train-000-000001.tar",
+    ]
+    with tarfile.open(tmp_path / "train" / "train-000-000000.tar") as tar:
+        assert tar.getnames()[:3] == ["MOV1___1.jpg", "MOV1___1.cls", "MOV1___1.json"]
+
+    samples = list(shard_export.iter_shard(tmp_path / "train" / "train-000-000000.tar"))
+    assert [sample["__key__"] for sample in samples] == ["MOV1___1", "MOV1___2", "MOV1___3", "MOV2___1"]
+    assert json.loads(samples[1]["json"]) == {"label": "rat", "video_name": "MOV1", "frame_number": 2}
+
+    reader = shard_export.ShardReader(tmp_path, split="train")
+    assert len(reader) == 6
+    decoded = list(reader)
+    assert [class_ind for _, class_ind in decoded] == [0, 1, 0, 0, 0, 0]
+    assert np.allclose(decoded[1][0], 100, atol=2)
+
+
+def test_export_shards_replaces_previous_export(jobs: list, tmp_path: pathlib.Path) -> None:
+    """Test that shards of an earlier export are removed when exporting again.
+
+    Args:
+        jobs: Export jobs fixture
+        tmp_path: Temporary directory fixture
+    """
+    shard_export.export_shards(jobs, export_location=tmp_path, samples_per_shard=1)
+    assert len(list((tmp_path / "train").iterdir())) == 6
+
+    shard_export.export_shards(jobs, export_location=tmp_path, samples_per_shard=10)
+
+    assert [path.name for path in (tmp_path / "train").iterdir()] == ["train-000-000000.tar"]
+    assert [path.name for path in (tmp_path / "test").iterdir()] == ["test-000-000000.tar"]
+
+
+def test_shard_reader_shuffles_and_divides_shards(jobs: list, tmp_path: pathlib.Path) -> None:
+    """Test that shuffled readers with different ranks together read every sample once.
+
+    Args:
+        jobs: Export jobs fixture
+        tmp_path: Temporary directory fixture
+    """
+    shard_export.export_shards(jobs, export_location=tmp_path, samples_per_shard=1)
+
+    readers = [
+        shard_export.ShardReader(tmp_path, split="train", shuffle=True, buffer_size=2, seed=0, rank=rank, world_size=2)
+        for rank in range(2)
+    ]
+    keys = [sample["__key__"] for reader in readers for sample in reader.iter_samples()]
+
+    assert [len(reader) for reader in readers] == [3, 3]
+    assert sorted(keys) == ["MOV1___1", "MOV1___2", "MOV1___3", "MOV2___1", "MOV2___2", "MOV2___3"]
+
+
+def test_shard_reader_requires_index(tmp_path: pathlib.Path) -> None:
+    """Test that reading a folder without a shard export raises an error.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    with pytest.raises(FileNotFoundError):
+        shard_export.ShardReader(tmp_path, split="train")
@@ -0,0 +1,67 @@
+"""Tests for tensor_export module."""
+import pathlib
+
+import numpy as np
+import pytest
+
+from wai_data_tools.utils import frame_export, frame_source, tensor_export
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_export_tensors(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """Test that export_tensors writes resized RGB frames with labels, grouped by split, and skips failing videos.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video decoding
+        tmp_path: Temporary directory fixture
+    """
+    frames = [np.zeros((8, 6, 3), dtype=np.uint8) for _ in range(3)]
+    for value, frame in enumerate(frames):
+        frame[..., 0] = 10 * value
+
+    def iter_frames(src_file: pathlib.Path, settings: frame_source.FrameSourceSettings):
+        if src_file.name == "broken.mp4":
+            raise RuntimeError("corrupt file")
+        assert (settings.sample_fps, settings.size, settings.pixel_format) == (4, (3, 4), "rgb24")
+        return enumerate(frames, start=1)
+
+    monkeypatch.setattr(target=frame_source, name="iter_frames", value=iter_frames)
+    jobs = [
+        frame_export.VideoExportJob(filepath="/a/MOV1.mp4", video_name="MOV1", split="train", frame_labels={2: "rat"}),
+        frame_export.VideoExportJob(filepath="/a/MOV2.mp4", video_name="MOV2", split="test", frame_labels={}),
+        frame_export.VideoExportJob(filepath="/a/broken.mp4", video_name="broken", split="train", frame_labels={}),
+        frame_export.VideoExportJob(filepath="/a/MOV3.mp4", video_name="MOV3", split="train", frame_labels={1: "weta"}),
+    ]
+    settings = frame_export.FrameExportSettings(fps=4, size=(3, 4))
+
+    index = tensor_export.export_tensors(jobs, export_location=tmp_path, settings=settings, fingerprint="abc")
+
+    assert index == tensor_export.read_index(tmp_path)
+    assert index["classes"] == ["nothing", "rat", "weta"]
+    assert index["splits"] == {"test": {"start": 0, "stop": 3}, "train": {"start": 3, "stop": 9}}
+    assert np.load(tmp_path / tensor_export.SPLITS_FILENAME).tolist() == [0, 0, 0, 1, 1, 1, 1, 1, 1]
+
+    train_frames, train_labels = tensor_export.load_split(tmp_path, split="train")
+    assert isinstance(train_frames, np.memmap)
+    assert train_frames.shape == (6, 4, 3, 3)
+    assert train_labels.tolist() == [0, 1, 0, 2, 0, 0]
+    assert train_frames[1, :, :, 0].tolist() == [[10] * 3] * 4
+    assert not train_frames[1, :, :, 1:].any()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "frames.npy",
+        "labels.npy",
+        "splits.npy",
+        "tensors.json",
+    ]
+
+
+def test_export_tensors_requires_fixed_size(tmp_path: pathlib.Path) -> None:
+    """Test that exporting tensors without a fixed frame size raises an error.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    with pytest.raises(ValueError):
+        tensor_export.export_tensors(
+            [], export_location=tmp_path, settings=frame_export.FrameExportSettings(size=(-1, 48))
+        )
@@ -0,0 +1,232 @@
+"""Tests for transcoding module."""
+import os
+import pathlib
+import sys
+
+import pytest
+
+from wai_data_tools.utils import transcoding
+
+FAKE_FFMPEG = """#!{python}
+import pathlib, shutil, sys
+args = sys.argv[1:]
+src = pathlib.Path(args[args.index("-i") + 1])
+with open({log!r}, "a") as log_file:
+    log_file.write(src.name + "\\n")
+if "broken" in src.name:
+    sys.stderr.write("Invalid data found when processing input")
+    sys.exit(1)
+shutil.copyfile(src, args[-1])
+"""
+
+
+@pytest.fixture(name="fake_ffmpeg")
+def fixture_fake_ffmpeg(tmp_path: pathlib.Path) -> pathlib.Path:
+    """Create an executable standing in for ffmpeg that copies its input and logs which files it was run on.
+
+    Args:
+        tmp_path: Temporary directory fixture
+
+    Returns:
+        Path to the executable, the log is written next to it as ffmpeg.log
+    """
+    ffmpeg_path = tmp_path / "ffmpeg"
+    ffmpeg_path.write_text(FAKE_FFMPEG.format(python=sys.executable, log=str(tmp_path / "ffmpeg.log")))
+    ffmpeg_path.chmod(0o755)
+    return ffmpeg_path
+
+
+def test_list_videos(tmp_path: pathlib.Path) -> None:
+    """Test that videos in subfolders are found and other, hidden and temporary files are ignored.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    (tmp_path / "sub").mkdir()
+    for filename in ("a.mpeg", "sub/b.mp4", "sub/c.MJPG", "c.txt", "d.jpg", ".e.mp4", "sub/.c.x1y2.tmp.mp4"):
+        (tmp_path / filename).write_bytes(b"")
+    assert transcoding.list_videos(tmp_path) == [
+        tmp_path / "a.mpeg",
+        tmp_path / "sub" / "b.mp4",
+        tmp_path / "sub" / "c.MJPG",
+    ]
+
+
+def test_ffmpeg_command() -> None:
+    """Test that frame rate and size are converted to ffmpeg filters."""
+    job = transcoding.TranscodeJob(pathlib.Path("in.mpeg"), pathlib.Path("out.mp4"), fps=8, size=(-1, 480))
+    command = transcoding.ffmpeg_command(job, pathlib.Path(".out.tmp.mp4"), threads=2)
+
+    assert command[command.index("-vf") + 1] == "fps=8,scale=-2:480"
+    assert command[command.index("-c:v") + 1] == "libx264"
+    assert command[command.index("-threads") + 1] == "2"
+    assert command[-1] == ".out.tmp.mp4"
+    assert "-vsync" in transcoding.ffmpeg_command(transcoding.TranscodeJob(job.src_path, job.dst_path), job.dst_path)
+
+
+@pytest.mark.parametrize(
+    argnames="properties,expected",
+    argvalues=[
+        ((8.0, 640, 480, "avc1"), True),
+        ((8.0, 640, 480, "mp4v"), False),
+        ((30.0, 640, 480, "avc1"), False),
+        ((8.0, 640, 360, "h264"), False),
+        (None, False),
+    ],
+)
+@pytest.mark.usefixtures("monkeypatch")
+def test_is_up_to_date(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, properties, expected: bool) -> None:
+    """Test that an output only counts as done with the target codec, frame rate and size.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video probing
+        tmp_path: Temporary directory fixture
+        properties: Probed frames per second, width, height and codec of the output
+        expected: Expected result
+    """
+    monkeypatch.setattr(target=transcoding, name="probe_video", value=lambda filepath: properties)
+    video_path = tmp_path / "a.mp4"
+    video_path.write_bytes(b"video")
+    job = transcoding.TranscodeJob(video_path, video_path, fps=8, size=(-1, 480))
+    assert transcoding.is_up_to_date(job) == expected
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_is_up_to_date_with_newer_source(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> None:
+    """Test that an output older than its source is transcoded again.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video probing
+        tmp_path: Temporary directory fixture
+    """
+    monkeypatch.setattr(target=transcoding, name="probe_video", value=lambda filepath: (8.0, 640, 480, "avc1"))
+    src_path, dst_path = tmp_path / "a.mpeg", tmp_path / "a.mp4"
+    dst_path.write_bytes(b"old")
+    src_path.write_bytes(b"new")
+    os.utime(dst_path, (1000, 1000))
+    os.utime(src_path, (2000, 2000))
+    job = transcoding.TranscodeJob(src_path, dst_path)
+
+    assert not transcoding.is_up_to_date(job)
+    os.utime(dst_path, (3000, 3000))
+    assert transcoding.is_up_to_date(job)
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_transcode_videos(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, fake_ffmpeg: pathlib.Path) -> None:
+    """Test that videos are transcoded concurrently, failures are reported and finished videos are skipped on rerun.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video probing
+        tmp_path: Temporary directory fixture
+        fake_ffmpeg: Executable standing in for ffmpeg
+    """
+    monkeypatch.setattr(
+        target=transcoding,
+        name="probe_video",
+        value=lambda filepath: (25.0, 4, 4, "avc1") if filepath.read_bytes() != b"" else None,
+    )
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    jobs = []
+    for name in ("a", "broken", "c"):
+        (data_dir / f"{name}.mpeg").write_bytes(name.encode())
+        jobs.append(transcoding.TranscodeJob(data_dir / f"{name}.mpeg", data_dir / f"{name}.mp4"))
+
+    results = list(transcoding.transcode_videos(jobs, workers=2, ffmpeg=str(fake_ffmpeg)))
+
+    assert results == [(jobs[0], transcoding.TRANSCODED), (jobs[1], None), (jobs[2], transcoding.TRANSCODED)]
+    assert sorted(path.name for path in data_dir.iterdir()) == ["a.mp4", "a.mpeg", "broken.mpeg", "c.mp4", "c.mpeg"]
+    assert (data_dir / "c.mp4").read_bytes() == b"c"
+
+    results = list(transcoding.transcode_videos(jobs, workers=2, ffmpeg=str(fake_ffmpeg)))
+
+    assert [status for _, status in results] == [transcoding.SKIPPED, None, transcoding.SKIPPED]
+    log_lines = (tmp_path / "ffmpeg.log").read_text().split()
+    assert sorted(log_lines) == ["a.mpeg", "broken.mpeg", "broken.mpeg", "c.mpeg"]
+
+
+def test_ingest_jobs(tmp_path: pathlib.Path) -> None:
+    """Test that only videos that are not .mp4 are transcoded, and earlier outputs are not ingested as sources.
+
+    Args:
+        tmp_path: Temporary directory fixture
+    """
+    data_dir, output_dir = tmp_path / "data", tmp_path / "out"
+    video_paths = [data_dir / "a.mjpg", data_dir / "a.mp4", data_dir / "c.mp4", data_dir / "sub" / "b.mjpg"]
+
+    jobs = transcoding.ingest_jobs(video_paths, data_dir=data_dir)
+    assert [(job.src_path, job.dst_path) for job in jobs] == [
+        (data_dir / "a.mjpg", data_dir / "a.mp4"),
+        (data_dir / "c.mp4", data_dir / "c.mp4"),
+        (data_dir / "sub" / "b.mjpg", data_dir / "sub" / "b.mp4"),
+    ]
+
+    jobs = transcoding.ingest_jobs(video_paths, data_dir=data_dir, output_dir=output_dir)
+    assert [job.dst_path for job in jobs] == [
+        output_dir / "a.mp4",
+        data_dir / "a.mp4",
+        data_dir / "c.mp4",
+        output_dir / "sub" / "b.mp4",
+    ]
+
+    jobs = transcoding.ingest_jobs([data_dir / "a.avi", data_dir / "a.mjpg"], data_dir=data_dir)
+    assert [job.dst_path for job in jobs] == [data_dir / "a.mp4", data_dir / "a.mjpg.mp4"]
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_ingest_videos(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, fake_ffmpeg: pathlib.Path) -> None:
+    """Test that videos are transcoded to the output folder and have their metadata read, leaving sources untouched.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video probing
+        tmp_path: Temporary directory fixture
+        fake_ffmpeg: Executable standing in for ffmpeg
+    """
+    monkeypatch.setattr(target=transcoding, name="probe_video", value=lambda filepath: None)
+    monkeypatch.setattr(
+        target=transcoding, name="video_metadata", value=lambda filepath: {"size_bytes": filepath.stat().st_size}
+    )
+    data_dir, output_dir = tmp_path / "data", tmp_path / "out"
+    data_dir.mkdir()
+    for filename, content in (("a.mp4", b"aa"), ("b.mjpg", b"bbb"), ("broken.mjpg", b"")):
+        (data_dir / filename).write_bytes(content)
+    jobs = transcoding.ingest_jobs(transcoding.list_videos(data_dir), data_dir=data_dir, output_dir=output_dir)
+
+    results = list(transcoding.ingest_videos(jobs, workers=2, ffmpeg=str(fake_ffmpeg)))
+
+    assert results == [(jobs[0], {"size_bytes": 2}), (jobs[1], {"size_bytes": 3}), (jobs[2], None)]
+    assert sorted(path.name for path in data_dir.iterdir()) == ["a.mp4", "b.mjpg", "broken.mjpg"]
+    assert sorted(path.name for path in output_dir.iterdir()) == ["b.mp4"]
+    assert sorted((tmp_path / "ffmpeg.log").read_text().split()) == ["b.mjpg", "broken.mjpg"]
+
+
+@pytest.mark.usefixtures("monkeypatch")
+def test_ingest_videos_twice(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, fake_ffmpeg: pathlib.Path
+) -> None:
+    """Test that ingesting a folder again without an output folder plans the same videos and transcodes none.
+
+    Args:
+        monkeypatch: MonkeyPatch fixture for mocking video probing
+        tmp_path: Temporary directory fixture
+        fake_ffmpeg: Executable standing in for ffmpeg
+    """
+    monkeypatch.setattr(target=transcoding, name="probe_video", value=lambda filepath: (25.0, 640, 480, "avc1"))
+    monkeypatch.setattr(target=transcoding, name="video_metadata", value=lambda filepath: {})
+    data_dir = tmp_path / "data"
+    (data_dir / "sub").mkdir(parents=True)
+    for filename in ("a.mjpg", "a.avi", "b.mp4", "sub/c.mjpg"):
+        (data_dir / filename).write_bytes(b"x")
+
+    ingested = []
+    for _ in range(2):
+        jobs = transcoding.ingest_jobs(transcoding.list_videos(data_dir), data_dir=data_dir)
+        (data_dir / ".a.x1y2.tmp.mp4").write_bytes(b"")
+        ingested.append(
+            [job.dst_path for job, _ in transcoding.ingest_videos(jobs, workers=1, ffmpeg=str(fake_ffmpeg))]
+        )
+
+    assert ingested[0] == ingested[1]
+    assert len(set(ingested[0])) == len(ingested[0]) == 4
+    assert sorted((tmp_path / "ffmpeg.log").read_text().split()) == ["a.avi", "a.mjpg", "c.mjpg"]